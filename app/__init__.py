@@ -1,12 +1,14 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 
 import click
 import requests
 from elasticsearch import Elasticsearch
 from flask import Flask
 from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
 
+from app.database import SQLAlchemy
 from config import Config
 
 app = Flask(__name__)
@@ -20,17 +22,94 @@ app.elasticsearch = (
     else None
 )
 
-from app import load, models, routes
+from app import feeds, load, models, routes, search
 
 
 @app.cli.command("seed-db", help="Seed the database with initial data.")
-def seed_db():
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Parse the feeds incrementally and load them in batches, so memory "
+    "use is bounded by the batch size instead of the size of the feeds. "
+    "RESTAURANT_DATA_URL and USER_DATA_URL may then also be local file paths.",
+)
+@click.option(
+    "--batch-size",
+    default=1000,
+    show_default=True,
+    help="Number of records loaded at a time with --stream.",
+)
+@click.option(
+    "--sqlite-pragmas",
+    is_flag=True,
+    help="Use journal_mode=WAL and synchronous=OFF while loading into SQLite. "
+    "Much faster, but the database may be corrupted if the load is interrupted.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes transforming records into rows. The database "
+    "inserts are always done by a single process.",
+)
+def seed_db(stream, batch_size, sqlite_pragmas, workers):
     restaurant_data_url = os.getenv("RESTAURANT_DATA_URL")
     users_data_url = os.getenv("USER_DATA_URL")
+    pragmas = load.sqlite_load_pragmas() if sqlite_pragmas else nullcontext()
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+
+    if stream:
+        click.echo("Streaming data to database...")
+        with pragmas, executor or nullcontext():
+            restaurants = feeds.iter_records(restaurant_data_url)
+            for batch in feeds.batched(restaurants, batch_size):
+                load.add_restaurants(batch, executor=executor)
+            users = feeds.iter_records(users_data_url)
+            for batch in feeds.batched(users, batch_size):
+                load.add_users(batch, executor=executor)
+        click.echo("Done.")
+        return
+
     restaurants = requests.get(restaurant_data_url).json()
     users = requests.get(users_data_url).json()
 
     click.echo("Adding data to database...")
-    load.add_restaurants(restaurants)
-    load.add_users(users)
+    with pragmas, executor or nullcontext():
+        load.add_restaurants(restaurants, executor=executor)
+        load.add_users(users, executor=executor)
     click.echo("Done.")
+
+
+@app.cli.command("reindex", help="Index the searchable models in Elasticsearch.")
+@click.option(
+    "--chunk-size",
+    default=500,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of documents sent per bulk request.",
+)
+@click.option(
+    "--threads",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of bulk requests sent in parallel.",
+)
+def reindex(chunk_size, threads):
+    if app.elasticsearch is None:
+        raise click.ClickException("ELASTICSEARCH_URL is not set.")
+    backend = search.BACKENDS["elasticsearch"]
+    counts = backend.reindex(search.searchable_models(), chunk_size, threads)
+    for model, count in counts.items():
+        click.echo(f"Indexed {count} {model.__tablename__} documents.")
+
+
+@app.cli.command(
+    "backfill-totals",
+    help="Rebuild the totals of the orders of each user, and of each "
+    "restaurant per day, from the purchase history.",
+)
+def backfill_totals():
+    users, days = models.PurchaseOrder.rebuild_totals()
+    click.echo(f"Backfilled {users} user totals and {days} daily revenues.")
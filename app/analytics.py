@@ -0,0 +1,373 @@
+"""Top users, restaurants and dishes of the orders within a date range.
+
+Summing every order of a long date range is too slow to answer interactively
+once there are millions of them. Instead, the orders are summed in memory
+per key (user, restaurant or dish) by buckets of `ANALYTICS_BUCKET_DAYS`
+days, cumulated so that the totals of any run of buckets are the difference
+of two arrays.
+
+The buckets within a range give a lower bound of the total of each key, and
+the buckets overlapping it an upper bound. Keys are then refined from the
+best upper bound down, counting the orders of the days at the edges of the
+range with index-backed queries, until no upper bound left can beat the
+`limit` best totals. Ranges with at most `ANALYTICS_SCAN_MAX_ORDERS` orders
+are ranked by the database directly.
+
+The totals are built from the database in the background, from the first
+request if `ANALYTICS_WARM_UP` is set or else from the first query, then kept
+in sync with the commits of this process, see `app.indexes.Index`. Until they
+are built, and while they are rebuilt after writes made without the ORM,
+ranges are ranked by the database.
+"""
+import heapq
+from array import array
+from collections import Counter, namedtuple
+from datetime import datetime
+from itertools import compress
+from operator import add, itemgetter, sub
+
+from flask import current_app
+
+from app import indexes
+from app.models import PurchaseOrder, db
+
+# Maximum number of results of a query.
+MAX_LIMIT = 100
+# Maximum number of keys whose totals are refined by a single query.
+MAX_CHUNK = 512
+
+
+class Ranking:
+    """The cumulated totals of the orders of each key by bucket of days:
+    `cumulative[t][i]` is the total of the key `keys[i]` in the buckets
+    before the `first_bucket + t`th one, counting from the first day of the
+    proleptic Gregorian calendar."""
+
+    def __init__(self, bucket_days):
+        self.bucket_days = bucket_days
+        self.keys = []
+        self.key_ids = {}
+        self.first_bucket = 0
+        self.cumulative = [array("d")]
+        # The totals of each bucket, from `collect` until `cumulate`.
+        self.buckets = {}
+
+    @classmethod
+    def build(cls, bucket_days, orders):
+        """Return the ranking of the `(key, day, total)` of `orders`."""
+        ranking = cls(bucket_days)
+        for key, day, total in orders:
+            ranking.collect(key, day, total)
+        ranking.cumulate()
+        return ranking
+
+    def key_id(self, key):
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = self.key_ids[key] = len(self.keys)
+            self.keys.append(key)
+        return key_id
+
+    def collect(self, key, day, total):
+        key_id = self.key_id(key)
+        totals = self.buckets.get(day // self.bucket_days)
+        if totals is None:
+            totals = self.buckets[day // self.bucket_days] = array("d")
+        if key_id >= len(totals):
+            totals.frombytes(bytes(8 * (len(self.keys) - len(totals))))
+        totals[key_id] += total
+
+    def cumulate(self):
+        """Cumulate the totals of the buckets collected."""
+        size = len(self.keys)
+        cumulative = array("d", bytes(8 * size))
+        self.cumulative = [cumulative]
+        if not self.buckets:
+            return
+        self.first_bucket = min(self.buckets)
+        for bucket in range(self.first_bucket, max(self.buckets) + 1):
+            totals = self.buckets.pop(bucket, None)
+            if totals is None:
+                cumulative = array("d", cumulative)
+            else:
+                totals.frombytes(bytes(8 * (size - len(totals))))
+                cumulative = array("d", map(add, cumulative, totals))
+            self.cumulative.append(cumulative)
+
+    def add(self, key, day, total):
+        key_id = self.key_id(key)
+        if key_id == len(self.cumulative[0]):
+            for cumulative in self.cumulative:
+                cumulative.append(0)
+        bucket = day // self.bucket_days
+        if bucket < self.first_bucket:
+            zeros = array("d", bytes(8 * len(self.keys)))
+            self.cumulative[:0] = [
+                array("d", zeros) for _ in range(self.first_bucket - bucket)
+            ]
+            self.first_bucket = bucket
+        while bucket - self.first_bucket + 1 >= len(self.cumulative):
+            self.cumulative.append(array("d", self.cumulative[-1]))
+        for cumulative in self.cumulative[bucket - self.first_bucket + 1 :]:
+            cumulative[key_id] += total
+
+    def before(self, bucket):
+        """Return the totals of the buckets before `bucket`."""
+        t = min(max(bucket - self.first_bucket, 0), len(self.cumulative) - 1)
+        return self.cumulative[t]
+
+    def bounds(self, start, stop):
+        """Return the lower and upper bounds of the totals of the keys from
+        the day `start` until the day `stop` excluded, and how to get them
+        exactly: the difference of the two totals of `before` returned, plus
+        `sign` times the orders from the day `a` until the day `b` of each
+        `(a, b, sign)` of the windows returned, as few days as possible."""
+        size = self.bucket_days
+        outer_start, inner_start = start // size, -(-start // size)
+        inner_stop, outer_stop = stop // size, -(-stop // size)
+        upper = list(map(sub, self.before(outer_stop), self.before(outer_start)))
+        lower = None
+        if inner_start < inner_stop:
+            lower = list(map(sub, self.before(inner_stop), self.before(inner_start)))
+
+        # The days of the buckets at the edges which are within the range are
+        # added, or the ones which are not subtracted, whichever are fewer.
+        def windows(first, last):
+            windows = [
+                (start, first * size, 1),
+                (first * size, start, -1),
+                (last * size, stop, 1),
+                (stop, last * size, -1),
+            ]
+            return [(a, b, sign) for a, b, sign in windows if a < b]
+
+        first, last = min(
+            (
+                (first, last)
+                for first in {outer_start, inner_start}
+                for last in {inner_stop, outer_stop}
+            ),
+            key=lambda bounds: sum(b - a for a, b, _ in windows(*bounds)),
+        )
+        before = (self.before(last), self.before(first))
+        return lower, upper, before, windows(first, last)
+
+
+COLUMNS = [
+    PurchaseOrder.user_id,
+    PurchaseOrder.restaurant_id,
+    PurchaseOrder.dish_name,
+    PurchaseOrder.transaction_date,
+    PurchaseOrder.transaction_amount,
+]
+# The columns of `COLUMNS` of an order.
+Order = namedtuple("Order", [column.key for column in COLUMNS])
+
+
+class Dimension:
+    """What orders are ranked by: the `columns` identifying their key, and
+    the `value` summed, their amount or 1."""
+
+    def __init__(self, columns, value):
+        self.columns = columns
+        self.value = value
+        positions = [Order._fields.index(column.key) for column in columns]
+        self.get_key = itemgetter(*positions)
+        if value is not None:
+            self.total = itemgetter(Order._fields.index(value.key))
+
+    def key(self, order):
+        """Return the key of `order`, or None if it has none."""
+        key = self.get_key(order)
+        if len(self.columns) > 1 and None in key:
+            return None
+        return key
+
+    @staticmethod
+    def total(_order):
+        return 1
+
+    def aggregate(self):
+        if self.value is None:
+            return db.func.count()
+        return db.func.sum(self.value)
+
+    def query(self, start, stop):
+        """Return the query of the `(key, total)` of the orders from the day
+        `start` until the day `stop` excluded, both optional."""
+        date = PurchaseOrder.transaction_date
+        query = db.session.query(*self.columns, self.aggregate()).filter(
+            *(column.isnot(None) for column in self.columns)
+        )
+        if start is not None:
+            query = query.filter(date >= datetime.fromordinal(start))
+        if stop is not None:
+            query = query.filter(date < datetime.fromordinal(stop))
+        return query.group_by(*self.columns)
+
+    def rows(self, query):
+        if len(self.columns) == 1:
+            return [(key, total) for key, total in query]
+        return [(tuple(key), total) for *key, total in query]
+
+    def scan(self, start, stop, limit):
+        """Rank the keys of the orders from the day `start` until the day
+        `stop` excluded with a single query."""
+        total = self.aggregate()
+        query = self.query(start, stop).order_by(total.desc(), *self.columns)
+        return self.rows(query.limit(limit))
+
+    def edges(self, keys, windows):
+        """Return the totals of `keys` within the `(start, stop, sign)` days
+        of `windows`, times their sign."""
+        if len(self.columns) == 1:
+            in_keys = self.columns[0].in_(keys)
+        else:
+            # Row values bound to parameters don't let SQLite seek an index.
+            in_keys = self.columns[0].in_({key[0] for key in keys})
+            keys = set(keys)
+        totals = Counter()
+        # A query per window, as indexes can only seek a single range of
+        # dates per key.
+        for start, stop, sign in windows:
+            for key, total in self.rows(self.query(start, stop).filter(in_keys)):
+                if key in keys:
+                    totals[key] += sign * total
+        return totals
+
+
+DIMENSIONS = {
+    "users": Dimension([PurchaseOrder.user_id], PurchaseOrder.transaction_amount),
+    "restaurants": Dimension([PurchaseOrder.restaurant_id], None),
+    "dishes": Dimension([PurchaseOrder.restaurant_id, PurchaseOrder.dish_name], None),
+}
+
+
+class Analytics(indexes.Index):
+    """Keeps a `Ranking` per dimension up to date, with the number of orders
+    per day.
+
+    Queries build the rankings in the background, as it takes minutes with
+    millions of orders, and are ranked by the database until they are built,
+    or rebuilt once invalidated by writes made without the ORM.
+    """
+
+    max_age = "ANALYTICS_INDEX_MAX_AGE"
+    background = True
+    fields = {PurchaseOrder: Order._fields}
+
+    def build(self):
+        bucket_days = current_app.config["ANALYTICS_BUCKET_DAYS"]
+        rankings = {name: Ranking(bucket_days) for name in DIMENSIONS}
+        orders_per_day = Counter()
+        dimensions = [(DIMENSIONS[name], rankings[name]) for name in DIMENSIONS]
+        for order in db.session.query(*COLUMNS).yield_per(10000):
+            day = order.transaction_date.toordinal()
+            orders_per_day[day] += 1
+            for dimension, ranking in dimensions:
+                key = dimension.key(order)
+                if key is not None:
+                    ranking.collect(key, day, dimension.total(order))
+        for ranking in rankings.values():
+            ranking.cumulate()
+        return rankings, orders_per_day
+
+    def apply(self, data, model, changes):
+        rankings, orders_per_day = data
+        for document in changes.created.values():
+            order = Order(**document)
+            day = order.transaction_date.toordinal()
+            orders_per_day[day] += 1
+            for name, dimension in DIMENSIONS.items():
+                key = dimension.key(order)
+                if key is not None:
+                    rankings[name].add(key, day, dimension.total(order))
+
+    def update(self, model, changes):
+        # Only the totals of created orders can be added to the rankings.
+        if changes.updated or changes.deleted:
+            self.invalidate(model)
+        else:
+            super().update(model, changes)
+
+    def top(self, name, since, until, limit):
+        """Return the `(key, total)` of the at most `limit` keys of the
+        dimension `name` with the best totals from the date `since` to the
+        date `until`, both included and optional, best first. They are
+        ranked by the database until the rankings are ready."""
+        if not 0 <= limit <= MAX_LIMIT:
+            raise ValueError(f"'limit' must be between 0 and {MAX_LIMIT}.")
+        if since is not None and until is not None and since > until:
+            raise ValueError("'since' cannot be after 'until'.")
+        self.refresh()
+        dimension = DIMENSIONS[name]
+        if not limit:
+            return []
+        with self.lock:
+            if self.is_built():
+                rankings, days = self.data
+                ranking = rankings[name]
+                if not days:
+                    return []
+                start = max(since.toordinal(), min(days)) if since else min(days)
+                stop = min(until.toordinal(), max(days)) + 1 if until else max(days) + 1
+                if start >= stop:
+                    return []
+                orders = sum(
+                    count for day, count in days.items() if start <= day < stop
+                )
+                if orders <= current_app.config["ANALYTICS_SCAN_MAX_ORDERS"]:
+                    bounds = None
+                else:
+                    bounds = ranking.bounds(start, stop)
+                    keys = ranking.keys[: len(bounds[1])]
+            else:
+                start = since.toordinal() if since else None
+                stop = until.toordinal() + 1 if until else None
+                bounds = None
+        if bounds is None:
+            return dimension.scan(start, stop, limit)
+        return self.refine(dimension, keys, bounds, limit)
+
+    @staticmethod
+    def refine(dimension, keys, bounds, limit):
+        """Return the best `limit` keys, computing the totals of the ones
+        whose upper bound may beat the `limit` best lower bounds, from the
+        best upper bound down, until none left may beat the best totals."""
+        lower, upper, (after, before), windows = bounds
+        threshold = heapq.nlargest(limit, lower)[-1] if lower else 0.0
+        may_rank = threshold.__le__ if threshold > 0 else (0.0).__lt__
+        candidates = list(compress(range(len(upper)), map(may_rank, upper)))
+        # Most queries only need the first few candidates, which are found
+        # without sorting all of them.
+        size = 4 * limit
+        ranked = heapq.nlargest(size, candidates, key=upper.__getitem__)
+        # The `limit` best totals found so far, and the results.
+        best, results = [], []
+        offset = 0
+        while offset < len(candidates):
+            if offset == len(ranked):
+                ranked = sorted(candidates, key=upper.__getitem__, reverse=True)
+            chunk = ranked[offset : offset + size]
+            if len(best) == limit and upper[chunk[0]] < best[0]:
+                break
+            totals = dimension.edges([keys[key_id] for key_id in chunk], windows)
+            for key_id in chunk:
+                key = keys[key_id]
+                total = after[key_id] - before[key_id] + totals.get(key, 0)
+                if not total:
+                    continue
+                results.append((key, total))
+                if len(best) < limit:
+                    heapq.heappush(best, total)
+                elif total > best[0]:
+                    heapq.heapreplace(best, total)
+            offset += size
+            size = min(2 * size, MAX_CHUNK)
+        return heapq.nsmallest(
+            limit, results, key=lambda result: (-result[1], result[0])
+        )
+
+
+analytics = Analytics()
+indexes.subscribe(analytics)
@@ -0,0 +1,107 @@
+"""Cache of the ids of the restaurants matching `restaurants` filters.
+
+A few combinations of filter arguments make up most of the traffic, so the
+matching ids are kept in a size-bounded LRU cache keyed on the normalized
+arguments. Entries are dropped as soon as a commit changes the tables the
+filters read, see `app.indexes.Version`, or once they are older than
+`RESULT_CACHE_MAX_AGE` seconds.
+
+Entries hold ids rather than rows, so writes that only change the columns of
+restaurants, like the `cash_balance` updated by every purchase, cannot make
+them stale and do not invalidate them.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from app import database
+from app.hours import minute_of_week
+from app.indexes import Version
+from app.models import Dish, Schedule, ScheduleInterval, db
+
+
+class ResultCache:
+    """An LRU mapping of keys to tuples of ids, holding at most
+    `RESULT_CACHE_SIZE` entries and `RESULT_CACHE_MAX_IDS` ids. Entries
+    computed before the last change of `version` are ignored."""
+
+    def __init__(self, version):
+        self.version = version
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, compute):
+        """Return the ids cached under `key`, computing them with `compute()`
+        if they are missing or stale."""
+        config = current_app.config
+        version, now = self.version.value, time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                ids, entry_version, created_at = entry
+                if (
+                    entry_version == version
+                    and now - created_at <= config["RESULT_CACHE_MAX_AGE"]
+                ):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return ids
+                self._remove(key)
+            self.misses += 1
+
+        with database.primary(db):
+            ids = tuple(compute())
+        if len(ids) > config["RESULT_CACHE_MAX_IDS"]:
+            return ids
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (ids, version, now)
+            self.size += len(ids)
+            while self.entries and (
+                len(self.entries) > config["RESULT_CACHE_SIZE"]
+                or self.size > config["RESULT_CACHE_MAX_IDS"]
+            ):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+        return ids
+
+    def _remove(self, key):
+        ids, _, _ = self.entries.pop(key)
+        self.size -= len(ids)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "ids": self.size,
+        }
+
+
+def restaurants_key(open_at, min_dish_price, max_dish_price, min_dishes, max_dishes):
+    """Return the cache key of the filters of `restaurants`. `open_at` is
+    matched to the minute of the week, so it is bucketed to that minute."""
+    minute = None
+    if open_at is not None:
+        minute = minute_of_week(open_at.weekday(), open_at.time())
+    return (
+        minute,
+        None if min_dish_price is None else float(min_dish_price),
+        None if max_dish_price is None else float(max_dish_price),
+        min_dishes,
+        max_dishes,
+    )
+
+
+restaurants = ResultCache(Version(Schedule, ScheduleInterval, Dish))
@@ -0,0 +1,158 @@
+"""Static cost analysis of GraphQL queries, run before they are executed.
+
+Every field selecting an object costs 1, scalar fields are free. The cost of
+the selections of a connection or list field is multiplied by the number of
+items it may return: its `first`, `last` or `limit` argument, or
+`QUERY_DEFAULT_LIST_SIZE`, the page size of connections given neither. For
+instance
+
+    users(first: 10) { edges { node { purchase { edges { node { id } } } } } }
+
+costs 1 + 10 * (1 + 1 + (1 + 100 * (1 + 1))) = 2,031 with the default list
+size. Queries costing more than `QUERY_MAX_COST`, or nesting fields deeper than
+`QUERY_MAX_DEPTH`, are rejected.
+"""
+from collections import namedtuple
+
+from flask import current_app
+from graphql import GraphQLError
+from graphql.language import ast
+from graphql.type.definition import GraphQLList, get_named_type, get_nullable_type
+from graphql.utils.get_operation_ast import get_operation_ast
+
+Cost = namedtuple("Cost", ["cost", "depth"])
+
+
+def is_connection(type_):
+    named = get_named_type(type_)
+    return named.name.endswith("Connection") and "edges" in getattr(named, "fields", {})
+
+
+class CostAnalysis:
+    def __init__(self, schema, document_ast, variables, default_list_size):
+        self.schema = schema
+        self.variables = variables or {}
+        self.variable_defaults = {}
+        self.default_list_size = default_list_size
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+
+    def operation_cost(self, operation):
+        if operation.operation == "mutation":
+            root_type = self.schema.get_mutation_type()
+        else:
+            root_type = self.schema.get_query_type()
+        self.variable_defaults = {
+            definition.variable.name.value: self.value(definition.default_value)
+            for definition in operation.variable_definitions or []
+            if definition.default_value is not None
+        }
+        return self.selection_cost(root_type, operation.selection_set, 0, ())
+
+    def selection_cost(self, parent_type, selection_set, depth, fragments):
+        """Return the `Cost` of the selections of `parent_type`, nested at
+        `depth`, within the named `fragments`."""
+        cost, max_depth = 0, depth
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                selection_cost = self.field_cost(
+                    parent_type, selection, depth + 1, fragments
+                )
+            else:
+                spread = fragments
+                if isinstance(selection, ast.FragmentSpread):
+                    name = selection.name.value
+                    if name in fragments or name not in self.fragments:
+                        # Cycles and unknown fragments fail validation.
+                        continue
+                    spread = (*fragments, name)
+                    selection = self.fragments[name]
+                type_ = parent_type
+                if selection.type_condition is not None:
+                    type_ = self.schema.get_type(selection.type_condition.name.value)
+                selection_cost = self.selection_cost(
+                    type_, selection.selection_set, depth, spread
+                )
+            cost += selection_cost.cost
+            max_depth = max(max_depth, selection_cost.depth)
+        return Cost(cost, max_depth)
+
+    def field_cost(self, parent_type, field, depth, fragments):
+        name = field.name.value
+        fields = getattr(parent_type, "fields", {})
+        if name.startswith("__") or name not in fields or field.selection_set is None:
+            return Cost(0, depth)
+        field_type = fields[name].type
+        children = self.selection_cost(
+            get_named_type(field_type), field.selection_set, depth, fragments
+        )
+        # The edges of a connection are already counted by the connection.
+        if is_connection(parent_type):
+            size = 1
+        else:
+            size = self.list_size(field, fields[name])
+        return Cost(1 + size * children.cost, children.depth)
+
+    def list_size(self, field, definition):
+        """Return the maximum number of items returned by `field`, of the
+        schema field `definition`: its `first`, `last` or `limit` argument,
+        given or defaulted."""
+        field_type = definition.type
+        if not (
+            is_connection(field_type)
+            or isinstance(get_nullable_type(field_type), GraphQLList)
+        ):
+            return 1
+        arguments = {
+            name: argument.default_value
+            for name, argument in definition.args.items()
+            if name in ("first", "last", "limit")
+        }
+        for argument in field.arguments:
+            if argument.name.value in arguments:
+                arguments[argument.name.value] = self.value(argument.value)
+        sizes = [size for size in arguments.values() if isinstance(size, int)]
+        return max(0, min(sizes)) if sizes else self.default_list_size
+
+    def value(self, value_ast):
+        if isinstance(value_ast, ast.Variable):
+            name = value_ast.name.value
+            if name in self.variables:
+                return self.variables[name]
+            return self.variable_defaults.get(name)
+        if isinstance(value_ast, ast.IntValue):
+            return int(value_ast.value)
+        return None
+
+
+def analyze(schema, document_ast, operation_name=None, variables=None):
+    """Return the `Cost` of the operation of `document_ast`, or None if there
+    is no such operation."""
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None:
+        return None
+    config = current_app.config
+    analysis = CostAnalysis(
+        schema, document_ast, variables, config["QUERY_DEFAULT_LIST_SIZE"]
+    )
+    return analysis.operation_cost(operation)
+
+
+def check(cost):
+    """Return a `GraphQLError` if `cost` exceeds the limits."""
+    config = current_app.config
+    if cost.depth > config["QUERY_MAX_DEPTH"]:
+        return GraphQLError(
+            f"Query depth {cost.depth} exceeds the maximum depth of "
+            f"{config['QUERY_MAX_DEPTH']}."
+        )
+    if cost.cost > config["QUERY_MAX_COST"]:
+        return GraphQLError(
+            f"Query cost {cost.cost} exceeds the maximum cost of "
+            f"{config['QUERY_MAX_COST']}. Pass `first` or `last` to connections "
+            "to limit the number of items they return."
+        )
+    return None
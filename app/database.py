@@ -0,0 +1,267 @@
+"""Engine options of the database, and metrics of its connection pool.
+
+The pool of each worker keeps up to `DATABASE_POOL_SIZE` connections open,
+and opens up to `DATABASE_MAX_OVERFLOW` more under load, so the database must
+accept `workers * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW)` connections.
+The time spent waiting for a connection and holding it, served by `/metrics`,
+tells whether pools are too small or connections are held for too long.
+
+SQLite files are pooled too, which keeps their page cache warm, and every
+new connection is set up with `SQLITE_PRAGMAS`.
+
+GraphQL queries read from the replicas of `DATABASE_REPLICAS`, if any, in
+turns. Replicas which cannot be reached, or lag more than
+`DATABASE_REPLICA_MAX_LAG` seconds behind the primary, are skipped until
+they are checked again, and reads go to the primary when none is left.
+Mutations, the reads following a write in the same request, and the builds
+of the in-process indexes and caches always go to the primary.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import count
+
+import flask_sqlalchemy
+from flask import current_app
+from sqlalchemy import event, exc, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+from app import metrics
+
+wait_seconds = metrics.summary("db.pool.wait_seconds")
+hold_seconds = metrics.summary("db.pool.hold_seconds")
+timeouts = metrics.summary("db.pool.timeouts")
+replica_fallbacks = metrics.summary("db.replica.fallbacks")
+
+# Engines by URL, whose pools are reported by the "db.pools" gauge.
+ENGINES = {}
+
+# The replica engine a session reads from, see `read_only`.
+REPLICA = "database.replica"
+# Set once a session wrote, so that it reads from the primary from then on.
+WROTE = "database.wrote"
+
+
+def engine_options(config, sa_url, options):
+    """Return the `options` of the engine of `sa_url` updated with the pool
+    settings of `config`."""
+    options = dict(options)
+    sqlite = sa_url.get_backend_name() == "sqlite"
+    if options.get("poolclass") is StaticPool:
+        # A single in-memory SQLite connection.
+        return options
+    if not config["DATABASE_POOL_SIZE"]:
+        options["poolclass"] = NullPool
+        return options
+    options.update(
+        pool_size=config["DATABASE_POOL_SIZE"],
+        max_overflow=config["DATABASE_MAX_OVERFLOW"],
+        pool_timeout=config["DATABASE_POOL_TIMEOUT"],
+        pool_recycle=config["DATABASE_POOL_RECYCLE"],
+    )
+    if sqlite:
+        # Connections are used by one thread at a time, but not always the
+        # one which opened them.
+        options["poolclass"] = QueuePool
+        connect_args = options.setdefault("connect_args", {})
+        connect_args["check_same_thread"] = False
+    else:
+        options["pool_pre_ping"] = config["DATABASE_POOL_PRE_PING"]
+    return options
+
+
+@lru_cache(maxsize=None)
+def timed_pool_class(pool_class):
+    """Return a subclass of `pool_class` timing the checkouts of
+    connections."""
+
+    class TimedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                timeouts.observe(1)
+                raise
+            finally:
+                wait_seconds.observe(time.perf_counter() - start)
+
+    TimedPool.__name__ = TimedPool.__qualname__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+
+def pool_status(pool):
+    status = {"class": pool.__class__.__mro__[1].__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    return status
+
+
+def pools_status():
+    return {url: pool_status(engine.pool) for url, engine in sorted(ENGINES.items())}
+
+
+def set_sqlite_pragmas(pragmas, dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in pragmas.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def start_hold(_dbapi_connection, connection_record, _connection_proxy):
+    connection_record.info["checked_out_at"] = time.perf_counter()
+
+
+def end_hold(_dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        hold_seconds.observe(time.perf_counter() - checked_out_at)
+
+
+class Replicas:
+    """Chooses the replica binds to read from in turns, among the ones found
+    healthy by their last check."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turns = count()
+        # `(checked_at, healthy)` of each replica bind.
+        self.checks = {}
+
+    def check(self, engine):
+        """Return whether `engine` is reachable and not lagging behind."""
+        lag_query = current_app.config["DATABASE_REPLICA_LAG_QUERY"]
+        try:
+            with engine.connect() as connection:
+                lag = connection.execute(text(lag_query or "SELECT 0")).scalar()
+        except exc.SQLAlchemyError:
+            current_app.logger.warning("Replica %s is unreachable.", engine.url)
+            return False
+        if lag is not None and lag > current_app.config["DATABASE_REPLICA_MAX_LAG"]:
+            current_app.logger.warning("Replica %s lags %ss behind.", engine.url, lag)
+            return False
+        return True
+
+    def is_healthy(self, db, bind):
+        with self.lock:
+            checked_at, healthy = self.checks.get(bind, (None, False))
+        interval = current_app.config["DATABASE_REPLICA_CHECK_INTERVAL"]
+        if checked_at is None or time.monotonic() - checked_at > interval:
+            healthy = self.check(db.get_engine(bind=bind))
+            with self.lock:
+                self.checks[bind] = (time.monotonic(), healthy)
+        return healthy
+
+    def choose(self, db):
+        """Return the engine of the next healthy replica, or None to read
+        from the primary."""
+        binds = current_app.config["DATABASE_REPLICAS"]
+        if not binds:
+            return None
+        for _ in binds:
+            bind = binds[next(self.turns) % len(binds)]
+            if self.is_healthy(db, bind):
+                return db.get_engine(bind=bind)
+        replica_fallbacks.observe(1)
+        return None
+
+    def status(self):
+        with self.lock:
+            return {bind: healthy for bind, (_, healthy) in self.checks.items()}
+
+
+replicas = Replicas()
+
+
+@contextmanager
+def read_only(db):
+    """Read from a replica with the session of `db`, until it writes."""
+    db.session.info[REPLICA] = replicas.choose(db)
+    try:
+        yield
+    finally:
+        db.session.info.pop(REPLICA, None)
+
+
+@contextmanager
+def primary(db):
+    """Read from the primary with the session of `db`, within `read_only`.
+
+    The in-process indexes and caches outlive the request building them, so
+    they are built from the primary: a lagging replica would have them serve
+    stale rows until their next rebuild.
+    """
+    replica = db.session.info.pop(REPLICA, None)
+    try:
+        yield
+    finally:
+        if replica is not None:
+            db.session.info[REPLICA] = replica
+
+
+def forget_writes(session):
+    """Let `session` read from replicas again, e.g. in a new request."""
+    session.info.pop(WROTE, None)
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+    """A session reading from the replica chosen by `read_only`, if any."""
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = self.info.get(REPLICA)
+        if replica is not None and not (self._flushing or self.info.get(WROTE)):
+            return replica
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, _flush_context):
+    session.info[WROTE] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_writes(orm_execute_state):
+    state = orm_execute_state
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info[WROTE] = True
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """Creates engines with the pool settings of the config of the app,
+    instrumented for `/metrics`, and sessions routing reads to replicas."""
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        return sa_url, engine_options(app.config, sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        pool_class = engine_opts.get("poolclass")
+        if pool_class is None:
+            pool_class = sa_url.get_dialect().get_pool_class(sa_url)
+        engine_opts = {**engine_opts, "poolclass": timed_pool_class(pool_class)}
+        engine = super().create_engine(sa_url, engine_opts)
+        if engine.dialect.name == "sqlite":
+            pragmas = dict(self.get_app().config["SQLITE_PRAGMAS"])
+            event.listen(
+                engine,
+                "connect",
+                lambda *args: set_sqlite_pragmas(pragmas, *args),
+            )
+        event.listen(engine, "checkout", start_hold)
+        event.listen(engine, "checkin", end_hold)
+        ENGINES[engine.url.render_as_string(hide_password=True)] = engine
+        return engine
+
+
+metrics.gauge("db.pools", pools_status)
+metrics.gauge("db.replicas", replicas.status)
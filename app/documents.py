@@ -0,0 +1,183 @@
+"""Caching of the GraphQL documents sent to `/graphql`.
+
+Parsing and validating a query against the schema costs more than executing
+most of the small queries clients send, and clients send the same few
+queries over and over. `CachedBackend` keeps the parsed and validated
+documents of the last `DOCUMENT_CACHE_SIZE` query strings, so repeated
+operations skip lexing, parsing and validation entirely.
+
+Clients can also avoid sending the query string at all with automatic
+persisted queries: a request whose `extensions` hold
+`{"persistedQuery": {"version": 1, "sha256Hash": <hash>}}` runs the query
+with that SHA-256 hash, registered by an earlier request sending both the
+hash and the query.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from flask import current_app
+from graphql import GraphQLCoreBackend, parse, validate
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql_server import HttpQueryError
+
+from app import cost, database, db
+
+
+class LRU:
+    """A thread-safe mapping keeping its most recently used items, as many as
+    the `size_setting` configuration value."""
+
+    def __init__(self, size_setting):
+        self.size_setting = size_setting
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.items.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > current_app.config[self.size_setting]:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class CachedBackend(GraphQLCoreBackend):
+    """A backend parsing and validating each distinct query string once."""
+
+    def __init__(self, executor=None):
+        super().__init__(executor)
+        self.documents = LRU("DOCUMENT_CACHE_SIZE")
+
+    def document_from_string(self, schema, document_string):
+        document = self.documents.get(document_string)
+        if document is None:
+            document_ast = parse(document_string)
+            errors = validate(schema, document_ast)
+            if errors:
+                # Not cached, invalid queries are rarely sent twice.
+                return GraphQLDocument(
+                    schema=schema,
+                    document_string=document_string,
+                    document_ast=document_ast,
+                    execute=lambda *_args, **_kwargs: ExecutionResult(
+                        errors=errors, invalid=True
+                    ),
+                )
+            document = GraphQLDocument(
+                schema=schema,
+                document_string=document_string,
+                document_ast=document_ast,
+                execute=partial(self.execute, schema, document_ast),
+            )
+            self.documents.set(document_string, document)
+        return document
+
+    def execute(self, schema, document_ast, *args, **kwargs):
+        """Execute `document_ast`, reading from a replica if it is a query."""
+        operation = get_operation_ast(document_ast, kwargs.get("operation_name"))
+        if operation is None or operation.operation != "query":
+            return self.execute_operation(schema, document_ast, *args, **kwargs)
+        with database.read_only(db):
+            return self.execute_operation(schema, document_ast, *args, **kwargs)
+
+    def execute_operation(self, schema, document_ast, *args, **kwargs):
+        """Execute `document_ast` unless its cost exceeds the limits."""
+        analysis = cost.analyze(
+            schema,
+            document_ast,
+            kwargs.get("operation_name"),
+            kwargs.get("variable_values"),
+        )
+        if analysis is None:
+            result = execute(
+                schema, document_ast, *args, **self.execute_params, **kwargs
+            )
+            return ExtendedExecutionResult(result)
+
+        error = cost.check(analysis)
+        extensions = {
+            "cost": {
+                "requestedQueryCost": analysis.cost,
+                "maximumAvailable": current_app.config["QUERY_MAX_COST"],
+                "depth": analysis.depth,
+            }
+        }
+        if error is not None:
+            return ExtendedExecutionResult(
+                ExecutionResult(errors=[error], invalid=True), extensions
+            )
+        result = execute(schema, document_ast, *args, **self.execute_params, **kwargs)
+        return ExtendedExecutionResult(result, extensions)
+
+
+class ExtendedExecutionResult(ExecutionResult):
+    """An `ExecutionResult` including its `extensions` in the response."""
+
+    def __init__(self, result, extensions=None):
+        super().__init__(
+            data=result.data,
+            errors=result.errors,
+            invalid=result.invalid,
+            extensions={**result.extensions, **(extensions or {})},
+        )
+
+    def to_dict(self, *args, **kwargs):
+        response = super().to_dict(*args, **kwargs)
+        if self.extensions:
+            response["extensions"] = self.extensions
+        return response
+
+
+backend = CachedBackend()
+persisted_queries = LRU("PERSISTED_QUERIES_SIZE")
+
+
+def resolve_persisted_query(data, query_data):
+    """Return the query of a request, looking it up by the hash of its
+    `persistedQuery` extension if it has one.
+
+    Raise `HttpQueryError` if the hash is unknown, or does not match the
+    query sent along with it.
+    """
+    query = data.get("query") or query_data.get("query")
+    extensions = data.get("extensions") or query_data.get("extensions")
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpQueryError(400, "Extensions are invalid JSON.") from None
+    persisted = (extensions or {}).get("persistedQuery")
+    if not persisted:
+        return query
+
+    query_hash = persisted.get("sha256Hash")
+    if persisted.get("version") != 1 or not isinstance(query_hash, str):
+        raise HttpQueryError(400, "Unsupported persisted query.")
+    if query is None:
+        query = persisted_queries.get(query_hash)
+        if query is None:
+            raise HttpQueryError(400, "PersistedQueryNotFound")
+    elif hashlib.sha256(query.encode()).hexdigest() != query_hash:
+        raise HttpQueryError(400, "Provided sha256Hash does not match query.")
+    else:
+        persisted_queries.set(query_hash, query)
+    return query
@@ -0,0 +1,120 @@
+import codecs
+import json
+from itertools import islice
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """Yield decoded text chunks read from `source`, which may either be an
+    http(s) URL or a path to a local file.
+
+    Only `chunk_size` bytes are held at a time, so the feed is never read
+    into memory as a whole.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    if source.startswith(("http://", "https://")):
+        with requests.get(source, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size):
+                yield decoder.decode(chunk)
+    else:
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_array(chunks):
+    """Incrementally parse a top-level JSON array from an iterable of text
+    `chunks`, yielding one element at a time.
+
+    >>> list(iter_array(['[{"a": 1}, {', '"b": 2}]']))
+    [{'a': 1}, {'b': 2}]
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buf, pos, eof = "", 0, False
+
+    def fill(size):
+        """Read chunks until at least `size` characters are buffered after
+        `pos`. Returns False once the input is exhausted."""
+        nonlocal buf, pos, eof
+        # Drop what has already been parsed so the buffer stays bounded by
+        # the size of a single element.
+        buf, pos = buf[pos:], 0
+        parts = [buf]
+        length = len(buf)
+        while length < size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        buf = "".join(parts)
+        return not eof
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buf) or not fill(1):
+                return buf[pos : pos + 1]
+
+    if skip_whitespace() != "[":
+        raise ValueError("Expected the feed to be a JSON array.")
+    pos += 1
+
+    if skip_whitespace() == "]":
+        return
+
+    while True:
+        # Elements can be split over any number of chunks. When decoding
+        # fails (or may have stopped early, like a number at the very end of
+        # the buffer) read more; doubling the requirement each time keeps the
+        # re-parsing linear even for very large elements.
+        want = len(buf) - pos
+        while True:
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            if end is not None and (end < len(buf) or eof):
+                break
+            want *= 2
+            fill(max(want, CHUNK_SIZE))
+        pos = end
+        yield element
+
+        token = skip_whitespace()
+        if token == "]":
+            return
+        if token != ",":
+            raise ValueError(
+                f"Expected ',' or ']' after an array element, got {token!r}."
+            )
+        pos += 1
+        skip_whitespace()
+
+
+def iter_records(source, chunk_size=CHUNK_SIZE):
+    """Yield the records of the JSON array stored at `source` one by one."""
+    return iter_array(iter_chunks(source, chunk_size))
+
+
+def batched(iterable, size):
+    """Yield lists of at most `size` items from `iterable`.
+
+    >>> list(batched(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -0,0 +1,148 @@
+"""Group commit of purchases.
+
+Committing a transaction waits for the database to sync it to disk, which
+caps the number of purchases a worker can commit per second. With
+`GROUP_COMMIT` enabled, purchases are queued instead, and a background
+thread runs the purchases queued within `GROUP_COMMIT_INTERVAL` seconds, or
+`GROUP_COMMIT_SIZE` of them, in a single transaction. Each caller still gets
+the result of their own purchase.
+
+Purchases waiting for more than `GROUP_COMMIT_TIMEOUT` seconds, e.g. behind
+a stalled transaction, are taken back from the queue and made on their own
+with `PurchaseOrder.create_for`.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from flask import current_app
+
+from app import metrics
+from app.models import PurchaseOrder, Restaurant, User, db
+
+batch_size = metrics.summary("purchases.group_commit.batch_size")
+flush_seconds = metrics.summary("purchases.group_commit.flush_seconds")
+wait_seconds = metrics.summary("purchases.group_commit.wait_seconds")
+timeouts = metrics.summary("purchases.group_commit.timeouts")
+
+
+class GroupCommitter:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, user, dish):
+        """Queue the purchase of `dish` by `user`, wait for the transaction it
+        is part of, and return its order, like `PurchaseOrder.create_for`."""
+        restaurant = dish.restaurant
+        if restaurant is None:
+            raise ValueError("Purchase not allowed: Dish has no restaurant!")
+        order = {
+            "dish_name": dish.name,
+            "transaction_amount": dish.price,
+            "restaurant_name": restaurant.name,
+            "user_id": user.id,
+            "restaurant_id": restaurant.id,
+        }
+        self.start(current_app._get_current_object())
+
+        future, start = Future(), time.perf_counter()
+        self.queue.put((order, future))
+        timeout = current_app.config["GROUP_COMMIT_TIMEOUT"]
+        try:
+            order_id = future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                # Not picked by the flusher thread, which won't run it.
+                timeouts.observe(1)
+                return PurchaseOrder.create_for(user, dish)
+            try:
+                order_id = future.result(timeout)
+            except FutureTimeoutError:
+                raise ValueError(
+                    "Purchase timed out, check the orders before retrying."
+                ) from None
+        finally:
+            wait_seconds.observe(time.perf_counter() - start)
+        return PurchaseOrder.query.get(order_id)
+
+    def start(self, app):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, args=(app,), name="group-commit", daemon=True
+                )
+                self.thread.start()
+
+    def run(self, app):
+        with app.app_context():
+            while True:
+                batch = self.next_batch()
+                start = time.perf_counter()
+                try:
+                    self.flush(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                finally:
+                    db.session.remove()
+                batch_size.observe(len(batch))
+                flush_seconds.observe(time.perf_counter() - start)
+
+    def next_batch(self):
+        """Wait for a purchase, and return it with those queued after it until
+        the batch is full or `GROUP_COMMIT_INTERVAL` seconds passed."""
+        batch = [self.queue.get()]
+        config = current_app.config
+        deadline = time.monotonic() + config["GROUP_COMMIT_INTERVAL"]
+        while len(batch) < config["GROUP_COMMIT_SIZE"]:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def flush(batch):
+        """Run the purchases of `batch` in a single transaction."""
+        credits, accepted = Counter(), []
+        for order, future in batch:
+            if not future.set_running_or_notify_cancel():
+                # Taken back by `submit`.
+                continue
+            try:
+                # A refused debit updates no row, so other purchases of the
+                # transaction are not affected.
+                User.debit({order["user_id"]: order["transaction_amount"]})
+            except ValueError as e:
+                future.set_exception(e)
+                continue
+            credits[order["restaurant_id"]] += order["transaction_amount"]
+            accepted.append((PurchaseOrder(**order), future))
+
+        if not accepted:
+            db.session.rollback()
+            return
+        Restaurant.credit(credits)
+        db.session.add_all(order for order, _ in accepted)
+        db.session.flush()
+        PurchaseOrder.add_to_totals(
+            (o.user_id, o.restaurant_id, o.transaction_amount, o.transaction_date)
+            for o, _ in accepted
+        )
+        ids = [order.id for order, _ in accepted]
+        db.session.commit()
+        for order_id, (_, future) in zip(ids, accepted):
+            future.set_result(order_id)
+
+
+purchases = GroupCommitter()
@@ -0,0 +1,136 @@
+"""Parser for the `openingHours` strings of the restaurant feed, e.g.
+
+    "Mon, Weds 11:45 am - 4:45 pm / Tues 7:45 am - 2 am / Sun 6 am - 9 pm"
+"""
+import re
+from datetime import time
+from functools import lru_cache
+
+WEEKDAYS = {
+    "MON": 0,
+    "TUES": 1,
+    "TUE": 1,
+    "WEDS": 2,
+    "WED": 2,
+    "THU": 3,
+    "THURS": 3,
+    "FRI": 4,
+    "SAT": 5,
+    "SUN": 6,
+}
+
+# One "<weekdays> <opens at> - <closes at>" part of the string, parts are
+# separated by "/".
+PART = re.compile(
+    r"""
+    \s*(?P<days>[^/\d]+?)\s*
+    (?P<opens_hour>\d{1,2})(?::(?P<opens_minute>\d{2}))?\s*(?P<opens_pm>[ap])m\s*
+    -\s*
+    (?P<closes_hour>\d{1,2})(?::(?P<closes_minute>\d{2}))?\s*(?P<closes_pm>[ap])m\s*
+    (?:/|$)
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+# A single weekday or a range of weekdays like "Mon - Weds".
+DAYS = re.compile(
+    r"\s*([a-z]+)\s*(?:-\s*([a-z]+)\s*)?(?:,(?=\s*[a-z])|$)", re.IGNORECASE
+)
+
+
+def parse_weekday(weekday_string):
+    """Return a number from 0-6 representing the weekday"""
+    try:
+        return WEEKDAYS[weekday_string.upper()]
+    except KeyError:
+        raise ValueError(f"Unknown weekday {weekday_string!r}") from None
+
+
+def to_time(hour, minute, meridiem):
+    """Convert a 12-hour clock time like (12, "30", "a") to `datetime.time`."""
+    hour = int(hour)
+    if not 1 <= hour <= 12:
+        raise ValueError(f"Invalid hour {hour}")
+    hour %= 12
+    if meridiem in "pP":
+        hour += 12
+    return time(hour, int(minute) if minute else 0)
+
+
+@lru_cache(maxsize=1024)
+def _parse_schedule(hours):
+    schedule = {}
+    end = 0
+    for part in PART.finditer(hours):
+        if part.start() != end:
+            break
+        end = part.end()
+
+        opens_at = to_time(*part.group("opens_hour", "opens_minute", "opens_pm"))
+        closes_at = to_time(*part.group("closes_hour", "closes_minute", "closes_pm"))
+        # True if closing time is less than opening time.
+        overnight = closes_at < opens_at
+
+        days = part.group("days")
+        day_end = 0
+        for group in DAYS.finditer(days):
+            if group.start() != day_end:
+                break
+            day_end = group.end()
+
+            first, last = group.groups()
+            first = parse_weekday(first)
+            last = first if last is None else parse_weekday(last)
+            # Ranges may wrap around the end of the week, like "Sun - Tues".
+            for offset in range((last - first) % 7 + 1):
+                schedule[(first + offset) % 7] = (opens_at, closes_at, overnight)
+
+        if day_end != len(days):
+            raise ValueError(f"Invalid weekdays {days!r} in {hours!r}")
+
+    if end != len(hours) or not schedule:
+        raise ValueError(f"Invalid opening hours {hours!r}")
+    return tuple(schedule.items())
+
+
+def parse_schedule(hours):
+    """Return a dictionary with weekday as key and Schedule for each
+    day stored as tuple (opens_at, closes_at, overnight) as value.
+
+    The string is tokenized in a single pass, and since only a few distinct
+    strings appear across all restaurants the result is memoized.
+
+    >>> parse_schedule("Mon - Tues, Fri 10 am - 11:45 am / Sat 7:45 pm - 2:15 am")
+    {0: (datetime.time(10, 0), datetime.time(11, 45), False),
+     1: (datetime.time(10, 0), datetime.time(11, 45), False),
+     4: (datetime.time(10, 0), datetime.time(11, 45), False),
+     5: (datetime.time(19, 45), datetime.time(2, 15), True)}
+    """
+    return dict(_parse_schedule(hours))
+
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def minute_of_week(weekday, at):
+    """Return the minute of the week, counting from Monday 00:00, at which
+    the `datetime.time` `at` falls on `weekday`."""
+    return weekday * MINUTES_PER_DAY + at.hour * 60 + at.minute
+
+
+def week_intervals(weekday, opens_at, closes_at, overnight):
+    """Return the `(start_minute, end_minute)` intervals of the week, with
+    both ends included, covered by a schedule.
+
+    Overnight spans end on the next day. A span that runs past the end of
+    the week, e.g. Sunday 9 pm - 2 am, is split into two intervals so that
+    none of them wraps around.
+
+    >>> week_intervals(6, time(21, 0), time(2, 0), True)
+    [(9900, 10079), (0, 120)]
+    """
+    start = minute_of_week(weekday, opens_at)
+    end = minute_of_week(weekday + overnight, closes_at)
+    if end < MINUTES_PER_WEEK:
+        return [(start, end)]
+    return [(start, MINUTES_PER_WEEK - 1), (0, end - MINUTES_PER_WEEK)]
@@ -0,0 +1,399 @@
+"""In-process indexes, and how they are kept up to date with the database.
+
+Every `Index` is built from the database on first use. Indexes built from
+whole tables, like the ones answering the hot `restaurants` filters, are
+rebuilt once the `Version` of those tables changes: versions are bumped when
+a session that wrote to them commits. Indexes subscribed to the changes of
+some fields, see `subscribe`, apply the changes of each commit instead, and
+are rebuilt once written without the ORM. Either way, writes done by other
+processes are only picked up once an index is older than its `max_age`.
+"""
+import abc
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+
+from flask import current_app
+from sqlalchemy import Column, event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import visitors
+
+from app import database
+from app.hours import MINUTES_PER_WEEK, minute_of_week
+from app.models import Dish, Schedule, ScheduleInterval, db
+
+# What a session changed, to be applied once it commits, see `Pending`.
+PENDING = "indexes.pending"
+
+# The subscribers kept in sync with the commits of this process.
+SUBSCRIBERS = []
+
+
+class Version:
+    """A counter of the commits that changed any of the tables of `models`."""
+
+    versions = []
+
+    def __init__(self, *models):
+        self.tables = {model.__table__.name for model in models}
+        self.value = 0
+        self.lock = threading.Lock()
+        Version.versions.append(self)
+
+    def bump(self):
+        with self.lock:
+            self.value += 1
+
+    @classmethod
+    def bump_tables(cls, tables):
+        for version in cls.versions:
+            if version.tables & tables:
+                version.bump()
+
+
+def subscribe(subscriber):
+    """Keep `subscriber` in sync with the commits of this process.
+
+    Its `fields` map models to the names of the fields it follows. Once a
+    session commits, its `update(model, changes)` method is called with the
+    `Changes` made to each of these models, or its `invalidate(model)` method
+    if the session wrote to their table without the ORM.
+    """
+    SUBSCRIBERS.append(subscriber)
+
+
+class Changes:
+    """The instances of a model created, updated and deleted by a session, as
+    `{id: document}` mappings, documents holding the values of the fields
+    followed by a subscriber."""
+
+    def __init__(self):
+        self.created = {}
+        self.updated = {}
+        self.deleted = set()
+
+    def documents(self):
+        """Return the documents of all the instances changed, by id, None
+        standing for deleted ones."""
+        return {**self.created, **self.updated, **dict.fromkeys(self.deleted)}
+
+
+class Pending:
+    """What a session changed until it commits: the names of the tables it
+    wrote to, the `Changes` of each model followed by each subscriber, and
+    the models each subscriber must invalidate."""
+
+    def __init__(self):
+        self.tables = set()
+        self.changes = defaultdict(lambda: defaultdict(Changes))
+        self.invalidated = defaultdict(set)
+
+
+def updated_columns(orm_execute_state):
+    """Return the names of the columns an `UPDATE` may set: the columns it
+    refers to, and the names of its parameters, like `name` for
+    `.values(name=...)` or for executemany parameters."""
+    state = orm_execute_state
+    parameters = state.parameters or {}
+    if isinstance(parameters, dict):
+        parameters = [parameters]
+    columns = {
+        element.key
+        for element in visitors.iterate(state.statement)
+        if isinstance(element, Column)
+    }
+    columns.update(state.statement.compile().params)
+    for row in parameters:
+        columns.update(row)
+    return columns
+
+
+def document_of(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_changes(session, _flush_context):
+    pending = session.info.setdefault(PENDING, Pending())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        pending.tables.add(instance.__table__.name)
+    for subscriber in SUBSCRIBERS:
+        followed = subscriber.fields
+        for instance in session.new:
+            fields = followed.get(type(instance))
+            if fields:
+                changes = pending.changes[subscriber][type(instance)]
+                changes.created[instance.id] = document_of(instance, fields)
+        for instance in session.dirty:
+            fields = followed.get(type(instance))
+            if not fields:
+                continue
+            attrs = inspect(instance).attrs
+            if any(attrs[field].history.has_changes() for field in fields):
+                changes = pending.changes[subscriber][type(instance)]
+                documents = (
+                    changes.created
+                    if instance.id in changes.created
+                    else changes.updated
+                )
+                documents[instance.id] = document_of(instance, fields)
+        for instance in session.deleted:
+            if followed.get(type(instance)):
+                changes = pending.changes[subscriber][type(instance)]
+                changes.created.pop(instance.id, None)
+                changes.updated.pop(instance.id, None)
+                changes.deleted.add(instance.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_executed_tables(orm_execute_state):
+    # Bulk writes like `session.execute(Dish.__table__.insert(), rows)` skip
+    # the flush entirely. Updates of other columns than the ones followed,
+    # like the cash balances updated by purchases, leave subscribers alone.
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = state.statement.table
+    pending = state.session.info.setdefault(PENDING, Pending())
+    pending.tables.add(table.name)
+    columns = None
+    for subscriber in SUBSCRIBERS:
+        for model, fields in subscriber.fields.items():
+            if model.__table__ is not table:
+                continue
+            if state.is_update:
+                columns = columns if columns is not None else updated_columns(state)
+                if not columns & set(fields):
+                    continue
+            pending.invalidated[subscriber].add(model)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_changes(session):
+    pending = session.info.pop(PENDING, None)
+    if pending is None:
+        return
+    if pending.tables:
+        Version.bump_tables(pending.tables)
+    if not current_app:
+        # Subscribers may depend on the configuration of the application.
+        return
+    for subscriber in SUBSCRIBERS:
+        invalidated = pending.invalidated.get(subscriber, set())
+        for model in invalidated:
+            subscriber.invalidate(model)
+        for model, changes in pending.changes.get(subscriber, {}).items():
+            if model not in invalidated:
+                subscriber.update(model, changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_changes(session):
+    session.info.pop(PENDING, None)
+
+
+@event.listens_for(db.Model.metadata, "after_create")
+@event.listens_for(db.Model.metadata, "after_drop")
+def _bump_recreated_tables(metadata, _connection, **_kw):
+    Version.bump_tables(set(metadata.tables))
+
+
+class Index(abc.ABC):
+    """Base class of the in-process indexes, holding the `data` returned by
+    `build`.
+
+    An index is built on first use, and rebuilt once stale: once `version`
+    changed, if given, once invalidated, or once older than the `max_age`
+    setting. Indexes which are only too old, and `background` ones, are
+    rebuilt in a background thread and keep answering meanwhile, while the
+    others are rebuilt before answering.
+
+    Subscribed indexes, see `subscribe`, are updated with `apply`, holding
+    `lock`. The data is rebuilt aside, and the commits made meanwhile are
+    replayed on the new one.
+    """
+
+    # The setting of the maximum age of the index, in seconds.
+    max_age = "INDEX_MAX_AGE"
+    # Whether the index is only ever built in the background, its `data`
+    # staying None until then.
+    background = False
+    # `{model: field names}` of the changes applied, see `subscribe`.
+    fields = {}
+
+    def __init__(self, version=None):
+        self.version = version
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.data = None
+        self.built_version = None
+        self.built_at = None
+        self.replayed = None
+
+    @abc.abstractmethod
+    def build(self):
+        """Return the data of the index, read from the database."""
+
+    def apply(self, data, model, changes):
+        """Apply the `Changes` of `model` committed to `data`."""
+
+    def is_built(self):
+        """Whether the data is built and was not made stale by a commit of
+        this process since."""
+        return self.built_at is not None and (
+            self.version is None or self.built_version == self.version.value
+        )
+
+    def is_stale(self):
+        return (
+            not self.is_built()
+            or time.monotonic() - self.built_at > current_app.config[self.max_age]
+        )
+
+    def refresh(self):
+        """Rebuild the index if it is stale."""
+        if not self.is_stale():
+            return
+        if self.background or self.is_built():
+            self.warm_up()
+            return
+        with self.build_lock:
+            while self.is_stale():
+                self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            self.replayed = []
+        version = self.version.value if self.version is not None else None
+        built_at = time.monotonic()
+        try:
+            with database.primary(db):
+                data = self.build()
+        except BaseException:
+            with self.lock:
+                self.replayed = None
+            raise
+        with self.lock:
+            if self.replayed is None:
+                # Invalidated meanwhile, the rows read may be out of date.
+                return
+            for model, changes in self.replayed:
+                self.apply(data, model, changes)
+            self.data, self.replayed = data, None
+            self.built_version, self.built_at = version, built_at
+
+    def warm_up(self):
+        """Build the index in a background thread, unless it is being built
+        already."""
+        if not self.build_lock.acquire(blocking=False):
+            return
+        app = current_app._get_current_object()
+
+        def build():
+            try:
+                with app.app_context():
+                    if self.is_stale():
+                        self.rebuild()
+            finally:
+                self.build_lock.release()
+
+        name = f"{type(self).__name__.lower()}-build"
+        threading.Thread(target=build, name=name, daemon=True).start()
+
+    def update(self, model, changes):
+        with self.lock:
+            if self.replayed is not None:
+                self.replayed.append((model, changes))
+            if self.data is not None:
+                self.apply(self.data, model, changes)
+
+    def invalidate(self, model):
+        with self.lock:
+            self.built_at = self.replayed = None
+
+
+class OpenAtIndex(Index):
+    """For each of the 10,080 minutes of the week, the sorted tuple of ids of
+    the restaurants open at that minute.
+
+    The set of open restaurants only changes where some interval starts or
+    ends, and consecutive minutes share the same tuple, so memory grows with
+    the number of distinct opening hours rather than with minutes.
+    """
+
+    def build(self):
+        # How many open intervals each restaurant gains/loses at each minute.
+        changes = [Counter() for _ in range(MINUTES_PER_WEEK + 1)]
+        intervals = db.session.query(
+            ScheduleInterval.start_minute,
+            ScheduleInterval.end_minute,
+            ScheduleInterval.restaurant_id,
+        )
+        for start, end, restaurant_id in intervals:
+            changes[start][restaurant_id] += 1
+            changes[end + 1][restaurant_id] -= 1
+
+        slots, open_count, ids = [], Counter(), ()
+        for change in changes[:MINUTES_PER_WEEK]:
+            if change:
+                open_count += change
+                ids = tuple(sorted(open_count))
+            slots.append(ids)
+        return slots
+
+    def restaurant_ids(self, open_at):
+        """Return the sorted ids of restaurants open at the datetime `open_at`,
+        with the same semantics as `Restaurant.query_open_at`."""
+        self.refresh()
+        return self.data[minute_of_week(open_at.weekday(), open_at.time())]
+
+
+class PriceIndex(Index):
+    """The prices of all dishes in ascending order, alongside the ids of
+    their restaurants.
+
+    The dishes within a price range are a contiguous slice, found by
+    bisection, and their restaurants are counted in a single pass over it.
+    """
+
+    def build(self):
+        dishes = (
+            db.session.query(Dish.price, Dish.restaurant_id)
+            .filter(Dish.restaurant_id.isnot(None))
+            .order_by(Dish.price)
+        )
+        prices, restaurant_ids = array("d"), array("q")
+        for price, restaurant_id in dishes:
+            prices.append(price)
+            restaurant_ids.append(restaurant_id)
+        return prices, restaurant_ids
+
+    def restaurant_ids_within_range(
+        self, min_dish_price, max_dish_price, min_dishes, max_dishes
+    ):
+        """Return the sorted ids of restaurants with at least `min_dishes` or
+        at most `max_dishes` dishes priced within the given range, with the
+        same semantics as `Restaurant.query_within_range`."""
+        self.refresh()
+        prices, restaurant_ids = self.data
+        start = bisect_left(prices, min_dish_price)
+        stop = bisect_right(prices, max_dish_price, start)
+        counts = Counter(restaurant_ids[start:stop]).items()
+        if min_dishes is not None:
+            return sorted(id_ for id_, count in counts if count >= min_dishes)
+        return sorted(id_ for id_, count in counts if count <= max_dishes)
+
+
+def intersect(*id_lists):
+    """Return the ids found in all of the sorted `id_lists`, in order."""
+    smallest, *others = sorted(id_lists, key=len)
+    others = [set(ids) for ids in others]
+    return [id_ for id_ in smallest if all(id_ in ids for ids in others)]
+
+
+schedules = Version(Schedule, ScheduleInterval)
+dishes = Version(Dish)
+open_at = OpenAtIndex(schedules)
+prices = PriceIndex(dishes)
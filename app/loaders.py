@@ -0,0 +1,140 @@
+"""DataLoaders batching the relationship fields of the GraphQL types.
+
+Resolving `dishes` for a page of restaurants would otherwise issue one query
+per restaurant. The loaders collect the keys requested by all the sibling
+fields resolved together and fetch them with a single
+`WHERE <column> IN (...)` query, so a nested query costs one query per field
+and depth level. A fresh set of loaders is created for every request, see
+`app.routes`, so nothing is cached across requests.
+"""
+from collections import defaultdict
+
+from promise import Promise
+from promise.dataloader import DataLoader
+from sqlalchemy import func
+
+from app import models
+from app.types.connection import KeysetConnectionField, Page
+
+# Maximum number of keys in the `IN (...)` clause of a single query.
+MAX_BATCH_SIZE = 1000
+
+
+class ModelLoader(DataLoader):
+    """Load instances of `model` by primary key, or by the unique `column`."""
+
+    def __init__(self, model, column=None):
+        super().__init__(max_batch_size=MAX_BATCH_SIZE)
+        self.model = model
+        self.column = model.id if column is None else column
+
+    def batch_load_fn(self, keys):
+        instances = self.model.query.filter(self.column.in_(keys))
+        by_key = {
+            getattr(instance, self.column.key): instance for instance in instances
+        }
+        return Promise.resolve([by_key.get(key) for key in keys])
+
+
+class RelationshipLoader(DataLoader):
+    """Load the pages of instances of `model` whose foreign key `column`
+    matches each key, ordered by primary key.
+
+    Keys are `(foreign key, page)` pairs, `page` being the arguments returned
+    by `app.types.connection.id_page`. Only the `first + 1` (or `last + 1`)
+    rows of each page are fetched, numbered per foreign key with
+    `ROW_NUMBER() OVER (PARTITION BY <column> ORDER BY id)`.
+    """
+
+    def __init__(self, model, column):
+        super().__init__(max_batch_size=MAX_BATCH_SIZE)
+        self.model = model
+        self.column = column
+
+    def batch_load_fn(self, keys):
+        by_key = {}
+        pages = defaultdict(list)
+        for key, page in keys:
+            pages[page].append(key)
+        for page, page_keys in pages.items():
+            first, last, _, _ = page
+            rows = self.load_page(page_keys, *page)
+            for key in page_keys:
+                by_key[key, page] = Page(
+                    *KeysetConnectionField.trim(rows[key], first, last)
+                )
+        return Promise.resolve([by_key[key] for key in keys])
+
+    def load_page(self, keys, first, last, after, before):
+        """Return the rows of the page of each key, fetched as expected by
+        `KeysetConnectionField.trim`."""
+        model = self.model
+        order = model.id if first is not None else model.id.desc()
+        limit = (first if first is not None else last) + 1
+        number = func.row_number().over(partition_by=self.column, order_by=order)
+        numbered = model.query.with_entities(model.id, number.label("number"))
+        numbered = numbered.filter(self.column.in_(keys))
+        if after is not None:
+            numbered = numbered.filter(model.id > after)
+        if before is not None:
+            numbered = numbered.filter(model.id < before)
+        numbered = numbered.subquery()
+        instances = (
+            model.query.join(numbered, model.id == numbered.c.id)
+            .filter(numbered.c.number <= limit)
+            .order_by(self.column, order)
+        )
+        rows = defaultdict(list)
+        for instance in instances:
+            rows[getattr(instance, self.column.key)].append(instance)
+        return rows
+
+
+class Loaders:
+    """The loaders of a single request."""
+
+    def __init__(self):
+        self.restaurant = ModelLoader(models.Restaurant)
+        self.user = ModelLoader(models.User)
+        self.user_spending = ModelLoader(
+            models.UserSpending, models.UserSpending.user_id
+        )
+        self.restaurant_revenue = RevenueLoader()
+        self.restaurant_dishes = RelationshipLoader(
+            models.Dish, models.Dish.restaurant_id
+        )
+        self.restaurant_purchases = RelationshipLoader(
+            models.PurchaseOrder, models.PurchaseOrder.restaurant_id
+        )
+        self.user_purchases = RelationshipLoader(
+            models.PurchaseOrder, models.PurchaseOrder.user_id
+        )
+
+
+class RevenueLoader(DataLoader):
+    """Load the `RestaurantRevenue` of each `(restaurant id, since, until)`
+    key, by ascending day within the optional `since` and `until` dates."""
+
+    def __init__(self):
+        super().__init__(max_batch_size=MAX_BATCH_SIZE)
+
+    def batch_load_fn(self, keys):
+        revenue = models.RestaurantRevenue
+        by_key = defaultdict(list)
+        ranges = defaultdict(list)
+        for restaurant_id, since, until in keys:
+            ranges[since, until].append(restaurant_id)
+        for (since, until), restaurant_ids in ranges.items():
+            query = revenue.query.filter(revenue.restaurant_id.in_(restaurant_ids))
+            if since is not None:
+                query = query.filter(revenue.day >= since)
+            if until is not None:
+                query = query.filter(revenue.day <= until)
+            for row in query.order_by(revenue.restaurant_id, revenue.day):
+                by_key[row.restaurant_id, since, until].append(row)
+        return Promise.resolve([by_key[key] for key in keys])
+
+
+def get_loaders(info):
+    """Return the loaders of the request being resolved."""
+    return info.context["loaders"]
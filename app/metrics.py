@@ -0,0 +1,54 @@
+"""In-process metrics of the worker, served as JSON by `/metrics`."""
+import threading
+
+REGISTRY = {}
+
+
+class Summary:
+    """Count, sum and maximum of observed values, e.g. latencies."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+                "mean": self.sum / self.count if self.count else 0,
+            }
+
+
+class Gauge:
+    """Value computed when the metrics are served, e.g. the state of a
+    pool."""
+
+    def __init__(self, function):
+        self.function = function
+
+    def snapshot(self):
+        return self.function()
+
+
+def summary(name):
+    """Return the `Summary` registered as `name`, registering it if needed."""
+    return REGISTRY.setdefault(name, Summary())
+
+
+def gauge(name, function):
+    """Register `function` as the `Gauge` named `name`."""
+    REGISTRY[name] = Gauge(function)
+
+
+def snapshot():
+    return {name: metric.snapshot() for name, metric in sorted(REGISTRY.items())}
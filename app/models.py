@@ -1,9 +1,50 @@
+from collections import Counter, defaultdict
 from datetime import datetime
 
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
 from app import db
+from app.hours import minute_of_week, week_intervals
+
+
+def _increment(table, rows):
+    """Add the values of `rows` to the rows of `table` with the same primary
+    key, inserting the missing ones, in the current transaction."""
+    keys = [column.name for column in table.primary_key]
+    dialect = db.engine.dialect.name
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            {
+                column.name: column + statement.inserted[column.name]
+                for column in table.c
+                if column.name not in keys
+            }
+        )
+    else:
+        insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[dialect]
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={
+                column.name: column + statement.excluded[column.name]
+                for column in table.c
+                if column.name not in keys
+            },
+        )
+    db.session.execute(statement, rows)
 
 
-class Restaurant(db.Model):
+class SearchableMixin:
+    """Full-text search over the `__searchable__` fields, see `app.search`."""
+
+    @classmethod
+    def search(cls, field, q, limit=20, offset=0):
+        """Return the instances whose `field` best matches `q`, best first."""
+        return search.search([(cls, field)], q, limit, offset)
+
+
+class Restaurant(SearchableMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     cash_balance = db.Column(db.Float, nullable=False)
@@ -14,35 +55,32 @@ class Restaurant(db.Model):
     dishes = db.relationship("Dish", backref="restaurant", lazy="dynamic")
     purchase = db.relationship("PurchaseOrder", backref="restaurant", lazy="dynamic")
 
-    __table_args__ = (db.CheckConstraint("cash_balance>=0"),)
+    __table_args__ = (
+        db.CheckConstraint("cash_balance>=0"),
+        db.Index("ix_restaurant_name", "name"),
+    )
     __searchable__ = ("name",)
 
     @classmethod
-    def query_open_at(cls, open_at):
-        overnight = Schedule.overnight
-        O, C = Schedule.opens_at, Schedule.closes_at
-        OA = open_at.time()
-
-        return cls.query.join(Schedule).filter(
-            (Schedule.weekday == open_at.weekday())
-            & (
-                (
-                    # If overnight is False, simply check if OA is in b/w O and C
-                    ((overnight == False) & ((O <= OA) & (C >= OA)))
-                )
-                | (
-                    # If overnight is true, then OA must lie in the shaded
-                    # areas:
-                    # 0            C                  O               23:59
-                    # +////////////^------------------^///////////////////+
-                    #              (OA < C) or (OA > O)
-                    ((overnight == True) & ((C >= OA) | (O <= OA)))
-                )
-            )
+    def query_open_at(cls, open_at, query=None):
+        """Return restaurants open at the datetime `open_at`, to the minute.
+        Pass `query` to filter the restaurants it returns instead.
+
+        Opening hours are stored as non-wrapping intervals of minutes of the
+        week, so this is a single range predicate on `ScheduleInterval`.
+        Overnight spans are also open on the early hours of the next day.
+        """
+        minute = minute_of_week(open_at.weekday(), open_at.time())
+        restaurant_ids = db.session.query(ScheduleInterval.restaurant_id).filter(
+            ScheduleInterval.start_minute <= minute,
+            ScheduleInterval.end_minute >= minute,
         )
+        query = cls.query if query is None else query
+        return query.filter(cls.id.in_(restaurant_ids))
 
-    @classmethod
-    def query_within_range(cls, min_dish_price, max_dish_price, min_dishes, max_dishes):
+    @staticmethod
+    def validate_range(min_dish_price, max_dish_price, min_dishes, max_dishes):
+        """Raise `ValueError` for invalid arguments of `query_within_range`."""
         if not (min_dishes or max_dishes):
             raise ValueError("Specify one of 'minDishes' or 'maxDishes'")
 
@@ -57,6 +95,15 @@ class Restaurant(db.Model):
         if min_dish_price > max_dish_price:
             raise ValueError("'minDishPrice' cannot be greater than 'maxDishPrice'.")
 
+    @classmethod
+    def query_within_range(
+        cls, min_dish_price, max_dish_price, min_dishes, max_dishes, query=None
+    ):
+        """Return restaurants with at least `min_dishes` or at most
+        `max_dishes` dishes priced within the given range. Pass `query` to
+        filter the restaurants it returns instead."""
+        cls.validate_range(min_dish_price, max_dish_price, min_dishes, max_dishes)
+
         dishes_within_price_range = (
             db.session.query(
                 Dish.restaurant_id, db.func.count(Dish.restaurant_id).label("cnt")
@@ -71,7 +118,26 @@ class Restaurant(db.Model):
         if max_dishes is not None:
             filter_arg = dishes_within_price_range.c.cnt <= max_dishes
 
-        return cls.query.join(dishes_within_price_range).filter(filter_arg)
+        query = cls.query if query is None else query
+        return query.join(dishes_within_price_range).filter(filter_arg)
+
+    @classmethod
+    def credit(cls, amounts):
+        """Add the amounts of the `{restaurant id: amount}` mapping `amounts` to
+        the cash balances of the restaurants, in the current transaction."""
+        table = cls.__table__
+        statement = (
+            table.update()
+            .where(table.c.id == db.bindparam("restaurant_id"))
+            .values(cash_balance=table.c.cash_balance + db.bindparam("amount"))
+        )
+        db.session.execute(
+            statement,
+            [
+                {"restaurant_id": id_, "amount": amount}
+                for id_, amount in amounts.items()
+            ],
+        )
 
 
 class Schedule(db.Model):
@@ -92,7 +158,75 @@ class Schedule(db.Model):
     )
 
 
-class Dish(db.Model):
+class ScheduleInterval(db.Model):
+    """An interval of minutes of the week, counting from Monday 00:00 and with
+    both ends included, during which a restaurant is open.
+
+    Rows are derived from `Schedule` and kept in sync with it, see
+    `app.hours.week_intervals`.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    start_minute = db.Column(db.Integer, nullable=False)
+    end_minute = db.Column(db.Integer, nullable=False)
+    schedule_id = db.Column(
+        db.Integer, db.ForeignKey("schedule.id", ondelete="CASCADE"), nullable=False
+    )
+    restaurant_id = db.Column(db.Integer, db.ForeignKey("restaurant.id"))
+
+    __table_args__ = (
+        db.Index(
+            "ix_schedule_interval_start_minute_end_minute",
+            "start_minute",
+            "end_minute",
+            "restaurant_id",
+        ),
+        db.CheckConstraint(
+            "0 <= start_minute AND start_minute <= end_minute AND end_minute < 10080",
+            name="interval_within_one_week",
+        ),
+        db.Index("ix_schedule_interval_schedule_id", "schedule_id"),
+    )
+
+    @staticmethod
+    def rows_for(schedule_id, restaurant_id, weekday, opens_at, closes_at, overnight):
+        """Return the rows to insert for a schedule, as dictionaries."""
+        return [
+            {
+                "start_minute": start,
+                "end_minute": end,
+                "schedule_id": schedule_id,
+                "restaurant_id": restaurant_id,
+            }
+            for start, end in week_intervals(weekday, opens_at, closes_at, overnight)
+        ]
+
+
+@db.event.listens_for(Schedule, "after_insert")
+@db.event.listens_for(Schedule, "after_update")
+def _sync_schedule_intervals(_mapper, connection, schedule):
+    intervals = ScheduleInterval.__table__
+    connection.execute(intervals.delete().where(intervals.c.schedule_id == schedule.id))
+    connection.execute(
+        intervals.insert(),
+        ScheduleInterval.rows_for(
+            schedule.id,
+            schedule.restaurant_id,
+            schedule.weekday,
+            schedule.opens_at,
+            schedule.closes_at,
+            schedule.overnight,
+        ),
+    )
+
+
+@db.event.listens_for(Schedule, "before_delete")
+def _delete_schedule_intervals(_mapper, connection, schedule):
+    intervals = ScheduleInterval.__table__
+    connection.execute(intervals.delete().where(intervals.c.schedule_id == schedule.id))
+
+
+class Dish(SearchableMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False)
@@ -100,6 +234,9 @@ class Dish(db.Model):
 
     __table_args__ = (
         db.CheckConstraint("price >= 0", name="price_of_dish_can_not_be_negative"),
+        # Covers the price range filter of `Restaurant.query_within_range`.
+        db.Index("ix_dish_price_restaurant_id", "price", "restaurant_id"),
+        db.Index("ix_dish_restaurant_id", "restaurant_id"),
     )
     __searchable__ = ("name",)
 
@@ -116,6 +253,32 @@ class User(db.Model):
         ),
     )
 
+    @classmethod
+    def debit(cls, amounts):
+        """Subtract the amounts of the `{user id: amount}` mapping `amounts` from
+        the cash balances of the users, in the current transaction.
+
+        Each balance is checked and updated by a single conditional `UPDATE`,
+        so concurrent purchases can neither lose updates nor overdraw a user.
+        Raise `ValueError`, leaving the transaction to be rolled back, if any
+        of the users has not enough cash.
+        """
+        table = cls.__table__
+        statement = (
+            table.update()
+            .where(
+                table.c.id == db.bindparam("user_id"),
+                table.c.cash_balance >= db.bindparam("amount"),
+            )
+            .values(cash_balance=table.c.cash_balance - db.bindparam("amount"))
+        )
+        result = db.session.execute(
+            statement,
+            [{"user_id": id_, "amount": amount} for id_, amount in amounts.items()],
+        )
+        if result.rowcount != len(amounts):
+            raise ValueError("Purchase not allowed: Not enough cash balance!")
+
 
 class PurchaseOrder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -130,26 +293,178 @@ class PurchaseOrder(db.Model):
         db.CheckConstraint(
             "transaction_amount >= 0", name="transaction_amount_can_not_be_negative"
         ),
+        # Covers the amounts spent by a user in a date range.
+        db.Index(
+            "ix_purchase_order_user_id_transaction_date_transaction_amount",
+            "user_id",
+            "transaction_date",
+            "transaction_amount",
+        ),
+        # Covers the dishes of a restaurant ordered in a date range.
+        db.Index(
+            "ix_purchase_order_restaurant_id_transaction_date_dish_name",
+            "restaurant_id",
+            "transaction_date",
+            "dish_name",
+        ),
+        db.Index("ix_purchase_order_transaction_date", "transaction_date"),
     )
 
+    @classmethod
+    def add_to_totals(cls, orders):
+        """Add the `(user_id, restaurant_id, amount, date)` of `orders` to
+        `UserSpending` and `RestaurantRevenue`, in the current transaction."""
+        # `[order count, total amount]` per user, and per restaurant and day.
+        spending, revenue = defaultdict(lambda: [0, 0]), defaultdict(lambda: [0, 0])
+        for user_id, restaurant_id, amount, date in orders:
+            if user_id is not None:
+                spending[user_id][0] += 1
+                spending[user_id][1] += amount
+            if restaurant_id is not None:
+                revenue[restaurant_id, date.date()][0] += 1
+                revenue[restaurant_id, date.date()][1] += amount
+        if spending:
+            _increment(
+                UserSpending.__table__,
+                [
+                    {"user_id": user_id, "order_count": count, "total_amount": total}
+                    for user_id, (count, total) in spending.items()
+                ],
+            )
+        if revenue:
+            _increment(
+                RestaurantRevenue.__table__,
+                [
+                    {
+                        "restaurant_id": restaurant_id,
+                        "day": day,
+                        "order_count": count,
+                        "revenue": total,
+                    }
+                    for (restaurant_id, day), (count, total) in revenue.items()
+                ],
+            )
+
+    @classmethod
+    def rebuild_totals(cls):
+        """Rebuild `UserSpending` and `RestaurantRevenue` from all the orders,
+        and return their numbers of rows."""
+        day = db.func.date(cls.transaction_date)
+        totals = [
+            (
+                UserSpending,
+                db.session.query(
+                    cls.user_id,
+                    db.func.count(),
+                    db.func.sum(cls.transaction_amount),
+                )
+                .filter(cls.user_id.isnot(None))
+                .group_by(cls.user_id),
+            ),
+            (
+                RestaurantRevenue,
+                db.session.query(
+                    cls.restaurant_id,
+                    day,
+                    db.func.count(),
+                    db.func.sum(cls.transaction_amount),
+                )
+                .filter(cls.restaurant_id.isnot(None))
+                .group_by(cls.restaurant_id, day),
+            ),
+        ]
+        counts = []
+        try:
+            for model, query in totals:
+                table = model.__table__
+                db.session.execute(table.delete())
+                db.session.execute(
+                    table.insert().from_select(list(table.c), query.subquery())
+                )
+                counts.append(db.session.query(model).count())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return counts
+
     @classmethod
     def create_for(cls, user, dish):
-        if user.cash_balance < dish.price:
-            raise ValueError("Purchase not allowed: Not enough cash balance!")
-        restaurant = dish.restaurant
-        order = PurchaseOrder(
-            dish_name=dish.name,
-            transaction_amount=dish.price,
-            restaurant_name=restaurant.name,
-            user_id=user.id,
-            restaurant_id=restaurant.id,
-        )
+        """Create the order of `dish` by `user`, moving its price from the
+        cash balance of the user to the one of the restaurant.
+
+        Balances are updated by `User.debit` and `Restaurant.credit` in a
+        single short transaction.
+        """
+        return cls.create_many([(user, dish)])[0]
+
+    @classmethod
+    def create_many(cls, purchases):
+        """Create the orders of the `(user, dish)` pairs of `purchases` in a
+        single transaction: either all of them are created, or none.
+
+        Each user is debited once with the total of their purchases, and each
+        restaurant credited once with the total of its sales. Their totals
+        are updated along, see `add_to_totals`.
+        """
+        debits, credits, orders = Counter(), Counter(), []
+        for user, dish in purchases:
+            restaurant = dish.restaurant
+            if restaurant is None:
+                raise ValueError("Purchase not allowed: Dish has no restaurant!")
+            debits[user.id] += dish.price
+            credits[restaurant.id] += dish.price
+            orders.append(
+                PurchaseOrder(
+                    dish_name=dish.name,
+                    transaction_amount=dish.price,
+                    restaurant_name=restaurant.name,
+                    user_id=user.id,
+                    restaurant_id=restaurant.id,
+                )
+            )
+        if not orders:
+            return orders
+
+        try:
+            User.debit(debits)
+            Restaurant.credit(credits)
+            db.session.add_all(orders)
+            db.session.flush()
+            cls.add_to_totals(
+                (o.user_id, o.restaurant_id, o.transaction_amount, o.transaction_date)
+                for o in orders
+            )
+            ids = [order.id for order in orders]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        # Refresh the orders expired by the commit in a single query.
+        cls.query.filter(cls.id.in_(ids)).all()
+        return orders
+
+
+class UserSpending(db.Model):
+    """Number and total amount of the orders of each user, updated along with
+    them, see `PurchaseOrder.add_to_totals`."""
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+
+
+class RestaurantRevenue(db.Model):
+    """Number and total amount of the orders of each restaurant per day (UTC),
+    updated along with them, see `PurchaseOrder.add_to_totals`."""
+
+    restaurant_id = db.Column(
+        db.Integer, db.ForeignKey("restaurant.id"), primary_key=True
+    )
+    day = db.Column(db.Date, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(db.Float, nullable=False)
 
-        user.cash_balance -= dish.price
-        restaurant.cash_balance += dish.price
-        db.session.add(user)
-        db.session.add(order)
-        db.session.add(restaurant)
-        db.session.commit()
 
-        return order
+# Imported last, as `app.search` imports `app.indexes`, which imports the models.
+from app import search  # noqa: E402
@@ -1,9 +1,49 @@
+from flask import jsonify, request
 from flask_graphql import GraphQLView
 
-from app import app
+from app import analytics, app, database, db, documents, metrics, suggest
+from app.loaders import Loaders
 from app.schema import SCHEMA
 
+
+class FrenzyGraphQLView(GraphQLView):
+    def get_context(self):
+        return {"request": request, "loaders": Loaders()}
+
+    def parse_body(self):
+        data = super().parse_body()
+        if isinstance(data, list):
+            return data
+        data = dict(data.items())
+        query = documents.resolve_persisted_query(data, request.args)
+        if query is not None:
+            data["query"] = query
+        return data
+
+
 app.add_url_rule(
     "/graphql",
-    view_func=GraphQLView.as_view("graphql", schema=SCHEMA, graphiql=True),
+    view_func=FrenzyGraphQLView.as_view(
+        "graphql", schema=SCHEMA, graphiql=True, backend=documents.backend
+    ),
 )
+
+
+@app.before_first_request
+def warm_up():
+    if app.config["SUGGEST_WARM_UP"]:
+        suggest.suggester.warm_up()
+    if app.config["ANALYTICS_WARM_UP"]:
+        analytics.analytics.warm_up()
+
+
+@app.before_request
+def forget_writes():
+    # Only the reads following a write of the same request must go to the
+    # primary.
+    database.forget_writes(db.session)
+
+
+@app.route("/metrics")
+def show_metrics():
+    return jsonify(metrics.snapshot())
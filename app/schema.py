@@ -1,17 +1,21 @@
 import graphene
 from graphene import relay
 
-from app.types.order import Purchase
+from app.types.analytics import AnalyticsMixin
+from app.types.order import Purchase, PurchaseMany
 from app.types.restaurant import RestaurantMixin, SearchMixin
 from app.types.user import UserMixin
 
 
-class Query(graphene.ObjectType, RestaurantMixin, SearchMixin, UserMixin):
+class Query(
+    graphene.ObjectType, AnalyticsMixin, RestaurantMixin, SearchMixin, UserMixin
+):
     node = relay.Node.Field()
 
 
 class Mutation(graphene.ObjectType):
     purchase = Purchase.Field()
+    purchase_many = PurchaseMany.Field()
 
 
 SCHEMA = graphene.Schema(query=Query, mutation=Mutation)
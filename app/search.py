@@ -0,0 +1,436 @@
+"""Full-text search over the `__searchable__` fields of the models.
+
+Searches go through the backend named by `SEARCH_BACKEND`. The built-in
+"local" backend keeps an inverted index of each searchable field in memory,
+ranking matches with BM25, so no external service is needed. The index of a
+field is built from the database on its first search, then kept in sync with
+the commits of this process, see `app.indexes.Index`.
+
+The "elasticsearch" backend, the default when `ELASTICSEARCH_URL` is set,
+queries an index per model instead. `flask reindex` fills them, and the
+documents changed by commits are then sent in bulk requests, in the
+background.
+"""
+import abc
+import atexit
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from elastic_transport import TransportError
+from elasticsearch import ApiError, NotFoundError, helpers
+from flask import current_app
+
+from app import db, indexes
+from app.feeds import batched
+
+TOKEN = re.compile(r"\w+")
+
+# Maximum number of results of a search, and of results skipped before them.
+MAX_LIMIT = 100
+MAX_OFFSET = 1000
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower()) if text else []
+
+
+def searchable_models():
+    return [
+        mapper.class_
+        for mapper in db.Model.registry.mappers
+        if getattr(mapper.class_, "__searchable__", None)
+    ]
+
+
+class SearchBackend(abc.ABC):
+    """Base class of the search backends."""
+
+    @abc.abstractmethod
+    def query(self, model, field, q, size):
+        """Return the `(score, id)` of the at most `size` instances of `model`
+        whose `field` best matches `q`, best first."""
+
+    @abc.abstractmethod
+    def update(self, model, changes):
+        """Sync the `app.indexes.Changes` committed to the searchable fields
+        of `model`."""
+
+    def invalidate(self, model):
+        """Forget what is known of `model`, written to without the ORM."""
+
+
+class InvertedIndex:
+    """An inverted index of the tokens of a field, for BM25 ranking."""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.tokens = {}
+        self.total_length = 0
+
+    def _add(self, id_, text):
+        tokens = Counter(tokenize(text))
+        for token, count in tokens.items():
+            self.postings[token][id_] = count
+        self.tokens[id_] = (tuple(tokens), sum(tokens.values()))
+        self.total_length += self.tokens[id_][1]
+
+    def _remove(self, id_):
+        if id_ not in self.tokens:
+            return
+        tokens, length = self.tokens.pop(id_)
+        self.total_length -= length
+        for token in tokens:
+            del self.postings[token][id_]
+            if not self.postings[token]:
+                del self.postings[token]
+
+    def update(self, id_, text):
+        self._remove(id_)
+        if text is not None:
+            self._add(id_, text)
+
+    def scores(self, q):
+        """Return the BM25 score of each id matching `q`."""
+        count = len(self.tokens)
+        if not count:
+            return Counter()
+        average_length = self.total_length / count
+        scores = Counter()
+        for token in set(tokenize(q)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for id_, frequency in postings.items():
+                length = self.tokens[id_][1]
+                norm = 1 - self.B + self.B * length / average_length
+                scores[id_] += (
+                    idf * frequency * (self.K1 + 1) / (frequency + self.K1 * norm)
+                )
+        return scores
+
+
+class FieldIndex(indexes.Index):
+    """The `InvertedIndex` of the searchable `field` of `model`."""
+
+    max_age = "SEARCH_INDEX_MAX_AGE"
+
+    def __init__(self, model, field):
+        super().__init__()
+        self.model = model
+        self.field = field
+
+    def build(self):
+        inverted = InvertedIndex()
+        column = getattr(self.model, self.field)
+        for id_, text in db.session.query(self.model.id, column).yield_per(10000):
+            inverted.update(id_, text)
+        return inverted
+
+    def apply(self, inverted, model, changes):
+        for id_, document in changes.documents().items():
+            inverted.update(id_, None if document is None else document[self.field])
+
+    def query(self, q, size):
+        self.refresh()
+        with self.lock:
+            scores = self.data.scores(q)
+        best = heapq.nsmallest(size, scores.items(), key=lambda hit: (-hit[1], hit[0]))
+        return [(score, id_) for id_, score in best]
+
+
+class LocalSearchBackend(SearchBackend):
+    """Search backend ranking matches from in-memory inverted indexes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = {}
+
+    def field_index(self, model, field):
+        with self.lock:
+            key = (model.__tablename__, field)
+            if key not in self.indexes:
+                self.indexes[key] = FieldIndex(model, field)
+            return self.indexes[key]
+
+    def query(self, model, field, q, size):
+        if field not in model.__searchable__:
+            raise ValueError(f"{model.__name__}.{field} is not searchable.")
+        return self.field_index(model, field).query(q, size)
+
+    def update(self, model, changes):
+        for field in model.__searchable__:
+            index = self.indexes.get((model.__tablename__, field))
+            if index is not None:
+                index.update(model, changes)
+
+    def invalidate(self, model):
+        for field in model.__searchable__:
+            index = self.indexes.get((model.__tablename__, field))
+            if index is not None:
+                index.invalidate(model)
+
+
+def document_actions(model, documents, index=None):
+    """Return the bulk actions syncing the `(id, document)` pairs of
+    `documents` to `index`, by default the alias of `model`, where None
+    documents stand for deleted instances."""
+    index = index or model.__tablename__
+    for id_, document in documents:
+        if document is None:
+            yield {"_op_type": "delete", "_index": index, "_id": id_}
+        else:
+            yield {"_index": index, "_id": id_, "_source": document}
+
+
+class ElasticsearchBackend(SearchBackend):
+    """Search backend querying an Elasticsearch index per model, through an
+    alias named after its table.
+
+    Commits only queue the documents they change: a worker thread sends the
+    documents queued within `ELASTICSEARCH_SYNC_INTERVAL` seconds in a bulk
+    request per model, and queues them again if Elasticsearch cannot be
+    reached. Models written without the ORM, like by `flask seed-db`, are
+    reindexed once they were not written for `ELASTICSEARCH_REINDEX_DELAY`
+    seconds, or when the process exits.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.changed = threading.Event()
+        # `{model: {id: document}}` of the documents to send.
+        self.documents = defaultdict(dict)
+        # The time at which each model to reindex was last written.
+        self.stale = {}
+        self.thread = None
+
+    @property
+    def client(self):
+        return current_app.elasticsearch
+
+    def query(self, model, field, q, size):
+        if field not in model.__searchable__:
+            raise ValueError(f"{model.__name__}.{field} is not searchable.")
+        response = self.client.search(
+            index=model.__tablename__,
+            query={"match": {field: q}},
+            size=size,
+            source=False,
+            ignore_unavailable=True,
+        )
+        return [(hit["_score"], int(hit["_id"])) for hit in response["hits"]["hits"]]
+
+    def update(self, model, changes):
+        with self.lock:
+            self.documents[model].update(changes.documents())
+        self.schedule()
+
+    def invalidate(self, model):
+        with self.lock:
+            # Reindexing sends the documents of the model anyway.
+            self.documents.pop(model, None)
+            self.stale[model] = time.monotonic()
+        self.schedule()
+
+    def schedule(self):
+        """Wake the worker thread up, starting it first if needed."""
+        app = current_app._get_current_object()
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, args=(app,), name="elasticsearch-sync", daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.flush_at_exit, app)
+        self.changed.set()
+
+    def run(self, app):
+        with app.app_context():
+            config = current_app.config
+            while True:
+                timeout = config["ELASTICSEARCH_REINDEX_DELAY"] if self.stale else None
+                self.changed.wait(timeout)
+                time.sleep(config["ELASTICSEARCH_SYNC_INTERVAL"])
+                self.changed.clear()
+                try:
+                    self.flush(config["ELASTICSEARCH_REINDEX_DELAY"])
+                except Exception:
+                    current_app.logger.exception("Could not sync Elasticsearch.")
+                finally:
+                    db.session.remove()
+
+    def flush_at_exit(self, app):
+        with app.app_context():
+            self.flush()
+
+    def flush(self, reindex_delay=0):
+        """Send the queued documents, and reindex the models which were not
+        written for `reindex_delay` seconds. What could not be sent is queued
+        again."""
+        with self.flush_lock:
+            now = time.monotonic()
+            with self.lock:
+                documents, self.documents = self.documents, defaultdict(dict)
+                stale = [
+                    model
+                    for model, written_at in self.stale.items()
+                    if now - written_at >= reindex_delay
+                ]
+                for model in stale:
+                    del self.stale[model]
+            config = current_app.config
+            for model in stale:
+                try:
+                    self.reindex([model], config["ELASTICSEARCH_CHUNK_SIZE"], 1)
+                except Exception:
+                    current_app.logger.exception(
+                        "Could not reindex %s documents, retrying.", model.__name__
+                    )
+                    with self.lock:
+                        self.stale.setdefault(model, now)
+            for model, model_documents in documents.items():
+                try:
+                    helpers.bulk(
+                        self.client,
+                        document_actions(model, model_documents.items()),
+                        chunk_size=config["ELASTICSEARCH_CHUNK_SIZE"],
+                        ignore_status=404,
+                    )
+                except (ApiError, TransportError, helpers.BulkIndexError):
+                    current_app.logger.exception(
+                        "Could not sync %s documents, retrying.", model.__name__
+                    )
+                    with self.lock:
+                        # Documents queued meanwhile are newer.
+                        queued = self.documents[model]
+                        for id_, document in model_documents.items():
+                            queued.setdefault(id_, document)
+                    self.changed.set()
+
+    def reindex(self, models, chunk_size, thread_count):
+        """Index `models` from the database, sending `thread_count` bulk
+        requests of `chunk_size` documents at a time. Return the number of
+        documents indexed per model.
+
+        Each model is indexed into a new index, and its alias is then switched
+        to it, so searches are answered by the previous one meanwhile.
+        """
+        counts = {}
+        for model in models:
+            alias = model.__tablename__
+            index = f"{alias}-{time.time_ns()}"
+            self.client.indices.create(
+                index=index,
+                mappings={
+                    "properties": {
+                        field: {"type": "text"} for field in model.__searchable__
+                    }
+                },
+            )
+            try:
+                counts[model] = self.fill(model, index, chunk_size, thread_count)
+                self.client.indices.refresh(index=index)
+            except BaseException:
+                self.client.indices.delete(index=index, ignore_unavailable=True)
+                raise
+            self.switch_alias(alias, index)
+        return counts
+
+    def fill(self, model, index, chunk_size, thread_count):
+        columns = [getattr(model, field) for field in model.__searchable__]
+        rows = db.session.query(model.id, *columns).yield_per(chunk_size)
+        count = 0
+        # Rows are read here rather than by the threads of the bulk helper,
+        # which must not share the connection of the session.
+        for batch in batched(rows, chunk_size * thread_count):
+            documents = [
+                (id_, dict(zip(model.__searchable__, values))) for id_, *values in batch
+            ]
+            for _ in helpers.parallel_bulk(
+                self.client,
+                document_actions(model, documents, index),
+                chunk_size=chunk_size,
+                thread_count=thread_count,
+            ):
+                count += 1
+        return count
+
+    def switch_alias(self, alias, index):
+        """Point `alias` to `index` alone, and delete the indexes it pointed
+        to."""
+        try:
+            previous = list(self.client.indices.get_alias(name=alias))
+        except NotFoundError:
+            previous = []
+        actions = [{"add": {"index": index, "alias": alias}}]
+        actions += [{"remove": {"index": name, "alias": alias}} for name in previous]
+        if not previous and self.client.indices.exists(index=alias):
+            # An index created by the sync of commits before the first reindex.
+            actions.append({"remove_index": {"index": alias}})
+        self.client.indices.update_aliases(actions=actions)
+        if previous:
+            self.client.indices.delete(index=previous)
+
+
+BACKENDS = {"local": LocalSearchBackend(), "elasticsearch": ElasticsearchBackend()}
+
+
+def backend():
+    """Return the search backend configured by `SEARCH_BACKEND`."""
+    return BACKENDS[current_app.config["SEARCH_BACKEND"]]
+
+
+def search(fields, q, limit, offset=0):
+    """Return the instances whose field best matches `q`, best first, among
+    the `(model, field)` pairs of `fields`, skipping the `offset` first."""
+    if not 0 <= limit <= MAX_LIMIT:
+        raise ValueError(f"'limit' must be between 0 and {MAX_LIMIT}.")
+    if not 0 <= offset <= MAX_OFFSET:
+        raise ValueError(f"'offset' must be between 0 and {MAX_OFFSET}.")
+    search_backend = backend()
+    hits = [
+        (score, position, model, id_)
+        for position, (model, field) in enumerate(fields)
+        for score, id_ in search_backend.query(model, field, q, offset + limit)
+    ]
+    hits.sort(key=lambda hit: (-hit[0], hit[1]))
+    hits = hits[offset : offset + limit]
+
+    ids = defaultdict(list)
+    for _, _, model, id_ in hits:
+        ids[model].append(id_)
+    instances = {
+        (model, instance.id): instance
+        for model, model_ids in ids.items()
+        for instance in model.query.filter(model.id.in_(model_ids))
+    }
+    # Documents deleted by other processes may still be indexed.
+    return [
+        instances[model, id_] for _, _, model, id_ in hits if (model, id_) in instances
+    ]
+
+
+class BackendSubscriber:
+    """Keeps the search backend configured in sync with the commits of this
+    process, see `app.indexes.subscribe`."""
+
+    @property
+    def fields(self):
+        return {model: model.__searchable__ for model in searchable_models()}
+
+    def update(self, model, changes):
+        backend().update(model, changes)
+
+    def invalidate(self, model):
+        backend().invalidate(model)
+
+
+indexes.subscribe(BackendSubscriber())
@@ -0,0 +1,305 @@
+"""Typeahead suggestions of restaurant and dish names.
+
+Suggestions are served from an in-memory index of the distinct names, built
+from the database in the background on the first request (see
+`SUGGEST_WARM_UP`) or on the first suggestion, then kept in sync with the
+commits of this process, see `app.indexes.Index`.
+
+Every word of a query must start a word of the names suggested, e.g. "egg cu"
+suggests "Egg Curry". Names are ranked by how many restaurants and dishes
+bear them. The words of a query which start no word of the index are taken
+for typos, and matched to the words within a small edit distance instead,
+looked up by their trigrams.
+"""
+import heapq
+import math
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from itertools import chain, groupby, islice
+
+from app import db, indexes, search
+from app.models import Dish, Restaurant
+
+# The fields suggested.
+FIELDS = {Restaurant: "name", Dish: "name"}
+# Maximum number of suggestions of a query.
+MAX_LIMIT = 50
+# Best names of the prefixes of up to `HEAD_PREFIX` characters, which match
+# too many words to be merged on every keystroke.
+HEAD_PREFIX = 3
+HEAD_SIZE = MAX_LIMIT
+# Maximum number of names checked against all the words of a query, by
+# chunks of `SCAN_CHUNK`.
+MAX_SCANNED = 2048
+SCAN_CHUNK = 256
+# Maximum number of name ids matching a word of a query sorted at once to be
+# scanned, more are merged as they are scanned.
+MERGED_IN_MEMORY = 4096
+# Maximum number of words of the index whose names are counted to find the
+# most selective word of a query.
+COSTED_WORDS = 64
+# Minimum length of the words of a query matched with typos.
+FUZZY_MIN_LENGTH = 5
+# Length from which words of a query are matched with up to 2 typos.
+FUZZY_TWO_TYPOS_LENGTH = 8
+# Maximum number of words of the index matched by a word with typos.
+TYPO_WORDS = 10
+# Words are looked up with typos by the trigrams of their first characters.
+TRIGRAM_POSITIONS = 12
+
+
+def normalize(text):
+    return " ".join(search.tokenize(text))
+
+
+def positional_trigrams(word):
+    """Return the `(first letter, trigram, position)` of `word`. Typos are
+    not looked for in the first letter."""
+    padded = "$$" + word
+    return [
+        (word[0], padded[i : i + 3], i)
+        for i in range(1, min(len(word), TRIGRAM_POSITIONS))
+    ]
+
+
+def prefix_distance(token, word, limit):
+    """Return the edit distance between `token` and the closest prefix of
+    `word`, or `limit + 1` if it is greater than `limit`."""
+    word = word[: len(token) + limit]
+    worst = limit + 1
+    previous = [min(j, worst) for j in range(len(word) + 1)]
+    for i, char in enumerate(token, 1):
+        # Only the distances within `limit` of the diagonal may be small.
+        current = [min(i, worst)] + [worst] * len(word)
+        for j in range(max(i - limit, 1), min(i + limit, len(word)) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char != word[j - 1]),
+            )
+        if min(current) > limit:
+            return worst
+        previous = current
+    return min(previous)
+
+
+class Suggestions:
+    """The distinct names of the index, numbered from the most common one at
+    the time they were built, so that the best names matching a query come
+    first when merging the ascending name ids of its words. Names added since
+    come last."""
+
+    def __init__(self):
+        self.texts = []
+        self.keys = []
+        self.name_ids = {}
+        # Number of rows bearing each name, 0 once none does.
+        self.counts = array("q")
+        # The name id of each row id per model, -1 for none.
+        self.rows = {model: array("q") for model in FIELDS}
+        self.words = []
+        self.postings = {}
+        self.heads = defaultdict(list)
+        self.trigrams = defaultdict(list)
+
+    @classmethod
+    def build(cls, rows):
+        """Return the index of the `(model, id, text)` tuples of `rows`."""
+        counts, texts, row_keys = Counter(), {}, []
+        for model, id_, text in rows:
+            key = normalize(text)
+            if key:
+                counts[key] += 1
+                texts.setdefault(key, text)
+                row_keys.append((model, id_, key))
+        suggestions = cls()
+        for key in sorted(counts, key=lambda key: (-counts[key], len(key), key)):
+            suggestions.add_name(key, texts[key])
+        for model, id_, key in row_keys:
+            suggestions.set_row(model, id_, key)
+        return suggestions
+
+    def add_name(self, key, text):
+        name_id = len(self.texts)
+        self.texts.append(text)
+        # Padded with spaces to look for words in it.
+        self.keys.append(f" {key} ")
+        self.counts.append(0)
+        self.name_ids[key] = name_id
+        for word in set(key.split()):
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = array("q")
+                insort(self.words, word)
+                for trigram in positional_trigrams(word):
+                    self.trigrams[trigram].append(word)
+            postings.append(name_id)
+            for length in range(1, min(len(word), HEAD_PREFIX) + 1):
+                head = self.heads[word[:length]]
+                if len(head) < HEAD_SIZE and (not head or head[-1] != name_id):
+                    head.append(name_id)
+        return name_id
+
+    def set_row(self, model, id_, key, text=None):
+        """Make the row `id_` of `model` bear the name `key`, written `text`,
+        or no name if `key` is empty."""
+        rows = self.rows[model]
+        if id_ >= len(rows):
+            rows.extend([-1] * (id_ + 1 - len(rows)))
+        if rows[id_] >= 0:
+            self.counts[rows[id_]] -= 1
+        rows[id_] = -1
+        if key:
+            name_id = self.name_ids.get(key)
+            if name_id is None:
+                name_id = self.add_name(key, text)
+            self.counts[name_id] += 1
+            rows[id_] = name_id
+
+    def update(self, model, documents):
+        for id_, document in documents.items():
+            text = document[FIELDS[model]] if document else None
+            self.set_row(model, id_, normalize(text), text)
+
+    def word_range(self, token):
+        start = bisect_left(self.words, token)
+        return start, bisect_left(self.words, token + "\uffff", start)
+
+    def typos(self, token):
+        """Return the words of the index, at most `TYPO_WORDS` of them,
+        starting within a typo of `token`, or two for long ones, after the
+        same first letter."""
+        limit = 2 if len(token) >= FUZZY_TWO_TYPOS_LENGTH else 1
+        grams = positional_trigrams(token)
+        # A typo changes at most 3 trigrams, and shifts the next ones by one.
+        threshold = len(grams) - 3 * limit
+        if threshold < 1:
+            return ()
+        shared = Counter()
+        for first, gram, position in grams:
+            for shift in range(max(position - limit, 1), position + limit + 1):
+                shared.update(self.trigrams.get((first, gram, shift), ()))
+        words = []
+        for word, count in shared.most_common(2 * TYPO_WORDS):
+            if count < threshold or len(words) == TYPO_WORDS:
+                break
+            if prefix_distance(token, word, limit) <= limit:
+                words.append(word)
+        return tuple(words)
+
+    def cost(self, matcher):
+        """Estimate the number of names matching `matcher`."""
+        token, start, stop, typos = matcher
+        words = typos or self.words[start:stop]
+        if len(words) > COSTED_WORDS:
+            return math.inf, -len(token)
+        return sum(len(self.postings[word]) for word in words), -len(token)
+
+    def candidates(self, token, start, stop, typos, scan=False):
+        """Return an iterator of the ascending ids of the names with a word
+        starting with `token`, the `start:stop` words, or with one of the
+        `typos`, of which many will be consumed if `scan`."""
+        words = typos or self.words[start:stop]
+        if len(words) == 1:
+            return iter(self.postings[words[0]])
+        if not typos and len(token) <= HEAD_PREFIX:
+            head = self.heads.get(token, [])
+            if len(head) < HEAD_SIZE:
+                return iter(head)
+            rest = (name_id for name_id in self.merge(words) if name_id > head[-1])
+            return chain(head, rest)
+        if scan and self.cost((token, start, stop, typos))[0] <= MERGED_IN_MEMORY:
+            postings = (self.postings[word] for word in words)
+            return iter(sorted(set(chain.from_iterable(postings))))
+        return self.merge(words)
+
+    def merge(self, words):
+        postings = heapq.merge(*(self.postings[word] for word in words))
+        return (name_id for name_id, _ in groupby(postings))
+
+    def match(self, matchers, limit):
+        """Return the ids of the `limit` best names matching all the
+        `(token, start, stop, typos)` of `matchers`.
+
+        Names are scanned from the best ones matching the most selective
+        word of the query, and the others words are checked on at most
+        `MAX_SCANNED` of them.
+        """
+        first, *others = sorted(matchers, key=self.cost)
+        # The names must also contain, for each other word of the query, a
+        # word starting with it, or one of its typos.
+        needles = [
+            [f" {word} " for word in typos] if typos else [f" {token}"]
+            for token, _, _, typos in others
+        ]
+        candidates = self.candidates(*first, scan=bool(others))
+        counts, keys = self.counts, self.keys
+        found, scanned = [], 0
+        while len(found) < limit and (not others or scanned < MAX_SCANNED):
+            chunk = list(islice(candidates, SCAN_CHUNK if others else 2 * limit))
+            if not chunk:
+                break
+            scanned += len(chunk)
+            chunk = [name_id for name_id in chunk if counts[name_id] > 0]
+            for alternatives in needles:
+                if len(alternatives) == 1:
+                    needle = alternatives[0]
+                    chunk = [name_id for name_id in chunk if needle in keys[name_id]]
+                else:
+                    chunk = [
+                        name_id
+                        for name_id in chunk
+                        if any(needle in keys[name_id] for needle in alternatives)
+                    ]
+            found += chunk
+        return found[:limit]
+
+    def suggest(self, prefix, limit):
+        tokens = search.tokenize(prefix)
+        if not tokens or limit <= 0:
+            return []
+        matchers = []
+        for token in tokens:
+            start, stop = self.word_range(token)
+            typos = ()
+            if start == stop:
+                # No word starts with `token`, it may have a typo.
+                if len(token) >= FUZZY_MIN_LENGTH:
+                    typos = self.typos(token)
+                if not typos:
+                    return []
+            matchers.append((token, start, stop, typos))
+        return [self.texts[name_id] for name_id in self.match(matchers, limit)]
+
+
+class Suggester(indexes.Index):
+    """Keeps the `Suggestions` of the database up to date."""
+
+    max_age = "SUGGEST_INDEX_MAX_AGE"
+    fields = {model: (field,) for model, field in FIELDS.items()}
+
+    def build(self):
+        rows = (
+            (model, id_, text)
+            for model, field in FIELDS.items()
+            for id_, text in db.session.query(
+                model.id, getattr(model, field)
+            ).yield_per(10000)
+        )
+        return Suggestions.build(rows)
+
+    def apply(self, suggestions, model, changes):
+        suggestions.update(model, changes.documents())
+
+    def suggest(self, prefix, limit):
+        """Return the at most `limit` best names starting like `prefix`."""
+        if not 0 <= limit <= MAX_LIMIT:
+            raise ValueError(f"'limit' must be between 0 and {MAX_LIMIT}.")
+        self.refresh()
+        with self.lock:
+            return self.data.suggest(prefix, limit)
+
+
+suggester = Suggester()
+indexes.subscribe(suggester)
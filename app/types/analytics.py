@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+import graphene
+
+from app.analytics import analytics
+from app.loaders import get_loaders
+from app.types.restaurant import Restaurant
+from app.types.user import User
+
+UserTotal = namedtuple("UserTotal", "user_id total_amount")
+RestaurantTotal = namedtuple("RestaurantTotal", "restaurant_id order_count")
+DishTotal = namedtuple("DishTotal", "restaurant_id dish_name order_count")
+
+
+class TopUser(graphene.ObjectType):
+    user = graphene.Field(User)
+    total_amount = graphene.Float(description="Total amount of the orders.")
+
+    def resolve_user(self, info):
+        return get_loaders(info).user.load(self.user_id)
+
+
+class TopRestaurant(graphene.ObjectType):
+    restaurant = graphene.Field(Restaurant)
+    order_count = graphene.Int(description="Number of orders.")
+
+    def resolve_restaurant(self, info):
+        return get_loaders(info).restaurant.load(self.restaurant_id)
+
+
+class TopDish(graphene.ObjectType):
+    restaurant = graphene.Field(Restaurant)
+    dish_name = graphene.String()
+    order_count = graphene.Int(description="Number of orders.")
+
+    def resolve_restaurant(self, info):
+        return get_loaders(info).restaurant.load(self.restaurant_id)
+
+
+def top_field(type_, description):
+    return graphene.List(
+        graphene.NonNull(type_),
+        since=graphene.Date(description="First day (UTC), included."),
+        until=graphene.Date(description="Last day (UTC), included."),
+        limit=graphene.Int(default_value=10, description="Number of results."),
+        description=description,
+    )
+
+
+class AnalyticsMixin:
+    top_users = top_field(
+        TopUser, "Users with the highest total amount of orders, best first."
+    )
+    top_restaurants = top_field(
+        TopRestaurant, "Restaurants with the most orders, best first."
+    )
+    top_dishes = top_field(
+        TopDish, "Dishes, by name and restaurant, with the most orders, best first."
+    )
+
+    def resolve_top_users(self, info, since=None, until=None, limit=10):
+        top = analytics.top("users", since, until, limit)
+        return [UserTotal(*result) for result in top]
+
+    def resolve_top_restaurants(self, info, since=None, until=None, limit=10):
+        top = analytics.top("restaurants", since, until, limit)
+        return [RestaurantTotal(key, int(count)) for key, count in top]
+
+    def resolve_top_dishes(self, info, since=None, until=None, limit=10):
+        top = analytics.top("dishes", since, until, limit)
+        return [DishTotal(*key, int(count)) for key, count in top]
@@ -0,0 +1,222 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from flask import current_app
+from graphene.relay.connection import PageInfo
+from graphene_sqlalchemy import SQLAlchemyConnectionField
+from sqlalchemy import and_, or_
+from sqlalchemy.orm.query import Query
+from sqlalchemy.sql import operators
+
+CURSOR_PREFIX = "keyset:"
+
+
+def to_cursor(key):
+    """Encode the sort key of a row into an opaque cursor."""
+    return base64.b64encode((CURSOR_PREFIX + json.dumps(key)).encode()).decode()
+
+
+def from_cursor(cursor):
+    """Decode a cursor created by `to_cursor` back into a sort key."""
+    try:
+        decoded = base64.b64decode(cursor, validate=True).decode()
+        if decoded.startswith(CURSOR_PREFIX):
+            return json.loads(decoded[len(CURSOR_PREFIX) :])
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        pass
+    raise ValueError(f"Invalid cursor {cursor!r}.")
+
+
+def page_size(args):
+    """Return the `first` and `last` arguments of a connection, `first`
+    defaulting to `QUERY_DEFAULT_LIST_SIZE` when neither is given, so that a
+    connection never returns more items than its cost accounts for."""
+    first, last = args.get("first"), args.get("last")
+    if (first is not None and first < 0) or (last is not None and last < 0):
+        raise ValueError("'first' and 'last' cannot be negative.")
+    config = current_app.config
+    max_size = config["QUERY_MAX_PAGE_SIZE"]
+    if (first is not None and first > max_size) or (
+        last is not None and last > max_size
+    ):
+        raise ValueError(f"'first' and 'last' cannot exceed {max_size}.")
+    if first is None and last is None:
+        first = config["QUERY_DEFAULT_LIST_SIZE"]
+    return first, last
+
+
+def id_page(args):
+    """Return the `(first, last, after, before)` arguments of a connection
+    ordered by id, with the cursors decoded to ids, e.g. to key a loader."""
+    first, last, after, before = KeysetConnectionField.page_arguments(args, [None])
+    return (
+        first,
+        last,
+        after[0] if after is not None else None,
+        before[0] if before is not None else None,
+    )
+
+
+class IdList(list):
+    """Ascending primary keys of the rows of a connection, as returned by the
+    in-process indexes. They are paginated before any row is loaded."""
+
+
+# The rows of a page of a connection ordered by id, already paginated by
+# `app.loaders` along with the pages of sibling fields.
+Page = namedtuple("Page", ["rows", "has_previous", "has_next"])
+
+
+class KeysetConnectionField(SQLAlchemyConnectionField):
+    """A connection field paginating with keyset semantics: the cursor of a
+    row holds its sort key, and a page is fetched with e.g.
+    `WHERE id > :after ORDER BY id LIMIT :first`. The cost of a page does not
+    depend on its position or on the size of the table.
+
+    Resolvers may return a query, an `IdList`, or a `Page`.
+    """
+
+    @classmethod
+    def resolve_connection(cls, connection_type, model, info, args, resolved):
+        if resolved is None:
+            resolved = cls.get_query(model, info, **args)
+        keys = cls.sort_keys(model, args)
+        if isinstance(resolved, IdList) and (len(keys) > 1 or keys[0][1]):
+            # The ids are in ascending order only, let the database sort them.
+            resolved = model.query.filter(model.id.in_(resolved))
+        if isinstance(resolved, Page):
+            rows, has_previous, has_next = resolved
+        elif isinstance(resolved, IdList):
+            rows, has_previous, has_next = cls.paginate_ids(model, resolved, args)
+        elif isinstance(resolved, Query):
+            rows, has_previous, has_next = cls.paginate_query(resolved, keys, args)
+        else:
+            return super().resolve_connection(
+                connection_type, model, info, args, resolved
+            )
+
+        edges = [
+            connection_type.Edge(node=row, cursor=to_cursor(cls.row_key(row, keys)))
+            for row in rows
+        ]
+        connection = connection_type(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous,
+                has_next_page=has_next,
+            ),
+        )
+        connection.iterable = rows
+        return connection
+
+    @staticmethod
+    def sort_keys(model, args):
+        """Return the `(column, descending)` pairs of the `sort` argument,
+        ending with the primary key so that the order is total.
+
+        The sortable columns of the models are not nullable, so NULLs are not
+        accounted for in the keyset predicates.
+        """
+        keys, names = [], set()
+        for value in args.get("sort") or []:
+            expression = getattr(value, "value", value)
+            column = expression.element
+            if column.key not in names:
+                names.add(column.key)
+                keys.append((column, expression.modifier is operators.desc_op))
+        if "id" not in names:
+            keys.append((model.__table__.c.id, False))
+        return keys
+
+    @staticmethod
+    def row_key(row, keys):
+        return [getattr(row, column.key) for column, _ in keys]
+
+    @staticmethod
+    def page_arguments(args, keys):
+        first, last = page_size(args)
+        cursors = []
+        for name in ("after", "before"):
+            cursor = args.get(name)
+            key = from_cursor(cursor) if cursor is not None else None
+            if key is not None and (not isinstance(key, list) or len(key) != len(keys)):
+                raise ValueError(f"Invalid cursor {cursor!r}.")
+            cursors.append(key)
+        return (first, last, *cursors)
+
+    @staticmethod
+    def keyset_predicate(keys, values, forward):
+        """Return the predicate selecting the rows after the sort key `values`,
+        or before it if not `forward`:
+        `a > :a OR (a = :a AND b > :b) OR ...`, with `<` for descending keys.
+        """
+        clauses = []
+        for i, ((column, descending), value) in enumerate(zip(keys, values)):
+            equal = [key == v for (key, _), v in zip(keys[:i], values[:i])]
+            after = (column < value) if descending == forward else (column > value)
+            clauses.append(and_(*equal, after))
+        return or_(*clauses)
+
+    @classmethod
+    def paginate_query(cls, query, keys, args):
+        """Return `(rows, has_previous_page, has_next_page)` of the page of
+        `query` selected by `args`, ordered by `keys`."""
+        first, last, after, before = cls.page_arguments(args, keys)
+        if after is not None:
+            query = query.filter(cls.keyset_predicate(keys, after, True))
+        if before is not None:
+            query = query.filter(cls.keyset_predicate(keys, before, False))
+        ascending = [c.desc() if desc else c.asc() for c, desc in keys]
+        descending = [c.asc() if desc else c.desc() for c, desc in keys]
+
+        if first is None:
+            # Paginating backwards: fetch the last rows in reverse.
+            rows = query.order_by(*descending).limit(last + 1).all()
+        else:
+            rows = query.order_by(*ascending).limit(first + 1).all()
+        return cls.trim(rows, first, last)
+
+    @staticmethod
+    def trim(rows, first, last):
+        """Return `(rows, has_previous_page, has_next_page)` of a page from
+        its first `first + 1` rows, or from its last `last + 1` rows in
+        reverse order when `first` is None."""
+        if first is None:
+            return rows[:last][::-1], len(rows) > last, False
+        has_next = len(rows) > first
+        rows = rows[:first]
+        if last is not None and len(rows) > last:
+            return rows[-last:] if last else [], True, has_next
+        return rows, False, has_next
+
+    @classmethod
+    def paginate_ids(cls, model, ids, args):
+        """Like `paginate_query`, for the ascending ids of an `IdList`."""
+        keys = [(model.__table__.c.id, False)]
+        first, last, after, before = cls.page_arguments(args, keys)
+        start = bisect_right(ids, after[0]) if after is not None else 0
+        stop = bisect_left(ids, before[0], start) if before is not None else len(ids)
+
+        has_previous = has_next = False
+        if first is not None and stop - start > first:
+            stop, has_next = start + first, True
+        if last is not None and stop - start > last:
+            start, has_previous = stop - last, True
+
+        page = ids[start:stop]
+        if not page:
+            return [], has_previous, has_next
+        rows = model.query.filter(model.id.in_(page)).order_by(model.id).all()
+        return rows, has_previous, has_next
+
+
+def relationship_connection_field(relationship, registry, **field_kwargs):
+    """`connection_field_factory` of the types with relationship lists, whose
+    resolvers return the `Page`s loaded by `app.loaders`, ordered by id."""
+    model_type = registry.get_type_for_model(relationship.mapper.entity)
+    return KeysetConnectionField(model_type.connection, sort=None, **field_kwargs)
@@ -1,8 +1,11 @@
 import graphene
+from flask import current_app
 from graphene import relay
 from graphene_sqlalchemy import SQLAlchemyConnectionField, SQLAlchemyObjectType
+from sqlalchemy.orm import joinedload
 
-from app import models, utils
+from app import group_commit, models, utils
+from app.loaders import get_loaders
 
 
 class PurchaseOrder(SQLAlchemyObjectType):
@@ -10,6 +13,16 @@ class PurchaseOrder(SQLAlchemyObjectType):
         model = models.PurchaseOrder
         interfaces = (relay.Node,)
 
+    def resolve_restaurant(self, info):
+        if self.restaurant_id is None:
+            return None
+        return get_loaders(info).restaurant.load(self.restaurant_id)
+
+    def resolve_user(self, info):
+        if self.user_id is None:
+            return None
+        return get_loaders(info).user.load(self.user_id)
+
 
 class PurchaseInput(graphene.InputObjectType):
     """Arguments to ceate a new purchase order."""
@@ -43,6 +56,48 @@ class Purchase(graphene.Mutation):
         if user is None or dish is None:
             raise ValueError("invalid dish/user id.")
 
-        order = models.PurchaseOrder.create_for(user, dish)
+        if current_app.config["GROUP_COMMIT"]:
+            order = group_commit.purchases.submit(user, dish)
+        else:
+            order = models.PurchaseOrder.create_for(user, dish)
 
         return Purchase(order=order)
+
+
+class PurchaseMany(graphene.Mutation):
+    """
+    Mutation to add several purchase orders at once, e.g. for a cart. Either
+    all of them are created, or none."""
+
+    orders = graphene.List(
+        lambda: PurchaseOrder, description="The newly created purchase orders."
+    )
+
+    class Arguments:
+        input = graphene.List(graphene.NonNull(PurchaseInput), required=True)
+
+    def mutate(self, info, input):
+        try:
+            ids = [
+                (int(data["user_id"]), int(data["dish_id"]))
+                for data in map(utils.input_to_dictionary, input)
+            ]
+        except (UnicodeDecodeError, ValueError) as e:
+            raise ValueError("invalid dish/user id.") from e
+
+        user_ids = {user_id for user_id, _ in ids}
+        dish_ids = {dish_id for _, dish_id in ids}
+        users = models.User.query.filter(models.User.id.in_(user_ids))
+        users = {user.id: user for user in users}
+        dishes = models.Dish.query.options(joinedload(models.Dish.restaurant)).filter(
+            models.Dish.id.in_(dish_ids)
+        )
+        dishes = {dish.id: dish for dish in dishes}
+        if len(users) != len(user_ids) or len(dishes) != len(dish_ids):
+            raise ValueError("invalid dish/user id.")
+
+        orders = models.PurchaseOrder.create_many(
+            [(users[user_id], dishes[dish_id]) for user_id, dish_id in ids]
+        )
+
+        return PurchaseMany(orders=orders)
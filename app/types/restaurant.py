@@ -1,8 +1,16 @@
 import graphene
+from flask import current_app
 from graphene import relay
-from graphene_sqlalchemy import SQLAlchemyConnectionField, SQLAlchemyObjectType
+from graphene_sqlalchemy import SQLAlchemyObjectType
 
-from app import models
+from app import cache, indexes, models, search, suggest
+from app.loaders import get_loaders
+from app.types.connection import (
+    IdList,
+    KeysetConnectionField,
+    id_page,
+    relationship_connection_field,
+)
 
 
 class Dish(SQLAlchemyObjectType):
@@ -10,15 +18,44 @@ class Dish(SQLAlchemyObjectType):
         model = models.Dish
         interfaces = (relay.Node,)
 
+    def resolve_restaurant(self, info):
+        if self.restaurant_id is None:
+            return None
+        return get_loaders(info).restaurant.load(self.restaurant_id)
+
+
+class DailyRevenue(SQLAlchemyObjectType):
+    class Meta:
+        model = models.RestaurantRevenue
+        exclude_fields = ("restaurant_id",)
+
 
 class Restaurant(SQLAlchemyObjectType):
     class Meta:
         model = models.Restaurant
         interfaces = (relay.Node,)
+        connection_field_factory = relationship_connection_field
+
+    daily_revenue = graphene.List(
+        graphene.NonNull(DailyRevenue),
+        since=graphene.Date(description="First day, included."),
+        until=graphene.Date(description="Last day, included."),
+        description="Number and total amount of the orders of each day (UTC) "
+        "with orders, by ascending day.",
+    )
+
+    def resolve_daily_revenue(self, info, since=None, until=None):
+        return get_loaders(info).restaurant_revenue.load((self.id, since, until))
+
+    def resolve_dishes(self, info, **kwargs):
+        return get_loaders(info).restaurant_dishes.load((self.id, id_page(kwargs)))
+
+    def resolve_purchase(self, info, **kwargs):
+        return get_loaders(info).restaurant_purchases.load((self.id, id_page(kwargs)))
 
 
 class RestaurantMixin:
-    restaurants = SQLAlchemyConnectionField(
+    restaurants = KeysetConnectionField(
         Restaurant.connection,
         open_at=graphene.DateTime(
             description="datetime at which you want to filter the datetime"
@@ -37,6 +74,9 @@ class RestaurantMixin:
     def resolve_restaurants(_root, _info, **kwargs):
         """returns restaurants open at the given `open_at` time, and
         restaurants that have number of dishes within a price range.
+
+        When both are given, only restaurants matching all the filters are
+        returned.
         """
         open_at = kwargs.get("open_at")
 
@@ -44,21 +84,65 @@ class RestaurantMixin:
         min_dish_price = kwargs.get("min_dish_price")
         max_dishes = kwargs.get("max_dishes")
         min_dishes = kwargs.get("min_dishes")
-
-        if open_at is not None:
-            return models.Restaurant.query_open_at(open_at)
-
-        if (
+        within_range = (
             min_dish_price is not None
             or max_dish_price is not None
             or min_dishes is not None
             or max_dishes is not None
-        ):
-            return models.Restaurant.query_within_range(
+        )
+        if within_range:
+            models.Restaurant.validate_range(
                 min_dish_price, max_dish_price, min_dishes, max_dishes
             )
 
-        return models.Restaurant.query.all()
+        filters = (open_at, min_dish_price, max_dish_price, min_dishes, max_dishes)
+        if (open_at is not None or within_range) and current_app.config[
+            "RESULT_CACHE_SIZE"
+        ]:
+            key = cache.restaurants_key(*filters)
+            return IdList(
+                cache.restaurants.get(key, lambda: filtered_restaurant_ids(*filters))
+            )
+        return filter_restaurants(*filters)
+
+
+def filter_restaurants(open_at, min_dish_price, max_dish_price, min_dishes, max_dishes):
+    """Return the query, or the `IdList`, of the restaurants matching the
+    given filters of `restaurants`."""
+    within_range = min_dishes is not None or max_dishes is not None
+    config = current_app.config
+    if (open_at is None or config["OPEN_AT_INDEX"]) and (
+        not within_range or config["PRICE_INDEX"]
+    ):
+        id_lists = []
+        if open_at is not None:
+            id_lists.append(indexes.open_at.restaurant_ids(open_at))
+        if within_range:
+            id_lists.append(
+                indexes.prices.restaurant_ids_within_range(
+                    min_dish_price, max_dish_price, min_dishes, max_dishes
+                )
+            )
+        if id_lists:
+            return IdList(indexes.intersect(*id_lists))
+
+    query = models.Restaurant.query
+    if open_at is not None:
+        query = models.Restaurant.query_open_at(open_at, query)
+    if within_range:
+        query = models.Restaurant.query_within_range(
+            min_dish_price, max_dish_price, min_dishes, max_dishes, query
+        )
+    return query
+
+
+def filtered_restaurant_ids(*filters):
+    """Return the ascending ids of the restaurants matching the filters."""
+    restaurants = filter_restaurants(*filters)
+    if isinstance(restaurants, IdList):
+        return restaurants
+    query = restaurants.with_entities(models.Restaurant.id)
+    return [id_ for (id_,) in query.order_by(models.Restaurant.id)]
 
 
 class SearchResult(graphene.Union):
@@ -67,10 +151,32 @@ class SearchResult(graphene.Union):
 
 
 class SearchMixin:
-    search = graphene.List(SearchResult, q=graphene.String())
+    search = graphene.List(
+        SearchResult,
+        q=graphene.String(),
+        limit=graphene.Int(
+            default_value=20, description="Number of results, at most 100."
+        ),
+        offset=graphene.Int(
+            default_value=0, description="Number of results to skip, at most 1000."
+        ),
+    )
+
+    def resolve_search(self, info, q=None, limit=20, offset=0):
+        """returns the restaurants and dishes whose name best match `q`, best
+        first."""
+        if not q:
+            return []
+        fields = [(models.Restaurant, "name"), (models.Dish, "name")]
+        return search.search(fields, q, limit, offset)
+
+    suggest = graphene.List(
+        graphene.String,
+        prefix=graphene.String(required=True),
+        limit=graphene.Int(default_value=10, description="Number of suggestions."),
+    )
 
-    def resolve_search(self, info, **args):
-        q = args.get("q")
-        restaurants = models.Restaurant.search("name", q)
-        dishes = models.Dish.search("name", q)
-        return restaurants + dishes
+    def resolve_suggest(self, info, prefix, limit=10):
+        """returns the restaurant and dish names starting like `prefix`, for
+        typeahead."""
+        return suggest.suggester.suggest(prefix, limit)
@@ -1,20 +1,41 @@
 import graphene
 from graphene import relay
-from graphene_sqlalchemy import SQLAlchemyConnectionField, SQLAlchemyObjectType
+from graphene_sqlalchemy import SQLAlchemyObjectType
 
 from app import models
+from app.loaders import get_loaders
+from app.types.connection import (
+    KeysetConnectionField,
+    id_page,
+    relationship_connection_field,
+)
 
 
 class User(SQLAlchemyObjectType):
     class Meta:
         model = models.User
         interfaces = (relay.Node,)
+        connection_field_factory = relationship_connection_field
+
+    order_count = graphene.Int(description="Number of orders of the user.")
+    total_spent = graphene.Float(description="Total amount of the orders of the user.")
+
+    def resolve_purchase(self, info, **kwargs):
+        return get_loaders(info).user_purchases.load((self.id, id_page(kwargs)))
+
+    def resolve_order_count(self, info):
+        spending = get_loaders(info).user_spending.load(self.id)
+        return spending.then(lambda spending: spending.order_count if spending else 0)
+
+    def resolve_total_spent(self, info):
+        spending = get_loaders(info).user_spending.load(self.id)
+        return spending.then(lambda spending: spending.total_amount if spending else 0)
 
 
 class UserMixin:
-    users = SQLAlchemyConnectionField(
+    users = KeysetConnectionField(
         User.connection,
     )
 
     def resolve_users(self, _info, **kwargs):
-        return models.User.query.all()
+        return models.User.query
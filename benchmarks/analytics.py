@@ -0,0 +1,115 @@
+"""Benchmark of the top users, restaurants and dishes of `app.analytics`, on
+generated orders spread over three years, for date ranges of a day up to all
+of them.
+
+    $ python -m benchmarks.analytics [number of orders]
+
+Orders are written to a temporary SQLite file first, which takes a few
+minutes for the default 10 million orders.
+"""
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DATABASE
+
+from app import app, db  # noqa: E402
+from app.analytics import DIMENSIONS, analytics  # noqa: E402
+from app.models import PurchaseOrder  # noqa: E402
+
+FIRST_DAY = date(2019, 1, 1)
+DAYS = 3 * 365
+DISHES_PER_RESTAURANT = 10
+CHUNK_SIZE = 50000
+RANGES = {"day": 1, "week": 7, "month": 30, "quarter": 91, "year": 365, "all": None}
+QUERIES = 20
+
+
+def power_law(count):
+    """Return cumulated weights of `count` items following a power law, like
+    the activity of users and the popularity of restaurants."""
+    return list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(count)))
+
+
+def seed(orders):
+    users, restaurants = orders // 100, orders // 1000
+    user_weights, restaurant_weights = power_law(users), power_law(restaurants)
+    dish_weights = power_law(DISHES_PER_RESTAURANT)
+    prices = [random.randint(5, 50) for _ in range(restaurants)]
+    start = datetime.combine(FIRST_DAY, datetime.min.time())
+    for offset in range(0, orders, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, orders - offset)
+        user_ids = random.choices(range(1, users + 1), cum_weights=user_weights, k=size)
+        restaurant_ids = random.choices(
+            range(1, restaurants + 1), cum_weights=restaurant_weights, k=size
+        )
+        dishes = random.choices(
+            range(DISHES_PER_RESTAURANT), cum_weights=dish_weights, k=size
+        )
+        rows = [
+            {
+                "user_id": user_id,
+                "restaurant_id": restaurant_id,
+                "restaurant_name": f"Restaurant {restaurant_id}",
+                "dish_name": f"Dish {dish}",
+                "transaction_amount": prices[restaurant_id - 1] + dish,
+                "transaction_date": start
+                + timedelta(seconds=random.randrange(DAYS * 24 * 3600)),
+            }
+            for user_id, restaurant_id, dish in zip(user_ids, restaurant_ids, dishes)
+        ]
+        db.session.execute(PurchaseOrder.__table__.insert(), rows)
+        db.session.commit()
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99)]
+    print(
+        f"{name:<24}p50 {statistics.median(timings) * 1e3:8.3f} ms"
+        f"    p99 {p99 * 1e3:8.3f} ms    max {timings[-1] * 1e3:8.3f} ms"
+    )
+
+
+def main(orders):
+    random.seed(0)
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(orders)
+        print(f"{orders} orders written in {time.perf_counter() - start:.0f} s")
+
+        start = time.perf_counter()
+        analytics.rebuild()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(
+            f"totals built in {time.perf_counter() - start:.1f} s, "
+            f"max RSS {rss:.0f} MiB"
+        )
+
+        for label, days in RANGES.items():
+            for name in DIMENSIONS:
+                timings = []
+                for _ in range(QUERIES):
+                    since = until = None
+                    if days is not None:
+                        since = FIRST_DAY + timedelta(random.randrange(DAYS - days))
+                        until = since + timedelta(days - 1)
+                    start = time.perf_counter()
+                    analytics.top(name, since, until, 10)
+                    timings.append(time.perf_counter() - start)
+                report(f"{name} / {label}", timings)
+
+
+if __name__ == "__main__":
+    try:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000)
+    finally:
+        os.remove(DATABASE)
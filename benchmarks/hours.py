@@ -0,0 +1,80 @@
+"""Micro-benchmark of `app.hours.parse_schedule` against the previous
+strptime based parser.
+
+    $ python -m benchmarks.hours
+"""
+import timeit
+from datetime import datetime
+
+from app.hours import _parse_schedule, parse_schedule
+
+HOURS = [
+    "Mon, Weds 11:45 am - 4:45 pm / Tues 7:45 am - 2 am / Thurs 5:45 pm - 12 am / "
+    "Fri, Sun 6 am - 9 pm / Sat 10:15 am - 9 pm",
+    "Sun - Tues, Thurs - Fri 10:15 am - 9 pm / Weds 12:30 pm - 3:30 pm / "
+    "Sat 10 am - 7:30 pm",
+    "Mon, Wed-Sun 11 am - 10 pm",
+]
+NUMBER = 20000
+
+
+def legacy_parse_schedule(hours):
+    """The parser used before `app.hours`, kept here as the baseline."""
+
+    def strptime(dt):
+        try:
+            return datetime.strptime(dt, "%I:%M%p").time()
+        except ValueError:
+            return datetime.strptime(dt, "%I%p").time()
+
+    def parse_weekday(weekday_string):
+        return {
+            "MON": 0,
+            "TUES": 1,
+            "WEDS": 2,
+            "WED": 2,
+            "THU": 3,
+            "THURS": 3,
+            "FRI": 4,
+            "SAT": 5,
+            "SUN": 6,
+        }.get(weekday_string.upper())
+
+    schedule = {}
+    for day in hours.split("/"):
+        d = day.split()
+        opens_at, closes_at = "".join(d[-5:]).split("-")
+        opens_at, closes_at = strptime(opens_at), strptime(closes_at)
+        value = (opens_at, closes_at, closes_at < opens_at)
+        for group in "".join(d[:-5]).split(","):
+            if "-" in group:
+                start, end = [parse_weekday(p.strip()) for p in group.split("-")]
+                for offset in range((end - start) % 7 + 1):
+                    schedule[(start + offset) % 7] = value
+            else:
+                schedule[parse_weekday(group.strip())] = value
+    return schedule
+
+
+def uncached_parse_schedule(hours):
+    return dict(_parse_schedule.__wrapped__(hours))
+
+
+def main():
+    for hours in HOURS:
+        assert legacy_parse_schedule(hours) == parse_schedule(hours), hours
+
+    baseline = None
+    for name, parse in [
+        ("legacy (strptime)", legacy_parse_schedule),
+        ("single pass", uncached_parse_schedule),
+        ("single pass, memoized", parse_schedule),
+    ]:
+        seconds = timeit.timeit(lambda: [parse(h) for h in HOURS], number=NUMBER)
+        per_call = seconds / (NUMBER * len(HOURS)) * 1e6
+        baseline = baseline or per_call
+        print(f"{name:<24}{per_call:8.2f} us/call {baseline / per_call:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Stress benchmark of `PurchaseOrder.create_for`, with threads purchasing
+dishes from a handful of restaurants for a handful of users concurrently,
+then checking that no cash was lost or overdrawn.
+
+    $ python -m benchmarks.purchases [number of threads] [purchases per thread]
+
+Pass `--group-commit` to commit concurrent purchases together, see
+`app.group_commit`.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DATABASE
+
+from app import app, db, group_commit, metrics  # noqa: E402
+from app.models import Dish, PurchaseOrder, Restaurant, User  # noqa: E402
+
+USERS = 10
+RESTAURANTS = 5
+CASH_BALANCE = 500
+
+
+def seed():
+    restaurants = [
+        Restaurant(name=f"Restaurant {i}", cash_balance=0) for i in range(RESTAURANTS)
+    ]
+    users = [User(name=f"User {i}", cash_balance=CASH_BALANCE) for i in range(USERS)]
+    db.session.add_all(restaurants + users)
+    db.session.flush()
+    dishes = [
+        Dish(name=f"Dish {i}", price=1 + i % 5, restaurant_id=restaurant.id)
+        for i, restaurant in enumerate(restaurants * 4)
+    ]
+    db.session.add_all(dishes)
+    db.session.commit()
+    return [user.id for user in users], [dish.id for dish in dishes]
+
+
+def purchase(user_ids, dish_ids, attempts):
+    completed = refused = 0
+    rng = random.Random()
+    with app.app_context():
+        for _ in range(attempts):
+            user = User.query.get(rng.choice(user_ids))
+            dish = Dish.query.get(rng.choice(dish_ids))
+            try:
+                if app.config["GROUP_COMMIT"]:
+                    group_commit.purchases.submit(user, dish)
+                else:
+                    PurchaseOrder.create_for(user, dish)
+                completed += 1
+            except ValueError:
+                refused += 1
+        db.session.remove()
+    return completed, refused
+
+
+def main(threads, attempts):
+    with app.app_context():
+        db.create_all()
+        user_ids, dish_ids = seed()
+        db.session.remove()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(
+                executor.map(
+                    purchase,
+                    [user_ids] * threads,
+                    [dish_ids] * threads,
+                    [attempts] * threads,
+                )
+            )
+        seconds = time.perf_counter() - start
+
+        completed = sum(result[0] for result in results)
+        refused = sum(result[1] for result in results)
+        print(f"{threads} threads, {completed} purchases, {refused} refused")
+        print(f"{completed / seconds:.0f} purchases/second")
+
+        spent = (
+            USERS * CASH_BALANCE
+            - db.session.query(db.func.sum(User.cash_balance)).scalar()
+        )
+        earned = db.session.query(db.func.sum(Restaurant.cash_balance)).scalar()
+        ordered = db.session.query(
+            db.func.sum(PurchaseOrder.transaction_amount)
+        ).scalar()
+        negative = User.query.filter(User.cash_balance < 0).count()
+        assert spent == earned == ordered, (spent, earned, ordered)
+        assert negative == 0
+        print("balances are consistent")
+        if app.config["GROUP_COMMIT"]:
+            for name, summary in metrics.snapshot().items():
+                print(f"{name}: mean {summary['mean']:.4f}, max {summary['max']:.4f}")
+
+
+if __name__ == "__main__":
+    arguments = [argument for argument in sys.argv[1:] if argument != "--group-commit"]
+    app.config["GROUP_COMMIT"] = "--group-commit" in sys.argv
+    try:
+        main(
+            int(arguments[0]) if len(arguments) > 0 else 8,
+            int(arguments[1]) if len(arguments) > 1 else 200,
+        )
+    finally:
+        os.remove(DATABASE)
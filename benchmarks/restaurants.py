@@ -0,0 +1,82 @@
+"""Benchmark of the `restaurants` filters, comparing SQL with the in-process
+indexes of `app.indexes` on a generated catalog.
+
+    $ python -m benchmarks.restaurants [number of restaurants]
+"""
+import os
+import random
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DATABASE
+
+from app import app, db, indexes, load  # noqa: E402
+from app.models import Restaurant  # noqa: E402
+
+HOURS = [
+    "Mon - Sun 11 am - 10 pm",
+    "Mon, Weds 11:45 am - 4:45 pm / Tues 7:45 am - 2 am / Sun 5:45 pm - 12 am",
+    "Sat - Sun 9 pm - 3:30 am / Tues 12 pm - 12:15 pm",
+    "Fri 6 am - 9 pm / Sat 10:15 am - 9 pm / Sun 11 pm - 11:30 pm",
+    "Mon - Fri 7 am - 9:30 am / Sat, Sun 10 am - 4 pm",
+]
+NUMBER = 200
+
+
+def seed(restaurants):
+    random.seed(0)
+    load.add_restaurants(
+        {
+            "restaurantName": f"Restaurant {i}",
+            "cashBalance": 0,
+            "menu": [
+                {"dishName": f"Dish {j}", "price": round(random.uniform(1, 50), 2)}
+                for j in range(random.randint(1, 30))
+            ],
+            "openingHours": random.choice(HOURS),
+        }
+        for i in range(restaurants)
+    )
+
+
+def report(name, function):
+    seconds = timeit.timeit(function, number=NUMBER) / NUMBER
+    print(f"{name:<32}{seconds * 1e6:12.1f} us")
+
+
+def main(restaurants):
+    with app.app_context():
+        db.create_all()
+        seed(restaurants)
+        print(f"{restaurants} restaurants")
+
+        times = [
+            datetime(2022, 2, 14) + timedelta(minutes=random.randrange(7 * 24 * 60))
+            for _ in range(NUMBER)
+        ]
+        at = iter(times)
+        report("openAt, SQL", lambda: Restaurant.query_open_at(next(at)).all())
+        indexes.open_at.refresh()
+        at = iter(times)
+        report("openAt, index", lambda: indexes.open_at.restaurant_ids(next(at)))
+
+        arguments = (10, 15, 3, None)
+        report(
+            "price range, SQL",
+            lambda: Restaurant.query_within_range(*arguments).all(),
+        )
+        indexes.prices.refresh()
+        report(
+            "price range, index",
+            lambda: indexes.prices.restaurant_ids_within_range(*arguments),
+        )
+
+
+if __name__ == "__main__":
+    try:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
+    finally:
+        os.remove(DATABASE)
@@ -0,0 +1,84 @@
+"""Benchmark of the `suggest` index of `app.suggest` on generated dish names,
+typing queries one keystroke at a time, with and without typos.
+
+    $ python -m benchmarks.suggest [number of dishes]
+"""
+import random
+import statistics
+import sys
+import time
+from itertools import accumulate, islice
+
+from app.models import Dish
+from app.suggest import Suggestions
+
+SYLLABLES = [
+    consonant + vowel
+    for consonant in "bcdfghklmnprstvz"
+    for vowel in ["a", "e", "i", "o", "u", "ai", "ou"]
+]
+QUERIES = 2000
+
+
+def vocabulary(size):
+    words = set()
+    while len(words) < size:
+        words.add("".join(random.choices(SYLLABLES, k=random.randint(2, 4))))
+    words = sorted(words)
+    random.shuffle(words)
+    return words
+
+
+def dish_names(count, words):
+    # Word and name frequencies follow a power law, like real menus.
+    weights = list(accumulate(1 / (rank + 1) for rank in range(len(words))))
+    lengths = [random.randint(1, 4) for _ in range(count // 4)]
+    drawn = iter(random.choices(words, cum_weights=weights, k=sum(lengths)))
+    names = [" ".join(islice(drawn, length)) for length in lengths]
+    weights = list(accumulate(1 / (rank + 1) for rank in range(len(names))))
+    return random.choices(names, cum_weights=weights, k=count)
+
+
+def typo(word):
+    position = random.randrange(1, len(word))
+    return word[:position] + random.choice("aeioubcdfg") + word[position + 1 :]
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99)]
+    print(
+        f"{name:<24}p50 {statistics.median(timings) * 1e3:8.3f} ms"
+        f"    p99 {p99 * 1e3:8.3f} ms    max {timings[-1] * 1e3:8.3f} ms"
+    )
+
+
+def main(dishes):
+    random.seed(0)
+    names = dish_names(dishes, vocabulary(20000))
+    start = time.perf_counter()
+    suggestions = Suggestions.build((Dish, i, name) for i, name in enumerate(names))
+    print(
+        f"{dishes} dishes, {len(suggestions.texts)} distinct names, "
+        f"{len(suggestions.words)} words, built in "
+        f"{time.perf_counter() - start:.1f} s"
+    )
+
+    keystrokes, typos = [], []
+    for name in random.sample(names, QUERIES):
+        keystrokes.extend(name[:length] for length in range(1, len(name) + 1))
+        words = name.split()
+        words[-1] = typo(words[-1]) if len(words[-1]) > 5 else words[-1]
+        typos.append(" ".join(words))
+
+    for label, queries in [("keystrokes", keystrokes), ("typos", typos)]:
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            suggestions.suggest(query, 10)
+            timings.append(time.perf_counter() - start)
+        report(label, timings)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
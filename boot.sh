@@ -2,4 +2,7 @@
 
 poetry run flask db upgrade
 poetry run flask translate compile
-exec poetry run gunicorn -b :5000 --access-logfile - --error-logfile - frenzy:app
+# More than one thread per worker switches gunicorn to threaded workers,
+# required for GROUP_COMMIT to batch concurrent purchases.
+exec poetry run gunicorn -b :5000 --threads "${GUNICORN_THREADS:-1}" \
+    --access-logfile - --error-logfile - frenzy:app
@@ -8,7 +8,111 @@ class Config(object):
         "DATABASE_URL"
     ) or "sqlite:///" + os.path.join(basedir, "app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connections kept open by the pool of each worker, plus up to
+    # `DATABASE_MAX_OVERFLOW` more under load, see `app.database`. 0 opens a
+    # connection per checkout instead.
+    DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 5))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+    # Seconds to wait for a connection when all of them are in use.
+    DATABASE_POOL_TIMEOUT = float(os.environ.get("DATABASE_POOL_TIMEOUT", 30))
+    # Seconds after which connections are replaced, e.g. before the server
+    # drops idle ones, -1 to keep them.
+    DATABASE_POOL_RECYCLE = int(os.environ.get("DATABASE_POOL_RECYCLE", 3600))
+    # Test connections as they are checked out, to replace the ones closed
+    # by the server. Not needed for SQLite.
+    DATABASE_POOL_PRE_PING = os.environ.get("DATABASE_POOL_PRE_PING", "1") == "1"
+    # Read replicas of the database, comma separated, from which GraphQL
+    # queries read in turns, see `app.database`.
+    SQLALCHEMY_BINDS = {
+        f"replica{i}": url
+        for i, url in enumerate(os.environ.get("DATABASE_REPLICA_URLS", "").split(","))
+        if url
+    }
+    DATABASE_REPLICAS = list(SQLALCHEMY_BINDS)
+    # Seconds between checks of the replicas, skipped until the next check
+    # if unreachable or lagging more than `DATABASE_REPLICA_MAX_LAG` seconds,
+    # as measured by `DATABASE_REPLICA_LAG_QUERY`. E.g. for PostgreSQL:
+    # "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())".
+    DATABASE_REPLICA_CHECK_INTERVAL = 5
+    DATABASE_REPLICA_MAX_LAG = 10
+    DATABASE_REPLICA_LAG_QUERY = os.environ.get("DATABASE_REPLICA_LAG_QUERY")
+    # Pragmas set on every new SQLite connection. WAL lets readers run
+    # alongside a writer, and writers wait `busy_timeout` ms for each other
+    # rather than failing. Negative cache sizes are in KiB.
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "busy_timeout": 5000,
+        "cache_size": -16384,
+        "mmap_size": 256 * 1024 * 1024,
+    }
     ELASTICSEARCH_URL = os.environ.get("ELASTICSEARCH_URL")
+    # Backend of full-text searches, see `app.search`.
+    SEARCH_BACKEND = "elasticsearch" if ELASTICSEARCH_URL else "local"
+    # Maximum number of documents sent to Elasticsearch per bulk request when
+    # syncing commits.
+    ELASTICSEARCH_CHUNK_SIZE = 500
+    # Seconds to wait for more commits to sync to Elasticsearch along with the
+    # first one.
+    ELASTICSEARCH_SYNC_INTERVAL = 1
+    # Seconds without writes made without the ORM, e.g. by `flask seed-db`,
+    # after which a model is reindexed in Elasticsearch.
+    ELASTICSEARCH_REINDEX_DELAY = 10
+    # Build the index of `suggest` in the background on the first request,
+    # rather than on the first suggestion.
+    SUGGEST_WARM_UP = True
+    # Days per bucket of the order totals ranking users, restaurants and
+    # dishes, see `app.analytics`. Smaller buckets answer more of a date range
+    # from memory, but take more of it.
+    ANALYTICS_BUCKET_DAYS = 14
+    # Date ranges with at most this many orders are ranked by the database
+    # directly.
+    ANALYTICS_SCAN_MAX_ORDERS = 20000
+    # Build the order totals in the background on the first request, rather
+    # than on the first query. Queries are ranked by the database until then.
+    ANALYTICS_WARM_UP = True
+    # Answer `restaurants(openAt: ...)` from an in-process index instead of SQL.
+    OPEN_AT_INDEX = True
+    # Answer the dish price range filters of `restaurants` from an in-process
+    # index instead of SQL.
+    PRICE_INDEX = True
+    # Seconds after which the in-process indexes are rebuilt in the
+    # background, to pick up writes made by other processes, see
+    # `app.indexes.Index`: the ones of `restaurants` filters, of local search,
+    # of `suggest`, and the order totals, slower to build.
+    INDEX_MAX_AGE = 60
+    SEARCH_INDEX_MAX_AGE = 600
+    SUGGEST_INDEX_MAX_AGE = 600
+    ANALYTICS_INDEX_MAX_AGE = 600
+    # Maximum number of filter combinations of `restaurants` whose results
+    # are cached, 0 disables the cache.
+    RESULT_CACHE_SIZE = 1024
+    # Maximum number of restaurant ids held by the cache across entries.
+    RESULT_CACHE_MAX_IDS = 1_000_000
+    # Seconds after which cached results expire, like `INDEX_MAX_AGE`.
+    RESULT_CACHE_MAX_AGE = 60
+    # Number of parsed and validated GraphQL documents kept in memory.
+    DOCUMENT_CACHE_SIZE = 512
+    # Number of persisted queries kept in memory, by hash.
+    PERSISTED_QUERIES_SIZE = 1024
+    # Maximum cost of a GraphQL query, see `app.cost`.
+    QUERY_MAX_COST = 10_000
+    # Maximum nesting of the fields of a GraphQL query.
+    QUERY_MAX_DEPTH = 12
+    # Number of items returned by connections given no `first` or `last`
+    # argument, and assumed for the lists without a `limit`.
+    QUERY_DEFAULT_LIST_SIZE = 100
+    # Maximum `first` or `last` argument of connections.
+    QUERY_MAX_PAGE_SIZE = 1000
+    # Commit concurrent purchases of a worker together, see `app.group_commit`.
+    # Only threaded workers handle concurrent requests, see `boot.sh`: with
+    # sync workers, every purchase would wait `GROUP_COMMIT_INTERVAL` alone.
+    GROUP_COMMIT = False
+    # Seconds to wait for more purchases to commit with the first one.
+    GROUP_COMMIT_INTERVAL = 0.005
+    # Maximum number of purchases committed together.
+    GROUP_COMMIT_SIZE = 64
+    # Seconds after which a queued purchase is made on its own instead.
+    GROUP_COMMIT_TIMEOUT = 5
 
 
 class TestConfig(object):
@@ -16,6 +120,8 @@ class TestConfig(object):
     # DEBUG=True causes pytest to fail.
     # See: https://github.com/ga4gh/ga4gh-server/issues/791
     DEBUG = False
+    SUGGEST_WARM_UP = False
+    ANALYTICS_WARM_UP = False
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         "TEST_DATABASE_URL"
     ) or "sqlite:///" + os.path.join(basedir, "test.db")
@@ -0,0 +1,63 @@
+"""Index the transaction dates of purchase orders, for top-N analytics
+
+Revision ID: 4d8a6e0c2b57
+Revises: 9b2f4c7d1e83
+Create Date: 2026-10-18 14:05:37.120468
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4d8a6e0c2b57"
+down_revision = "9b2f4c7d1e83"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_purchase_order_user_id_transaction_date_transaction_amount",
+        "purchase_order",
+        ["user_id", "transaction_date", "transaction_amount"],
+        unique=False,
+    )
+    op.drop_index(
+        "ix_purchase_order_user_id_transaction_date", table_name="purchase_order"
+    )
+    op.create_index(
+        "ix_purchase_order_restaurant_id_transaction_date_dish_name",
+        "purchase_order",
+        ["restaurant_id", "transaction_date", "dish_name"],
+        unique=False,
+    )
+    op.drop_index("ix_purchase_order_restaurant_id", table_name="purchase_order")
+    op.create_index(
+        "ix_purchase_order_transaction_date",
+        "purchase_order",
+        ["transaction_date"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_purchase_order_transaction_date", table_name="purchase_order")
+    op.create_index(
+        "ix_purchase_order_restaurant_id",
+        "purchase_order",
+        ["restaurant_id"],
+        unique=False,
+    )
+    op.drop_index(
+        "ix_purchase_order_restaurant_id_transaction_date_dish_name",
+        table_name="purchase_order",
+    )
+    op.create_index(
+        "ix_purchase_order_user_id_transaction_date",
+        "purchase_order",
+        ["user_id", "transaction_date"],
+        unique=False,
+    )
+    op.drop_index(
+        "ix_purchase_order_user_id_transaction_date_transaction_amount",
+        table_name="purchase_order",
+    )
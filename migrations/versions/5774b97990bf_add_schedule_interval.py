@@ -0,0 +1,87 @@
+"""Add schedule_interval, minutes of the week during which restaurants are open
+
+Revision ID: 5774b97990bf
+Revises: cc6f22a62e5a
+Create Date: 2026-10-18 09:12:40.118274
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5774b97990bf"
+down_revision = "cc6f22a62e5a"
+branch_labels = None
+depends_on = None
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def week_intervals(weekday, opens_at, closes_at, overnight):
+    # Frozen copy of `app.hours.week_intervals` at the time of this revision.
+    start = weekday * MINUTES_PER_DAY + opens_at.hour * 60 + opens_at.minute
+    end = (weekday + overnight) * MINUTES_PER_DAY + closes_at.hour * 60
+    end += closes_at.minute
+    if end < MINUTES_PER_WEEK:
+        return [(start, end)]
+    return [(start, MINUTES_PER_WEEK - 1), (0, end - MINUTES_PER_WEEK)]
+
+
+def upgrade():
+    schedule_interval = op.create_table(
+        "schedule_interval",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("start_minute", sa.Integer(), nullable=False),
+        sa.Column("end_minute", sa.Integer(), nullable=False),
+        sa.Column("schedule_id", sa.Integer(), nullable=False),
+        sa.Column("restaurant_id", sa.Integer(), nullable=True),
+        sa.CheckConstraint(
+            "0 <= start_minute AND start_minute <= end_minute AND end_minute < 10080",
+            name="interval_within_one_week",
+        ),
+        sa.ForeignKeyConstraint(
+            ["restaurant_id"],
+            ["restaurant.id"],
+        ),
+        sa.ForeignKeyConstraint(["schedule_id"], ["schedule.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_schedule_interval_start_minute_end_minute",
+        "schedule_interval",
+        ["start_minute", "end_minute", "restaurant_id"],
+        unique=False,
+    )
+
+    # Backfill the intervals of existing schedules.
+    schedule = sa.table(
+        "schedule",
+        sa.column("id", sa.Integer),
+        sa.column("weekday", sa.Integer),
+        sa.column("opens_at", sa.Time),
+        sa.column("closes_at", sa.Time),
+        sa.column("overnight", sa.Boolean),
+        sa.column("restaurant_id", sa.Integer),
+    )
+    rows = [
+        {
+            "start_minute": start,
+            "end_minute": end,
+            "schedule_id": row.id,
+            "restaurant_id": row.restaurant_id,
+        }
+        for row in op.get_bind().execute(sa.select(schedule))
+        for start, end in week_intervals(
+            row.weekday, row.opens_at, row.closes_at, row.overnight
+        )
+    ]
+    if rows:
+        op.bulk_insert(schedule_interval, rows)
+
+
+def downgrade():
+    op.drop_index(
+        "ix_schedule_interval_start_minute_end_minute", table_name="schedule_interval"
+    )
+    op.drop_table("schedule_interval")
@@ -0,0 +1,53 @@
+"""Add user_spending and restaurant_revenue, totals of the purchase orders
+
+Revision ID: 9b2f4c7d1e83
+Revises: 1e191b636e25
+Create Date: 2026-10-18 11:20:05.412907
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9b2f4c7d1e83"
+down_revision = "1e191b636e25"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user_spending",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("order_count", sa.Integer(), nullable=False),
+        sa.Column("total_amount", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_table(
+        "restaurant_revenue",
+        sa.Column("restaurant_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("order_count", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["restaurant_id"], ["restaurant.id"]),
+        sa.PrimaryKeyConstraint("restaurant_id", "day"),
+    )
+    # Same as `flask backfill-totals`.
+    op.execute(
+        "INSERT INTO user_spending (user_id, order_count, total_amount) "
+        "SELECT user_id, count(*), sum(transaction_amount) FROM purchase_order "
+        "WHERE user_id IS NOT NULL GROUP BY user_id"
+    )
+    op.execute(
+        "INSERT INTO restaurant_revenue (restaurant_id, day, order_count, revenue) "
+        "SELECT restaurant_id, date(transaction_date), count(*), "
+        "sum(transaction_amount) FROM purchase_order "
+        "WHERE restaurant_id IS NOT NULL "
+        "GROUP BY restaurant_id, date(transaction_date)"
+    )
+
+
+def downgrade():
+    op.drop_table("restaurant_revenue")
+    op.drop_table("user_spending")
@@ -0,0 +1,244 @@
+import json
+import random
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import analytics as analytics_module
+from app import indexes
+from app.analytics import Ranking
+from app.models import Dish, PurchaseOrder, User
+from tests.utils import commit
+
+FIRST_DAY = date(2022, 1, 1)
+
+
+def random_orders(rng, count, days=90):
+    return [
+        PurchaseOrder(
+            user_id=rng.randint(1, 8),
+            restaurant_id=rng.randint(1, 5),
+            restaurant_name="test",
+            dish_name=f"Dish {rng.randint(0, 3)}",
+            # Halves add up exactly.
+            transaction_amount=rng.randint(1, 40) / 2,
+            transaction_date=datetime.combine(
+                FIRST_DAY + timedelta(days=rng.randrange(days)), datetime.min.time()
+            )
+            + timedelta(minutes=rng.randrange(24 * 60)),
+        )
+        for _ in range(count)
+    ]
+
+
+def expected_top(orders, name, since, until, limit):
+    totals = Counter()
+    for order in orders:
+        day = order.transaction_date.date()
+        if (since and day < since) or (until and day > until):
+            continue
+        if name == "users":
+            totals[order.user_id] += order.transaction_amount
+        elif name == "restaurants":
+            totals[order.restaurant_id] += 1
+        else:
+            totals[order.restaurant_id, order.dish_name] += 1
+    ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+
+@pytest.fixture
+def analytics(app, db, monkeypatch):
+    analytics = analytics_module.Analytics()
+    subscribers = [
+        analytics if subscriber is analytics_module.analytics else subscriber
+        for subscriber in indexes.SUBSCRIBERS
+    ]
+    monkeypatch.setattr(indexes, "SUBSCRIBERS", subscribers)
+    monkeypatch.setattr(analytics_module, "analytics", analytics)
+    yield analytics
+    wait_for_build(analytics)
+
+
+def wait_for_build(analytics):
+    with analytics.build_lock:
+        pass
+
+
+@pytest.fixture
+def orders(db):
+    orders = random_orders(random.Random(25), 400)
+    db.session.add_all(orders)
+    db.session.commit()
+    return orders
+
+
+def test_ranking_bounds():
+    orders = [("a", 0, 1), ("a", 5, 2), ("b", 3, 4), ("b", 12, 8)]
+    ranking = Ranking.build(4, orders)
+    assert ranking.keys == ["a", "b"]
+
+    def bounds(start, stop):
+        lower, upper, before, windows = ranking.bounds(start, stop)
+        return lower, upper, [list(totals) for totals in before], windows
+
+    # Days 4 to 7 are within the range, days 0 to 11 overlap it. Days 0 and
+    # 1 are subtracted from the buckets of days 0 to 7, and day 8 added.
+    assert bounds(2, 9) == ([2, 0], [3, 4], [[3, 4], [0, 0]], [(0, 2, -1), (8, 9, 1)])
+    assert bounds(5, 7) == (None, [2, 0], [[3, 4], [1, 4]], [(4, 5, -1), (7, 8, -1)])
+    assert bounds(-10, 100)[:3] == ([3, 12], [3, 12], [[3, 12], [0, 0]])
+
+    ranking.add("c", -3, 16)
+    ranking.add("a", 20, 32)
+    assert bounds(-4, 24)[:2] == ([35, 12, 16], [35, 12, 16])
+    assert bounds(8, 12)[:2] == ([0, 0, 0], [0, 0, 0])
+
+
+@pytest.mark.parametrize("bucket_days", [1, 7, 30])
+def test_top_matches_totals(app, analytics, orders, monkeypatch, bucket_days):
+    monkeypatch.setitem(app.config, "ANALYTICS_BUCKET_DAYS", bucket_days)
+    monkeypatch.setitem(app.config, "ANALYTICS_SCAN_MAX_ORDERS", 0)
+    analytics.rebuild()
+    rng = random.Random(bucket_days)
+    for _ in range(30):
+        since = FIRST_DAY + timedelta(days=rng.randrange(-5, 95))
+        until = since + timedelta(days=rng.randrange(60))
+        limit = rng.randint(1, 6)
+        for name in analytics_module.DIMENSIONS:
+            expected = expected_top(orders, name, since, until, limit)
+            assert analytics.top(name, since, until, limit) == expected
+    assert analytics.top("users", None, None, 100) == expected_top(
+        orders, "users", None, None, 100
+    )
+
+
+def test_small_ranges_are_ranked_by_the_database(app, analytics, orders):
+    since, until = date(2022, 2, 1), date(2022, 2, 3)
+    assert app.config["ANALYTICS_SCAN_MAX_ORDERS"] > len(orders)
+    for name in analytics_module.DIMENSIONS:
+        expected = expected_top(orders, name, since, until, 3)
+        assert analytics.top(name, since, until, 3) == expected
+
+
+def test_totals_are_synced_on_commit(
+    app, db, analytics, orders, restaurant, monkeypatch
+):
+    monkeypatch.setitem(app.config, "ANALYTICS_SCAN_MAX_ORDERS", 0)
+    analytics.rebuild()
+    built_at = analytics.built_at
+    new = random_orders(random.Random(1), 50, days=120)
+    # Before and after all the other orders.
+    new[0].transaction_date = datetime(2021, 6, 1)
+    new[1].transaction_date = datetime(2023, 1, 1)
+    db.session.add_all(new)
+    db.session.commit()
+    orders = orders + new
+    for name in analytics_module.DIMENSIONS:
+        for since, until in [(None, None), (date(2022, 1, 10), date(2022, 3, 20))]:
+            expected = expected_top(orders, name, since, until, 5)
+            assert analytics.top(name, since, until, 5) == expected
+    assert analytics.built_at == built_at
+
+    user = User(id=100, name="test", cash_balance=100)
+    dish = Dish(name="Dish 0", price=99, restaurant_id=restaurant.id)
+    db.session.add_all([user, dish])
+    db.session.commit()
+    PurchaseOrder.create_for(user, dish)
+    orders = orders + user.purchase.all()
+    assert analytics.top("users", None, None, 5) == expected_top(
+        orders, "users", None, None, 5
+    )
+    assert analytics.built_at == built_at
+
+    db.session.add(random_orders(random.Random(2), 1)[0])
+    db.session.rollback()
+    assert analytics.top("restaurants", None, None, 5) == expected_top(
+        orders, "restaurants", None, None, 5
+    )
+
+
+def test_queries_are_ranked_by_the_database_until_built(
+    app, analytics, orders, monkeypatch
+):
+    monkeypatch.setitem(app.config, "ANALYTICS_SCAN_MAX_ORDERS", 0)
+    since, until = date(2022, 1, 10), date(2022, 3, 20)
+    for name in analytics_module.DIMENSIONS:
+        expected = expected_top(orders, name, since, until, 5)
+        assert analytics.top(name, since, until, 5) == expected
+    wait_for_build(analytics)
+    assert analytics.is_built()
+    for name in analytics_module.DIMENSIONS:
+        expected = expected_top(orders, name, since, until, 5)
+        assert analytics.top(name, since, until, 5) == expected
+
+
+def test_totals_are_rebuilt_after_bulk_writes(app, db, analytics, orders, monkeypatch):
+    monkeypatch.setitem(app.config, "ANALYTICS_SCAN_MAX_ORDERS", 0)
+    analytics.rebuild()
+    db.session.execute(
+        PurchaseOrder.__table__.insert(),
+        [
+            {
+                "user_id": 100,
+                "restaurant_id": 1,
+                "restaurant_name": "test",
+                "dish_name": "Dish 0",
+                "transaction_amount": 1000,
+                "transaction_date": datetime(2022, 1, 1),
+            }
+        ],
+    )
+    db.session.commit()
+    assert not analytics.is_built()
+    assert analytics.top("users", None, None, 1) == [(100, 1000)]
+    wait_for_build(analytics)
+    assert analytics.is_built()
+    assert analytics.top("users", None, None, 1) == [(100, 1000)]
+
+
+def test_top_arguments(analytics, orders):
+    with pytest.raises(ValueError, match="'limit' must be between 0 and 100."):
+        analytics.top("users", None, None, 101)
+    with pytest.raises(ValueError, match="'since' cannot be after 'until'."):
+        analytics.top("users", date(2022, 2, 1), date(2022, 1, 1), 10)
+    assert analytics.top("users", None, None, 0) == []
+    assert analytics.top("users", date(2030, 1, 1), None, 10) == []
+
+
+def test_top_queries(app, db, analytics, restaurant, user):
+    for amount, dish_name in [(5, "Egg Curry"), (3, "Egg Curry"), (1, "Tea")]:
+        commit(
+            db,
+            PurchaseOrder(
+                user_id=user.id,
+                restaurant_id=restaurant.id,
+                restaurant_name=restaurant.name,
+                dish_name=dish_name,
+                transaction_amount=amount,
+                transaction_date=datetime(2022, 1, 1, 12),
+            ),
+        )
+    commit(db, User(name="idle", cash_balance=0))
+    query = """{
+        topUsers(since: "2022-01-01", until: "2022-01-31", limit: 5) {
+            user { name } totalAmount
+        }
+        topRestaurants { restaurant { name } orderCount }
+        topDishes(limit: 1) { restaurant { name } dishName orderCount }
+    }"""
+    client = app.test_client()
+    data = json.loads(client.post("/graphql", data={"query": query}).data)
+    assert data["data"] == {
+        "topUsers": [{"user": {"name": "test"}, "totalAmount": 9.0}],
+        "topRestaurants": [{"restaurant": {"name": "test"}, "orderCount": 3}],
+        "topDishes": [
+            {"restaurant": {"name": "test"}, "dishName": "Egg Curry", "orderCount": 2}
+        ],
+    }
+    data = json.loads(
+        client.post(
+            "/graphql", data={"query": "{ topUsers(limit: 101) { totalAmount } }"}
+        ).data
+    )
+    assert data["errors"][0]["message"] == "'limit' must be between 0 and 100."
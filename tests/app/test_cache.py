@@ -0,0 +1,99 @@
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from app import cache
+from app.models import Dish, Schedule
+from tests.utils import commit
+
+
+@pytest.fixture
+def results(db):
+    cache.restaurants.clear()
+    yield cache.restaurants
+    cache.restaurants.clear()
+
+
+def key(open_at=None, *price_range):
+    return cache.restaurants_key(open_at, *(price_range or (None,) * 4))
+
+
+def test_open_at_is_bucketed_to_the_minute_of_the_week():
+    open_at = datetime(2022, 2, 14, 12, 30, 15)
+    assert key(open_at) == key(open_at.replace(second=59, microsecond=1))
+    assert key(open_at) == key(open_at + timedelta(weeks=3))
+    assert key(open_at) != key(open_at + timedelta(minutes=1))
+    assert key(None, 1, 2, 3, None) == key(None, 1.0, 2.0, 3, None)
+
+
+def test_hits_and_misses(results):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [1, 2]
+
+    assert results.get("a", compute) == (1, 2)
+    assert results.get("a", compute) == (1, 2)
+    assert results.get("b", compute) == (1, 2)
+    assert len(calls) == 2
+    assert results.stats() == {
+        "hits": 1,
+        "misses": 2,
+        "evictions": 0,
+        "entries": 2,
+        "ids": 4,
+    }
+
+
+def test_lru_eviction(app, results, monkeypatch):
+    monkeypatch.setitem(app.config, "RESULT_CACHE_SIZE", 2)
+    results.get("a", lambda: [1])
+    results.get("b", lambda: [2])
+    results.get("a", lambda: [])
+    results.get("c", lambda: [3])
+    assert list(results.entries) == ["a", "c"]
+
+    monkeypatch.setitem(app.config, "RESULT_CACHE_MAX_IDS", 3)
+    results.get("d", lambda: [4, 5, 6])
+    assert list(results.entries) == ["d"]
+    # Too large to be cached at all.
+    assert results.get("e", lambda: [7, 8, 9, 10]) == (7, 8, 9, 10)
+    assert list(results.entries) == ["d"]
+    assert results.stats()["evictions"] == 3
+
+
+def test_expiry(app, results, monkeypatch):
+    results.get("a", lambda: [1])
+    monkeypatch.setitem(app.config, "RESULT_CACHE_MAX_AGE", -1)
+    assert results.get("a", lambda: [2]) == (2,)
+
+
+def test_invalidated_by_writes_to_filtered_tables(db, results, restaurant):
+    def get():
+        return results.get("a", lambda: [d.id for d in Dish.query])
+
+    assert get() == ()
+    dish = Dish(name="Dish", price=1, restaurant_id=restaurant.id)
+    commit(db, dish)
+    assert get() == (dish.id,)
+
+    commit(
+        db,
+        Schedule(
+            weekday=0,
+            opens_at=time(9),
+            closes_at=time(10),
+            overnight=False,
+            restaurant_id=restaurant.id,
+        ),
+    )
+    misses = results.misses
+    get()
+    assert results.misses == misses + 1
+
+    # Entries hold ids, which updates to restaurants do not change.
+    restaurant.cash_balance += 10
+    commit(db, restaurant)
+    get()
+    assert results.misses == misses + 1
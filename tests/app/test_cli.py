@@ -1,7 +1,9 @@
+import json
 from unittest import mock
 
-from app import seed_db
-from app.models import Restaurant
+from app import backfill_totals, seed_db
+from app.models import Dish, PurchaseOrder, Restaurant, Schedule, User, UserSpending
+from tests.utils import commit
 
 
 @mock.patch("app.load.add_restaurants")
@@ -15,5 +17,101 @@ def test_seed_db(mocked_load_users, mocked_load_restaurants, app, db):
 
     assert "Adding data to database..." in result.output
     assert "Done" in result.output
-    mocked_load_restaurants.assert_called_once_with(data)
-    mocked_load_users.assert_called_once_with(data)
+    mocked_load_restaurants.assert_called_once_with(data, executor=None)
+    mocked_load_users.assert_called_once_with(data, executor=None)
+
+
+@mock.patch("app.load.add_restaurants")
+@mock.patch("app.load.add_users")
+def test_seed_db_stream(mocked_load_users, mocked_load_restaurants, app, tmp_path):
+    restaurants = [{"restaurantName": str(i)} for i in range(5)]
+    users = [{"name": str(i)} for i in range(3)]
+    restaurants_path = tmp_path / "restaurants.json"
+    restaurants_path.write_text(json.dumps(restaurants))
+    users_path = tmp_path / "users.json"
+    users_path.write_text(json.dumps(users))
+
+    runner = app.test_cli_runner()
+    env = {
+        "RESTAURANT_DATA_URL": str(restaurants_path),
+        "USER_DATA_URL": str(users_path),
+    }
+    with mock.patch.dict("os.environ", env):
+        result = runner.invoke(seed_db, ["--stream", "--batch-size", "2"])
+
+    assert "Done" in result.output
+    assert mocked_load_restaurants.call_args_list == [
+        mock.call(restaurants[0:2], executor=None),
+        mock.call(restaurants[2:4], executor=None),
+        mock.call(restaurants[4:], executor=None),
+    ]
+    assert mocked_load_users.call_args_list == [
+        mock.call(users[0:2], executor=None),
+        mock.call(users[2:], executor=None),
+    ]
+
+
+def test_seed_db_workers(app, db, tmp_path):
+    restaurants = [
+        {
+            "cashBalance": i,
+            "menu": [{"dishName": f"Dish {j}", "price": j} for j in range(i)],
+            "openingHours": "Mon - Fri 10 am - 2 am / Sat 11 am - 9 pm",
+            "restaurantName": f"Restaurant {i}",
+        }
+        for i in range(10)
+    ]
+    users = [
+        {
+            "cashBalance": i,
+            "name": f"User {i}",
+            "purchaseHistory": [
+                {
+                    "dishName": "Dish 0",
+                    "restaurantName": f"Restaurant {i}",
+                    "transactionAmount": 0,
+                    "transactionDate": "02/10/2020 04:09 AM",
+                }
+            ],
+        }
+        for i in range(10)
+    ]
+    restaurants_path = tmp_path / "restaurants.json"
+    restaurants_path.write_text(json.dumps(restaurants))
+    users_path = tmp_path / "users.json"
+    users_path.write_text(json.dumps(users))
+
+    runner = app.test_cli_runner()
+    env = {
+        "RESTAURANT_DATA_URL": str(restaurants_path),
+        "USER_DATA_URL": str(users_path),
+    }
+    with mock.patch.dict("os.environ", env):
+        result = runner.invoke(seed_db, ["--stream", "--workers", "2"])
+
+    assert "Done" in result.output, result.output
+    assert [r.name for r in Restaurant.query.order_by(Restaurant.id)] == [
+        r["restaurantName"] for r in restaurants
+    ]
+    assert Dish.query.count() == sum(range(10))
+    assert Schedule.query.count() == 60
+    assert PurchaseOrder.query.count() == User.query.count() == 10
+
+
+def test_backfill_totals(app, db, restaurant, user):
+    for amount in [1, 2]:
+        order = PurchaseOrder(
+            dish_name="test",
+            transaction_amount=amount,
+            restaurant_name=restaurant.name,
+            user_id=user.id,
+            restaurant_id=restaurant.id,
+        )
+        commit(db, order)
+    user_id = user.id
+    assert UserSpending.query.count() == 0
+
+    result = app.test_cli_runner().invoke(backfill_totals)
+    assert result.output == "Backfilled 1 user totals and 1 daily revenues.\n"
+    spending = UserSpending.query.get(user_id)
+    assert (spending.order_count, spending.total_amount) == (2, 3)
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from flask import url_for
+from graphql import parse
+from graphql.utils.introspection_query import introspection_query
+
+from app import cost
+from app.schema import SCHEMA
+
+
+def analyze(query, variables=None, operation_name=None):
+    return cost.analyze(SCHEMA, parse(query), operation_name, variables)
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("{ users { edges { node { name } } } }", (1 + 100 * 2, 4)),
+        ("{ users(first: 10) { edges { cursor } pageInfo { hasNextPage } } }", (21, 3)),
+        ("{ users(first: 10, last: 2) { edges { node { id } } } }", (5, 4)),
+        (
+            "{ users(first: 10) { edges { node { purchase { edges { node { id } } } } } } }",
+            (1 + 10 * (1 + 1 + (1 + 100 * (1 + 1))), 7),
+        ),
+        ('{ search(q: "egg") { ... on Dish { name } } }', (1, 2)),
+        (
+            '{ search(q: "egg", limit: 5) { ... on Dish { restaurant { id } } } }',
+            (6, 3),
+        ),
+        ("{ topUsers { user { id } } }", (1 + 10 * 1, 3)),
+        ("{ __schema { types { name } } }", (0, 1)),
+    ],
+)
+def test_analyze(app, query, expected):
+    assert analyze(query) == expected
+
+
+def test_analyze_fragments_and_variables(app):
+    query = """
+        query Users($count: Int) { users(first: $count) { ...Users } }
+        query Restaurants { restaurants { ...Restaurants } }
+        fragment Users on UserConnection { edges { node { ...User } } }
+        fragment User on User { purchase(last: 3) { edges { node { id } } } }
+        fragment Restaurants on RestaurantConnection { edges { cursor } }
+    """
+    assert analyze(query, {"count": 2}, "Users") == (1 + 2 * (1 + 1 + 1 + 3 * 2), 7)
+    assert analyze(query, {}, "Users") == (1 + 100 * 9, 7)
+    assert analyze(query, operation_name="Restaurants") == (101, 3)
+    assert analyze(query) is None
+
+
+def test_analyze_variable_defaults(app):
+    query = """
+        query($n: Int = 1000, $users: Int) {
+            users(first: $users) { edges { node { purchase(first: $n) { edges { node { id } } } } } }
+        }
+    """
+    assert analyze(query, {"users": 5}) == (1 + 5 * (1 + 1 + (1 + 1000 * 2)), 7)
+    assert analyze(query, {"users": 5, "n": 2}) == (1 + 5 * (1 + 1 + (1 + 2 * 2)), 7)
+
+
+@pytest.fixture
+def execute(app, db):
+    client = app.test_client()
+    with app.test_request_context():
+        query_path = url_for("graphql")
+
+    def inner(query):
+        response = client.post(query_path, data={"query": query})
+        return response.status_code, json.loads(response.data)
+
+    return inner
+
+
+def test_cost_is_reported(execute):
+    status, data = execute("{ users(first: 5) { edges { node { name } } } }")
+    assert status == 200
+    assert data["extensions"]["cost"] == {
+        "requestedQueryCost": 11,
+        "maximumAvailable": 10_000,
+        "depth": 4,
+    }
+
+
+def test_expensive_queries_are_rejected(app, execute, monkeypatch):
+    query = "{ users { edges { node { purchase { edges { node { id } } } } } } }"
+    status, data = execute(query)
+    assert status == 400
+    assert "data" not in data
+    assert data["errors"][0]["message"] == (
+        "Query cost 20301 exceeds the maximum cost of 10000. Pass `first` or "
+        "`last` to connections to limit the number of items they return."
+    )
+    assert data["extensions"]["cost"]["requestedQueryCost"] == 20301
+
+    monkeypatch.setitem(app.config, "QUERY_MAX_DEPTH", 6)
+    status, data = execute(query.replace("users", "users(first: 1)"))
+    assert status == 400
+    assert data["errors"][0]["message"] == (
+        "Query depth 7 exceeds the maximum depth of 6."
+    )
+
+
+def test_introspection_is_free(execute):
+    status, data = execute(introspection_query)
+    assert status == 200
+    assert data["extensions"]["cost"]["requestedQueryCost"] == 0
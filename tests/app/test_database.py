@@ -0,0 +1,194 @@
+import json
+
+import pytest
+from graphql_relay.node.node import to_global_id
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+from app import database, metrics
+from app.database import engine_options, forget_writes, read_only
+from app.models import Dish, Restaurant, User
+from tests.utils import commit
+
+CONFIG = {
+    "DATABASE_POOL_SIZE": 5,
+    "DATABASE_MAX_OVERFLOW": 10,
+    "DATABASE_POOL_TIMEOUT": 30,
+    "DATABASE_POOL_RECYCLE": 3600,
+    "DATABASE_POOL_PRE_PING": True,
+}
+
+
+@pytest.fixture
+def replicas(app, db, tmp_path, monkeypatch):
+    """Two SQLite files standing for the replicas of the database."""
+    binds = {f"replica{i}": f"sqlite:///{tmp_path / f'replica{i}.db'}" for i in (0, 1)}
+    monkeypatch.setitem(app.config, "SQLALCHEMY_BINDS", binds)
+    monkeypatch.setitem(app.config, "DATABASE_REPLICAS", list(binds))
+    monkeypatch.setattr(database, "replicas", database.Replicas())
+    engines = [db.get_engine(bind=bind) for bind in binds]
+    for i, engine in enumerate(engines):
+        db.Model.metadata.create_all(engine)
+        # Ids distinct from the ones of the primary, so that the rows read
+        # from each database don't mix in the identity map of the session.
+        engine.execute(
+            Restaurant.__table__.insert(),
+            id=100 + i,
+            name=f"replica{i}",
+            cash_balance=0,
+        )
+    yield engines
+    db.session.remove()
+    for engine in engines:
+        engine.dispose()
+        del database.ENGINES[str(engine.url)]
+
+
+def restaurant_names(client):
+    query = "{ restaurants { edges { node { name } } } }"
+    data = json.loads(client.post("/graphql", data={"query": query}).data)
+    return [edge["node"]["name"] for edge in data["data"]["restaurants"]["edges"]]
+
+
+def test_engine_options():
+    options = engine_options(CONFIG, make_url("postgresql://db/frenzy"), {})
+    assert options == {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+    }
+    options = engine_options(
+        CONFIG, make_url("sqlite:///app.db"), {"poolclass": NullPool}
+    )
+    assert options["poolclass"] is QueuePool
+    assert options["connect_args"] == {"check_same_thread": False}
+    assert "pool_pre_ping" not in options
+    options = engine_options(
+        {**CONFIG, "DATABASE_POOL_SIZE": 0}, make_url("postgresql://db/frenzy"), {}
+    )
+    assert options == {"poolclass": NullPool}
+    options = engine_options(CONFIG, make_url("sqlite://"), {"poolclass": StaticPool})
+    assert options == {"poolclass": StaticPool}
+
+
+def test_sqlite_pragmas(app, db):
+    def pragma(name):
+        return db.session.execute(f"PRAGMA {name}").scalar()
+
+    assert pragma("journal_mode") == "wal"
+    assert pragma("busy_timeout") == app.config["SQLITE_PRAGMAS"]["busy_timeout"]
+    assert pragma("cache_size") == app.config["SQLITE_PRAGMAS"]["cache_size"]
+
+
+def test_pool_metrics(app, db):
+    waits = database.wait_seconds.snapshot()["count"]
+    holds = database.hold_seconds.snapshot()["count"]
+    db.session.execute("SELECT 1")
+    status = metrics.snapshot()["db.pools"][str(db.engine.url)]
+    assert status["class"] == "QueuePool"
+    assert status["size"] == app.config["DATABASE_POOL_SIZE"]
+    assert status["checked_out"] == 1
+    db.session.commit()
+    assert database.wait_seconds.snapshot()["count"] == waits + 1
+    assert database.hold_seconds.snapshot()["count"] == holds + 1
+
+    data = json.loads(app.test_client().get("/metrics").data)
+    assert "db.pool.wait_seconds" in data and "db.pools" in data
+
+
+def test_pool_timeouts(app, db, tmp_path):
+    engine = db.create_engine(
+        make_url(f"sqlite:///{tmp_path / 'pool.db'}"),
+        {"poolclass": QueuePool, "pool_size": 1, "max_overflow": 0, "pool_timeout": 0},
+    )
+    timeouts = database.timeouts.snapshot()["count"]
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    assert database.timeouts.snapshot()["count"] == timeouts + 1
+    engine.dispose()
+    del database.ENGINES[str(engine.url)]
+
+
+def test_queries_read_from_replicas_in_turns(app, replicas, restaurant):
+    client = app.test_client()
+    assert restaurant_names(client) == ["replica0"]
+    assert restaurant_names(client) == ["replica1"]
+    assert restaurant_names(client) == ["replica0"]
+    assert database.replicas.status() == {"replica0": True, "replica1": True}
+
+
+def test_mutations_write_to_primary(app, db, replicas, restaurant, user):
+    user.cash_balance = 10
+    dish = Dish(name="test", price=10, restaurant_id=restaurant.id)
+    commit(db, dish)
+    mutation = """
+        mutation {
+            purchase(input: {userId: "%s", dishId: "%s"}) { order { dishName } }
+        }
+    """ % (
+        to_global_id("User", user.id),
+        to_global_id("Dish", dish.id),
+    )
+    client = app.test_client()
+    data = json.loads(client.post("/graphql", data={"query": mutation}).data)
+    assert data["data"]["purchase"]["order"]["dishName"] == "test"
+    assert User.query.get(user.id).cash_balance == 0
+    assert restaurant.purchase.count() == 1
+
+
+def test_reads_after_writes_go_to_primary(db, replicas, restaurant):
+    forget_writes(db.session)
+    with read_only(db):
+        assert [r.name for r in Restaurant.query] == ["replica0"]
+        db.session.add(Restaurant(name="new", cash_balance=0))
+        assert [r.name for r in Restaurant.query] == ["test", "new"]
+        db.session.commit()
+        assert [r.name for r in Restaurant.query] == ["test", "new"]
+    forget_writes(db.session)
+    with read_only(db):
+        assert [r.name for r in Restaurant.query] == ["replica1"]
+
+
+@pytest.mark.parametrize("result_cache_size", [0, 512])
+def test_indexes_are_built_from_primary(
+    app, db, replicas, monkeypatch, result_cache_size
+):
+    monkeypatch.setitem(app.config, "DATABASE_REPLICAS", ["replica0"])
+    monkeypatch.setitem(app.config, "RESULT_CACHE_SIZE", result_cache_size)
+    # The replica has not caught up with the dish yet.
+    commit(db, Dish(name="test", price=10, restaurant_id=100))
+    query = """{
+        restaurants(minDishPrice: 1, maxDishPrice: 100, minDishes: 1) {
+            edges { node { name } }
+        }
+    }"""
+    client = app.test_client()
+    data = json.loads(client.post("/graphql", data={"query": query}).data)
+    assert data["data"]["restaurants"]["edges"] == [{"node": {"name": "replica0"}}]
+
+
+def test_unhealthy_replicas_fall_back_to_primary(
+    app, db, replicas, restaurant, monkeypatch
+):
+    client = app.test_client()
+    monkeypatch.setitem(app.config, "DATABASE_REPLICA_LAG_QUERY", "SELECT 60")
+    fallbacks = database.replica_fallbacks.snapshot()["count"]
+    assert restaurant_names(client) == ["test"]
+    assert database.replicas.status() == {"replica0": False, "replica1": False}
+    assert database.replica_fallbacks.snapshot()["count"] == fallbacks + 1
+
+    # Replicas are checked again after `DATABASE_REPLICA_CHECK_INTERVAL`.
+    monkeypatch.setitem(app.config, "DATABASE_REPLICA_LAG_QUERY", "SELECT 1")
+    assert restaurant_names(client) == ["test"]
+    monkeypatch.setitem(app.config, "DATABASE_REPLICA_CHECK_INTERVAL", 0)
+    assert restaurant_names(client) in (["replica0"], ["replica1"])
+
+    monkeypatch.setitem(
+        app.config["SQLALCHEMY_BINDS"], "replica1", "sqlite:////nonexistent/replica.db"
+    )
+    monkeypatch.setitem(app.config, "DATABASE_REPLICA_LAG_QUERY", None)
+    assert [restaurant_names(client) for _ in range(2)] == [["replica0"]] * 2
@@ -0,0 +1,86 @@
+import hashlib
+import json
+
+import pytest
+from flask import url_for
+
+from app import documents
+
+QUERY = "query { users { edges { node { name } } } }"
+QUERY_HASH = hashlib.sha256(QUERY.encode()).hexdigest()
+
+
+@pytest.fixture
+def post(app):
+    client = app.test_client()
+    with app.test_request_context():
+        query_path = url_for("graphql")
+
+    def inner(**data):
+        response = client.post(
+            query_path, data=json.dumps(data), content_type="application/json"
+        )
+        return response.status_code, json.loads(response.data)
+
+    return inner
+
+
+@pytest.fixture
+def backend():
+    documents.backend.documents.clear()
+    documents.backend.documents.hits = documents.backend.documents.misses = 0
+    return documents.backend
+
+
+def persisted(query_hash=QUERY_HASH):
+    return {"persistedQuery": {"version": 1, "sha256Hash": query_hash}}
+
+
+def test_documents_are_parsed_once(user, post, backend, monkeypatch):
+    parse = documents.parse
+    parsed = []
+    monkeypatch.setattr(
+        documents, "parse", lambda source: parsed.append(source) or parse(source)
+    )
+
+    for _ in range(3):
+        status, data = post(query=QUERY)
+        assert status == 200
+        assert data["data"]["users"]["edges"] == [{"node": {"name": user.name}}]
+    assert parsed == [QUERY]
+    assert backend.documents.hits == 2
+
+
+def test_invalid_documents_are_not_cached(db, post, backend):
+    for _ in range(2):
+        status, data = post(query="query { users { unknown } }")
+        assert status == 400
+        assert "unknown" in data["errors"][0]["message"]
+    assert not backend.documents.items
+
+
+def test_document_cache_is_bounded(app, db, post, backend, monkeypatch):
+    monkeypatch.setitem(app.config, "DOCUMENT_CACHE_SIZE", 2)
+    queries = ["{ users { edges { cursor } } }", "{ restaurants { edges { cursor } } }"]
+    for query in [*queries, QUERY]:
+        post(query=query)
+    assert list(backend.documents.items) == [queries[1], QUERY]
+
+
+def test_persisted_queries(user, post):
+    documents.persisted_queries.clear()
+    status, data = post(extensions=persisted())
+    assert status == 400
+    assert data["errors"][0]["message"] == "PersistedQueryNotFound"
+
+    status, data = post(query=QUERY, extensions=persisted())
+    assert status == 200
+    status, data = post(extensions=persisted())
+    assert status == 200
+    assert data["data"]["users"]["edges"] == [{"node": {"name": user.name}}]
+
+
+def test_persisted_query_hash_mismatch(db, post):
+    status, data = post(query=QUERY, extensions=persisted("0" * 64))
+    assert status == 400
+    assert data["errors"][0]["message"] == ("Provided sha256Hash does not match query.")
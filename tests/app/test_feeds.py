@@ -0,0 +1,55 @@
+import json
+from unittest import mock
+
+import pytest
+
+from app.feeds import batched, iter_array, iter_chunks, iter_records
+
+RECORDS = [
+    {"restaurantName": "Roma Ristorante", "cashBalance": 12.5, "menu": []},
+    {"restaurantName": "Naked City Pizza", "cashBalance": 1e3, "menu": [1, 2]},
+    {"restaurantName": "Oscar's of Dublin é", "cashBalance": 0, "menu": None},
+]
+
+
+def split(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+def test_iter_array(size):
+    text = json.dumps(RECORDS, indent=2)
+    assert list(iter_array(split(text, size))) == RECORDS
+
+
+@pytest.mark.parametrize("text", ["[]", " [ ] ", "[1, 23, 456]", '["a", [1], {}]'])
+def test_iter_array_scalars(text):
+    assert list(iter_array(split(text, 1))) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", ["{}", "[1, 2", "[1 2]", "[{]"])
+def test_iter_array_invalid(text):
+    with pytest.raises(ValueError):
+        list(iter_array(split(text, 1)))
+
+
+def test_iter_records_from_file(tmp_path):
+    path = tmp_path / "restaurants.json"
+    path.write_text(json.dumps(RECORDS), encoding="utf-8")
+    # Tiny chunks split the multi-byte character as well.
+    assert list(iter_records(str(path), chunk_size=3)) == RECORDS
+
+
+def test_iter_chunks_from_url():
+    with mock.patch("requests.get") as mocked_get:
+        response = mocked_get.return_value.__enter__.return_value
+        response.iter_content.return_value = [b'[{"a": "\xc3', b'\xa9"}]']
+        chunks = list(iter_chunks("https://example.com/feed.json"))
+
+    mocked_get.assert_called_once_with("https://example.com/feed.json", stream=True)
+    assert list(iter_array(chunks)) == [{"a": "é"}]
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
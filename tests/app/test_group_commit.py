@@ -0,0 +1,101 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from graphql_relay.node.node import to_global_id
+
+from app import group_commit, metrics
+from app.models import Dish, PurchaseOrder, Restaurant, User
+from tests.utils import commit
+
+
+@pytest.fixture
+def group_commit_mode(app, monkeypatch):
+    monkeypatch.setitem(app.config, "GROUP_COMMIT", True)
+    monkeypatch.setitem(app.config, "GROUP_COMMIT_INTERVAL", 0.05)
+
+
+def test_concurrent_purchases_are_committed_together(
+    app, db, group_commit_mode, restaurant, user
+):
+    user.cash_balance = 30
+    dish = Dish(name="test", price=1, restaurant_id=restaurant.id)
+    commit(db, dish)
+    user_id, dish_id, restaurant_id = user.id, dish.id, restaurant.id
+    db.session.remove()
+    batches = group_commit.batch_size.snapshot()
+
+    def purchase(_):
+        with app.app_context():
+            try:
+                order = group_commit.purchases.submit(
+                    User.query.get(user_id), Dish.query.get(dish_id)
+                )
+                return order.user_id == user_id and order.dish_name == "test"
+            except ValueError as e:
+                assert str(e) == "Purchase not allowed: Not enough cash balance!"
+                return False
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(executor.map(purchase, range(40)))
+
+    assert results.count(True) == 30
+    assert User.query.get(user_id).cash_balance == 0
+    assert Restaurant.query.get(restaurant_id).cash_balance == 30
+    assert PurchaseOrder.query.count() == 30
+
+    after = group_commit.batch_size.snapshot()
+    assert after["sum"] - batches["sum"] == 40
+    assert after["count"] - batches["count"] < 40
+    assert after["max"] > 1
+
+
+def test_purchase_mutation_with_group_commit(
+    app, db, group_commit_mode, restaurant, user
+):
+    user.cash_balance = 15
+    dish = Dish(name="test", price=15, restaurant_id=restaurant.id)
+    commit(db, dish)
+    mutation = """
+        mutation {
+            purchase(input: {userId: "%s" dishId: "%s"}) { order { dishName userId } }
+        }
+    """ % (
+        to_global_id("User", user.id),
+        to_global_id("Dish", dish.id),
+    )
+
+    client = app.test_client()
+    data = json.loads(client.post("/graphql", data={"query": mutation}).data)
+    assert data["data"]["purchase"]["order"] == {"dishName": "test", "userId": user.id}
+    data = json.loads(client.post("/graphql", data={"query": mutation}).data)
+    assert "Purchase not allowed" in data["errors"][0]["message"]
+
+    response = json.loads(client.get("/metrics").data)
+    assert response["purchases.group_commit.batch_size"]["count"] >= 2
+    assert "purchases.group_commit.flush_seconds" in metrics.snapshot()
+
+
+def test_purchases_are_made_on_their_own_after_a_timeout(
+    app, db, group_commit_mode, restaurant, user, monkeypatch
+):
+    monkeypatch.setitem(app.config, "GROUP_COMMIT_TIMEOUT", 0.01)
+    committer = group_commit.GroupCommitter()
+    # A stalled flusher thread.
+    monkeypatch.setattr(committer, "start", lambda app: None)
+    user.cash_balance = 10
+    dish = Dish(name="test", price=4, restaurant_id=restaurant.id)
+    commit(db, dish)
+    timeouts = group_commit.timeouts.snapshot()["count"]
+
+    order = committer.submit(user, dish)
+    assert order.dish_name == "test"
+    assert User.query.get(user.id).cash_balance == 6
+    assert group_commit.timeouts.snapshot()["count"] == timeouts + 1
+
+    # The queued purchase is skipped once the flusher resumes.
+    committer.flush(committer.next_batch())
+    assert PurchaseOrder.query.count() == 1
+    assert User.query.get(user.id).cash_balance == 6
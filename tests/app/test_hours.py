@@ -0,0 +1,64 @@
+from datetime import time as t
+
+import pytest
+
+from app.hours import _parse_schedule, parse_schedule, parse_weekday
+
+
+def test_parse_schedule_formats():
+    hours = "Mon-Wed 10:30am-11:20pm / Thu - Sun 12 am - 12 pm"
+    assert parse_schedule(hours) == {
+        0: (t(10, 30), t(23, 20), False),
+        1: (t(10, 30), t(23, 20), False),
+        2: (t(10, 30), t(23, 20), False),
+        3: (t(0, 0), t(12, 0), False),
+        4: (t(0, 0), t(12, 0), False),
+        5: (t(0, 0), t(12, 0), False),
+        6: (t(0, 0), t(12, 0), False),
+    }
+
+
+def test_parse_schedule_wrapping_range():
+    assert parse_schedule("Sat - Mon 9 PM - 1:30 AM") == {
+        5: (t(21, 0), t(1, 30), True),
+        6: (t(21, 0), t(1, 30), True),
+        0: (t(21, 0), t(1, 30), True),
+    }
+
+
+def test_parse_schedule_is_memoized():
+    hours = "Mon 11 am - 10 pm"
+    _parse_schedule.cache_clear()
+    first = parse_schedule(hours)
+    first[1] = None
+    assert parse_schedule(hours) == {0: (t(11, 0), t(22, 0), False)}
+    assert _parse_schedule.cache_info().hits == 1
+
+
+@pytest.mark.parametrize(
+    "hours",
+    [
+        "",
+        "Mon",
+        "Mon 11 am",
+        "Mon 11 am - 10",
+        "Mon 13 am - 10 pm",
+        "Mon 11 am - 10 pm / garbage",
+        "Mon, 11 am - 10 pm",
+        "Mon - - Tues 11 am - 10 pm",
+        "Someday 11 am - 10 pm",
+    ],
+)
+def test_parse_schedule_invalid(hours):
+    with pytest.raises(ValueError):
+        parse_schedule(hours)
+
+
+def test_parse_weekday():
+    assert [parse_weekday(d) for d in ("mon", "Tues", "WEDS", "thu", "Sun")] == [
+        0,
+        1,
+        2,
+        3,
+        6,
+    ]
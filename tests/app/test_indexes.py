@@ -0,0 +1,157 @@
+import random
+from datetime import datetime, time, timedelta
+
+from app import indexes
+from app.load import add_restaurants
+from app.models import Dish, Restaurant, Schedule
+from tests.utils import commit
+
+HOURS = [
+    "Mon - Sun 11 am - 10 pm",
+    "Mon, Weds 11:45 am - 4:45 pm / Tues 7:45 am - 2 am / Sun 5:45 pm - 12 am",
+    "Sat - Sun 9 pm - 3:30 am / Tues 12 pm - 12:15 pm",
+    "Fri 6 am - 9 pm / Sat 10:15 am - 9 pm / Sun 11 pm - 11:30 pm",
+]
+
+
+def test_open_at_index_matches_sql(db):
+    random.seed(42)
+    data = [
+        {
+            "restaurantName": f"Restaurant {i}",
+            "cashBalance": 0,
+            "menu": [],
+            "openingHours": random.choice(HOURS),
+        }
+        for i in range(40)
+    ]
+    add_restaurants(data)
+
+    monday = datetime(2022, 2, 14)
+    for minute in range(0, 7 * 24 * 60, 7):
+        open_at = monday + timedelta(minutes=minute)
+        expected = [r.id for r in Restaurant.query_open_at(open_at).order_by("id")]
+        assert list(indexes.open_at.restaurant_ids(open_at)) == expected, open_at
+
+
+def test_price_index_matches_sql(db):
+    random.seed(42)
+    data = [
+        {
+            "restaurantName": f"Restaurant {i}",
+            "cashBalance": 0,
+            "menu": [
+                {"dishName": f"Dish {j}", "price": random.randint(1, 20)}
+                for j in range(random.randint(0, 15))
+            ],
+            "openingHours": HOURS[0],
+        }
+        for i in range(40)
+    ]
+    add_restaurants(data)
+
+    for min_price, max_price in [(1, 20), (5, 5), (2.5, 7.5), (19, 30), (30, 40)]:
+        for min_dishes, max_dishes in [(1, None), (3, None), (None, 1), (None, 4)]:
+            arguments = (min_price, max_price, min_dishes, max_dishes)
+            expected = Restaurant.query_within_range(*arguments).order_by("id")
+            assert indexes.prices.restaurant_ids_within_range(*arguments) == [
+                r.id for r in expected
+            ], arguments
+
+    dish = Dish.query.filter(Dish.price == 5).first()
+    dish.price = 31
+    commit(db, dish)
+    assert indexes.prices.restaurant_ids_within_range(30, 40, 1, None) == [
+        dish.restaurant_id
+    ]
+
+
+def test_open_at_index_is_rebuilt_on_commit(db, restaurant):
+    open_at = datetime(2022, 2, 14, 12, 0)
+    assert indexes.open_at.restaurant_ids(open_at) == ()
+
+    schedule = Schedule(
+        weekday=0,
+        opens_at=time(11, 0),
+        closes_at=time(13, 0),
+        overnight=False,
+        restaurant_id=restaurant.id,
+    )
+    db.session.add(schedule)
+    db.session.flush()
+    # Not committed yet.
+    assert indexes.open_at.restaurant_ids(open_at) == ()
+    db.session.commit()
+    assert indexes.open_at.restaurant_ids(open_at) == (restaurant.id,)
+
+    schedule.closes_at = time(11, 30)
+    commit(db, schedule)
+    assert indexes.open_at.restaurant_ids(open_at) == ()
+
+
+def test_versions(db, restaurant):
+    version = indexes.schedules.value
+    restaurant.cash_balance = 10
+    commit(db, restaurant)
+    assert indexes.schedules.value == version
+
+    db.session.execute(Schedule.__table__.delete())
+    db.session.rollback()
+    assert indexes.schedules.value == version
+
+    db.session.execute(Schedule.__table__.delete())
+    db.session.commit()
+    assert indexes.schedules.value == version + 1
+
+
+def test_indexes_expire(app, db, restaurant, monkeypatch):
+    indexes.open_at.refresh()
+    built_at = indexes.open_at.built_at
+    monkeypatch.setitem(app.config, "INDEX_MAX_AGE", 0)
+    indexes.open_at.refresh()
+    # Indexes which are only too old are rebuilt in the background.
+    with indexes.open_at.build_lock:
+        assert indexes.open_at.built_at > built_at
+
+
+class Recorder:
+    fields = {Dish: ("name",)}
+
+    def __init__(self):
+        self.updates = []
+        self.invalidated = []
+
+    def update(self, model, changes):
+        self.updates.append((model, changes.created, changes.updated, changes.deleted))
+
+    def invalidate(self, model):
+        self.invalidated.append(model)
+
+
+def test_subscribers(db, restaurant, monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(indexes, "SUBSCRIBERS", [recorder])
+    dish = Dish(name="Egg Curry", price=1, restaurant_id=restaurant.id)
+    commit(db, dish)
+    dish.price = 2
+    commit(db, dish)
+    dish.name = "Egg Masala"
+    commit(db, dish)
+    db.session.delete(dish)
+    db.session.commit()
+    assert recorder.updates == [
+        (Dish, {dish.id: {"name": "Egg Curry"}}, {}, set()),
+        (Dish, {}, {dish.id: {"name": "Egg Masala"}}, set()),
+        (Dish, {}, {}, {dish.id}),
+    ]
+
+    table = Dish.__table__
+    db.session.execute(table.update().values(price=3))
+    db.session.commit()
+    assert recorder.invalidated == []
+    db.session.execute(table.insert().values(name="Tea", price=1))
+    db.session.rollback()
+    assert recorder.invalidated == []
+    db.session.execute(table.update().values(name="Tea"))
+    db.session.commit()
+    assert recorder.invalidated == [Dish]
@@ -1,9 +1,27 @@
+from datetime import date, datetime
 from datetime import time as t
 
 import pytest
 
-from app.load import add_restaurants, add_users, parse_schedule
-from app.models import Dish, PurchaseOrder, Restaurant, Schedule, User, db
+from app.load import (
+    add_restaurants,
+    add_users,
+    parse_schedule,
+    parse_transaction_date,
+    reserve_ids,
+    sqlite_load_pragmas,
+)
+from app.models import (
+    Dish,
+    PurchaseOrder,
+    Restaurant,
+    RestaurantRevenue,
+    Schedule,
+    ScheduleInterval,
+    User,
+    UserSpending,
+    db,
+)
 
 
 def test_parse_schedule():
@@ -272,3 +290,145 @@ def test_add_users(db):
         == PurchaseOrder.query.count()
         == len(data[0]["purchaseHistory"])
     )
+
+
+@pytest.mark.parametrize(
+    "date_string",
+    ["02/10/2020 04:09 AM", "04/03/2020 01:56 PM", "2/9/2018 6:02 PM"],
+)
+def test_parse_transaction_date(date_string):
+    expected = datetime.strptime(date_string, "%m/%d/%Y %H:%M %p")
+    assert parse_transaction_date(date_string) == expected
+
+
+def test_parse_transaction_date_invalid():
+    with pytest.raises(ValueError):
+        parse_transaction_date("13/40/2020 04:09 AM")
+
+
+def test_add_users_in_batches(db, restaurant, user):
+    data = [
+        {
+            "name": f"User {i}",
+            "cashBalance": i,
+            "purchaseHistory": [
+                {
+                    "dishName": "Olives",
+                    "restaurantName": restaurant.name,
+                    "transactionAmount": i,
+                    "transactionDate": "02/10/2020 04:09 AM",
+                }
+            ]
+            * i,
+        }
+        for i in range(3)
+    ]
+    add_users(data[:2])
+    add_users(data[2:])
+
+    users = User.query.order_by(User.id).all()
+    assert [u.name for u in users] == ["test", "User 0", "User 1", "User 2"]
+    assert [u.purchase.count() for u in users] == [0, 0, 1, 2]
+    assert {o.restaurant_id for o in PurchaseOrder.query} == {restaurant.id}
+    assert [(s.user_id, s.order_count, s.total_amount) for s in UserSpending.query] == [
+        (users[2].id, 1, 1),
+        (users[3].id, 2, 4),
+    ]
+    revenue = RestaurantRevenue.query.one()
+    assert (revenue.day, revenue.order_count, revenue.revenue) == (
+        date(2020, 2, 10),
+        3,
+        5,
+    )
+
+
+def test_reserve_ids(db, restaurant):
+    assert reserve_ids(Restaurant.__table__, 0) == []
+    assert reserve_ids(Restaurant.__table__, 3) == [
+        restaurant.id + 1,
+        restaurant.id + 2,
+        restaurant.id + 3,
+    ]
+    db.session.rollback()
+    assert reserve_ids(User.__table__, 2) == [1, 2]
+    db.session.rollback()
+
+
+def test_add_users_unknown_restaurant(db, restaurant):
+    order = {
+        "dishName": "Olives",
+        "restaurantName": restaurant.name,
+        "transactionAmount": 13.18,
+        "transactionDate": "02/10/2020 04:09 AM",
+    }
+    data = [
+        {
+            "name": "Edith Johnson",
+            "cashBalance": 700.7,
+            "purchaseHistory": [
+                order,
+                {**order, "restaurantName": "Roma Ristorante"},
+                {**order, "restaurantName": "Roma Ristorante"},
+            ],
+        }
+    ]
+    with pytest.raises(ValueError, match=r"'Roma Ristorante' \(2 orders\)"):
+        add_users(data)
+    assert User.query.count() == PurchaseOrder.query.count() == 0
+
+
+def test_add_users_ambiguous_restaurant(db, restaurant):
+    db.session.add(Restaurant(name=restaurant.name, cash_balance=0))
+    db.session.commit()
+    order = {
+        "dishName": "Olives",
+        "restaurantName": restaurant.name,
+        "transactionAmount": 13.18,
+        "transactionDate": "02/10/2020 04:09 AM",
+    }
+    data = [
+        {
+            "name": "Edith Johnson",
+            "cashBalance": 700.7,
+            "purchaseHistory": [order, {**order, "restaurantName": "Roma Ristorante"}],
+        }
+    ]
+    message = (
+        r"unknown restaurants: 'Roma Ristorante' \(1 orders\); "
+        r"ambiguous restaurants: 'test' \(1 orders, 2 restaurants\)"
+    )
+    with pytest.raises(ValueError, match=message):
+        add_users(data)
+    assert User.query.count() == PurchaseOrder.query.count() == 0
+
+
+def test_add_restaurants_in_chunks(db, restaurant):
+    data = [
+        {
+            "cashBalance": i,
+            "menu": [{"dishName": f"Dish {j}", "price": j} for j in range(i)],
+            "openingHours": "Mon - Sun 10 am - 2 am",
+            "restaurantName": f"Restaurant {i}",
+        }
+        for i in range(5)
+    ]
+    add_restaurants(data, chunk_size=2)
+
+    restaurants = Restaurant.query.order_by(Restaurant.id).all()
+    assert [r.name for r in restaurants[1:]] == [d["restaurantName"] for d in data]
+    assert [r.dishes.count() for r in restaurants] == [0, 0, 1, 2, 3, 4]
+    assert [r.schedule.count() for r in restaurants] == [0, 7, 7, 7, 7, 7]
+    # Sunday's overnight span is split in two.
+    assert ScheduleInterval.query.count() == 5 * 8
+
+
+def test_sqlite_load_pragmas(db):
+    def pragma(name):
+        return db.session.execute(f"PRAGMA {name}").scalar()
+
+    db.session.commit()
+    synchronous = pragma("synchronous")
+    with sqlite_load_pragmas():
+        assert pragma("synchronous") == 0
+        assert pragma("journal_mode") == "wal"
+    assert pragma("synchronous") == synchronous
@@ -1,11 +1,21 @@
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from datetime import time
 
 import pytest
 from sqlalchemy.exc import IntegrityError
 
-from app.models import Dish, PurchaseOrder, Schedule
-from tests.utils import commit
+from app.models import (
+    Dish,
+    PurchaseOrder,
+    Restaurant,
+    RestaurantRevenue,
+    Schedule,
+    ScheduleInterval,
+    User,
+    UserSpending,
+)
+from tests.utils import commit, record_statements
 
 
 def test_restaurant_model(restaurant):
@@ -88,3 +98,137 @@ def test_purchase_order_model_for_invalid_transaction_amount(db, restaurant, use
 
     with pytest.raises(IntegrityError):
         commit(db, purchase)
+
+
+def test_schedule_intervals_follow_schedule(db, restaurant):
+    def intervals():
+        return [
+            (i.start_minute, i.end_minute, i.restaurant_id)
+            for i in ScheduleInterval.query.order_by(ScheduleInterval.start_minute)
+        ]
+
+    schedule = Schedule(
+        weekday=6,
+        opens_at=time(21, 0),
+        closes_at=time(2, 0),
+        overnight=True,
+        restaurant_id=restaurant.id,
+    )
+    commit(db, schedule)
+    assert intervals() == [(0, 120, restaurant.id), (9900, 10079, restaurant.id)]
+
+    schedule.weekday = 0
+    commit(db, schedule)
+    assert intervals() == [(1260, 1560, restaurant.id)]
+
+    db.session.delete(schedule)
+    db.session.commit()
+    assert intervals() == []
+
+
+def full_table_scans(db, statements):
+    """Return the steps of the SQLite query plans of `statements` scanning a
+    whole table without the help of an index."""
+    tables = set(db.metadata.tables)
+    scans = []
+    for statement, parameters in statements:
+        if statement.startswith("INSERT"):
+            continue
+        plan = db.session.connection().exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters
+        )
+        for *_ids, detail in plan:
+            step, table, *_rest = detail.split() + [""]
+            if step == "SCAN" and table in tables and "INDEX" not in detail:
+                scans.append((statement, detail))
+    return scans
+
+
+def test_hot_queries_use_indexes(db, restaurant, user):
+    dish = Dish(name="test", price=10, restaurant_id=restaurant.id)
+    user.cash_balance = 100
+    commit(db, dish)
+
+    with record_statements(db) as statements:
+        Restaurant.query_open_at(datetime.datetime(2022, 2, 14, 12, 0)).all()
+        Restaurant.query_within_range(5, 15, 1, None).all()
+        Restaurant.query_within_range(5, 15, None, 3).all()
+        PurchaseOrder.create_for(user, dish)
+        user.purchase.order_by(PurchaseOrder.transaction_date).all()
+        restaurant.purchase.all()
+
+    assert len(statements) > 6
+    assert full_table_scans(db, statements) == []
+
+
+def test_concurrent_purchases_keep_balances_consistent(app, db, restaurant, user):
+    user.cash_balance = 100
+    dish = Dish(name="test", price=1, restaurant_id=restaurant.id)
+    commit(db, dish)
+    user_id, dish_id, restaurant_id = user.id, dish.id, restaurant.id
+    db.session.remove()
+
+    def purchase(attempts):
+        completed = 0
+        with app.app_context():
+            for _ in range(attempts):
+                try:
+                    PurchaseOrder.create_for(
+                        User.query.get(user_id), Dish.query.get(dish_id)
+                    )
+                    completed += 1
+                except ValueError:
+                    pass
+            db.session.remove()
+        return completed
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        completed = sum(executor.map(purchase, [20] * 8))
+
+    assert completed == 100
+    assert User.query.get(user_id).cash_balance == 0
+    assert Restaurant.query.get(restaurant_id).cash_balance == 100
+    assert PurchaseOrder.query.count() == 100
+    spending = UserSpending.query.get(user_id)
+    assert (spending.order_count, spending.total_amount) == (100, 100)
+
+
+def test_purchases_update_totals(db, restaurant, user):
+    other = Restaurant(name="other", cash_balance=0)
+    user.cash_balance = 100
+    commit(db, other)
+    dish = Dish(name="test", price=10, restaurant_id=restaurant.id)
+    other_dish = Dish(name="other", price=2.5, restaurant_id=other.id)
+    db.session.add_all([dish, other_dish])
+    db.session.commit()
+
+    PurchaseOrder.create_for(user, dish)
+    PurchaseOrder.create_many([(user, dish), (user, other_dish)])
+    today = datetime.datetime.utcnow().date()
+    spending = UserSpending.query.get(user.id)
+    assert (spending.order_count, spending.total_amount) == (3, 22.5)
+    assert [
+        (r.restaurant_id, r.day, r.order_count, r.revenue)
+        for r in RestaurantRevenue.query.order_by(RestaurantRevenue.restaurant_id)
+    ] == [(restaurant.id, today, 2, 20), (other.id, today, 1, 2.5)]
+
+    # Orders of other days are summed apart.
+    yesterday = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    commit(
+        db,
+        PurchaseOrder(
+            dish_name="test",
+            transaction_amount=10,
+            transaction_date=yesterday,
+            restaurant_name=restaurant.name,
+            user_id=user.id,
+            restaurant_id=restaurant.id,
+        ),
+    )
+    assert PurchaseOrder.rebuild_totals() == [1, 3]
+    spending = UserSpending.query.get(user.id)
+    assert (spending.order_count, spending.total_amount) == (4, 32.5)
+    revenue = RestaurantRevenue.query.get((restaurant.id, yesterday.date()))
+    assert (revenue.order_count, revenue.revenue) == (1, 10)
+    revenue = RestaurantRevenue.query.get((restaurant.id, today))
+    assert (revenue.order_count, revenue.revenue) == (2, 20)
@@ -7,9 +7,10 @@ from datetime import timedelta
 import pytest
 from flask import url_for
 from graphql_relay.node.node import to_global_id
+from sqlalchemy import event
 
 from app import models, schema
-from tests.utils import commit
+from tests.utils import commit, record_statements
 
 
 @pytest.fixture
@@ -103,7 +104,9 @@ def test_restaurant_query_all(restaurant, execute):
     assert data["data"]["restaurants"]["edges"] == [{"node": {"name": restaurant.name}}]
 
 
-def test_restaurant_open_at(db, execute):
+@pytest.mark.parametrize("open_at_index", [True, False])
+def test_restaurant_open_at(app, db, execute, monkeypatch, open_at_index):
+    monkeypatch.setitem(app.config, "OPEN_AT_INDEX", open_at_index)
     restaurant = models.Restaurant(name="Test", cash_balance=100)
     db.session.add(restaurant)
     db.session.commit()
@@ -127,66 +130,71 @@ def test_restaurant_open_at(db, execute):
     db.session.commit()
 
     expected = [
-        # (Time, is open on Monday, is open on Friday)
-        (t(0, 0), False, True),
-        (t(1, 0), False, True),
-        (t(2, 0), False, True),
-        (t(3, 0), False, True),
-        (t(3, 59), False, True),
-        (t(4, 0), False, True),
-        (t(4, 1), False, False),
-        (t(6, 0), False, False),
-        (t(8, 0), False, False),
-        (t(9, 0), False, False),
-        (t(10, 0), False, False),
-        (t(11, 0), False, False),
-        (t(12, 0), False, False),
-        (t(13, 0), False, False),
-        (t(13, 59), False, False),
-        (t(14, 0), True, False),
-        (t(14, 1), True, False),
-        (t(15, 0), True, False),
-        (t(16, 0), True, False),
-        (t(17, 0), True, False),
-        (t(18, 0), True, False),
-        (t(19, 0), True, False),
-        (t(20, 0), True, False),
-        (t(21, 0), True, True),
-        (t(21, 1), False, True),
-        (t(22, 0), False, True),
-        (t(23, 0), False, True),
+        # (Time, is open on Monday, is open on Friday, is open on Saturday)
+        (t(0, 0), False, False, True),
+        (t(1, 0), False, False, True),
+        (t(2, 0), False, False, True),
+        (t(3, 0), False, False, True),
+        (t(3, 59), False, False, True),
+        (t(4, 0), False, False, True),
+        (t(4, 1), False, False, False),
+        (t(6, 0), False, False, False),
+        (t(8, 0), False, False, False),
+        (t(9, 0), False, False, False),
+        (t(10, 0), False, False, False),
+        (t(11, 0), False, False, False),
+        (t(12, 0), False, False, False),
+        (t(13, 0), False, False, False),
+        (t(13, 59), False, False, False),
+        (t(14, 0), True, False, False),
+        (t(14, 1), True, False, False),
+        (t(15, 0), True, False, False),
+        (t(16, 0), True, False, False),
+        (t(17, 0), True, False, False),
+        (t(18, 0), True, False, False),
+        (t(19, 0), True, False, False),
+        (t(20, 0), True, False, False),
+        (t(21, 0), True, True, False),
+        (t(21, 1), False, True, False),
+        (t(22, 0), False, True, False),
+        (t(23, 0), False, True, False),
     ]
-    for time, expected_mon, expected_fri in expected:
-        dt_mon = datetime(
-            year=2022,
-            month=2,
-            day=14,
-            hour=time.hour,
-            minute=time.minute,
-            second=time.second,
-        )
-        query = 'query { restaurants(openAt: "%s") { edges { node { name } } } }'
-
-        expected_edges = []
-        if expected_mon:
-            expected_edges = [{"node": {"name": restaurant.name}}]
-        data = execute(query % (dt_mon.isoformat()))
-        assert data["data"]["restaurants"]["edges"] == expected_edges
-
-        dt_fri = datetime(
-            year=2022,
-            month=2,
-            day=11,
-            hour=time.hour,
-            minute=time.minute,
-            second=time.second,
-        )
+    # Monday 14th, Friday 11th and Saturday 12th of February 2022.
+    days = [14, 11, 12]
+    query = 'query { restaurants(openAt: "%s") { edges { node { name } } } }'
+    for time, *expected_open in expected:
+        for day, is_open in zip(days, expected_open):
+            dt = datetime(
+                year=2022, month=2, day=day, hour=time.hour, minute=time.minute
+            )
+            expected_edges = [{"node": {"name": restaurant.name}}] if is_open else []
+            data = execute(query % dt.isoformat())
+            assert data["data"]["restaurants"]["edges"] == expected_edges, dt
+
+
+def test_restaurant_open_at_overnight_end_of_week(db, execute):
+    restaurant = models.Restaurant(name="Test", cash_balance=100)
+    commit(db, restaurant)
+    sunday = models.Schedule(
+        opens_at=t(22, 0),
+        closes_at=t(2, 0),
+        weekday=6,
+        restaurant_id=restaurant.id,
+        overnight=True,
+    )
+    commit(db, sunday)
 
-        expected_edges = []
-        if expected_fri:
-            expected_edges = [{"node": {"name": restaurant.name}}]
-        data = execute(query % dt_fri.isoformat())
-        assert data["data"]["restaurants"]["edges"] == expected_edges
+    query = 'query { restaurants(openAt: "%s") { edges { node { name } } } }'
+    for dt, is_open in [
+        (datetime(2022, 2, 20, 21, 59), False),
+        (datetime(2022, 2, 20, 23, 0), True),
+        (datetime(2022, 2, 21, 1, 0), True),
+        (datetime(2022, 2, 21, 2, 1), False),
+        (datetime(2022, 2, 14, 1, 0), True),
+    ]:
+        expected_edges = [{"node": {"name": restaurant.name}}] if is_open else []
+        data = execute(query % dt.isoformat())
+        assert data["data"]["restaurants"]["edges"] == expected_edges, dt
 
 
 def test_restaurant_query_within_range_not_specified(execute):
@@ -220,7 +228,9 @@ def test_restaurant_query_no_min_or_max_dishes(execute):
     assert "Specify one of 'minDishes' or 'maxDishes'" in data["errors"][0]["message"]
 
 
-def test_dishes_within_price_range(db, execute):
+@pytest.mark.parametrize("price_index", [True, False])
+def test_dishes_within_price_range(app, db, execute, monkeypatch, price_index):
+    monkeypatch.setitem(app.config, "PRICE_INDEX", price_index)
     rest1 = models.Restaurant(name="Egg Palace", cash_balance=1)
     rest2 = models.Restaurant(name="Egg Japanese Style", cash_balance=1)
     rest3 = models.Restaurant(name="Anda Palace", cash_balance=1)
@@ -273,3 +283,452 @@ def test_dishes_within_price_range(db, execute):
     restaurants = data["data"]["restaurants"]["edges"]
     assert len(restaurants) == 1
     assert restaurants[0]["node"]["name"] == rest2.name
+
+
+NESTED_QUERY = """
+    query {
+        restaurants(first: 50) {
+            edges {
+                node {
+                    name
+                    dishes(first: 10) { edges { node { name restaurant { name } } } }
+                    purchase(first: 10) { edges { node { dishName user { name } } } }
+                }
+            }
+        }
+        users(first: 50) {
+            edges { node { purchase(first: 10) { edges { node { restaurantName } } } } }
+        }
+    }
+"""
+
+
+def seed_nested(db, restaurants):
+    for i in range(restaurants):
+        restaurant = models.Restaurant(name=f"Restaurant {i}", cash_balance=0)
+        user = models.User(name=f"User {i}", cash_balance=100)
+        db.session.add_all([restaurant, user])
+        db.session.flush()
+        for j in range(3):
+            db.session.add(
+                models.Dish(name=f"Dish {j}", price=j, restaurant_id=restaurant.id)
+            )
+            db.session.add(
+                models.PurchaseOrder(
+                    dish_name=f"Dish {j}",
+                    transaction_amount=j,
+                    restaurant_name=restaurant.name,
+                    restaurant_id=restaurant.id,
+                    user_id=user.id,
+                )
+            )
+    db.session.commit()
+
+
+@pytest.mark.parametrize("restaurants", [1, 5, 20])
+def test_nested_query_batches_relationships(db, execute, restaurants):
+    seed_nested(db, restaurants)
+    with record_statements(db) as statements:
+        data = execute(NESTED_QUERY)
+
+    edges = data["data"]["restaurants"]["edges"]
+    assert len(edges) == restaurants
+    for i, edge in enumerate(edges):
+        dishes = edge["node"]["dishes"]["edges"]
+        assert [d["node"]["name"] for d in dishes] == ["Dish 0", "Dish 1", "Dish 2"]
+        assert {d["node"]["restaurant"]["name"] for d in dishes} == {f"Restaurant {i}"}
+        purchases = edge["node"]["purchase"]["edges"]
+        assert {p["node"]["user"]["name"] for p in purchases} == {f"User {i}"}
+    users = data["data"]["users"]["edges"]
+    assert [len(u["node"]["purchase"]["edges"]) for u in users] == [3] * restaurants
+
+    # restaurants, their dishes and purchases, the restaurants of the dishes
+    # and the users of the purchases, then users and their purchases. The
+    # count is the same whatever the number of rows.
+    assert len(statements) == 7
+
+
+def test_relationship_pages_limit_rows_in_sql(db, execute, user):
+    db.session.add_all(
+        models.PurchaseOrder(
+            dish_name=f"{i}",
+            transaction_amount=i,
+            restaurant_name="test",
+            user_id=user.id,
+        )
+        for i in range(50)
+    )
+    db.session.commit()
+    loaded = []
+
+    def record(order, _context):
+        loaded.append(order)
+
+    event.listen(models.PurchaseOrder, "load", record)
+    query = """{ users(first: 1) { edges { node { purchase(%s) {
+        edges { cursor node { dishName } } pageInfo { hasPreviousPage hasNextPage }
+    } } } } }"""
+
+    def purchases(arguments):
+        loaded.clear()
+        data = execute(query % arguments)
+        (edge,) = data["data"]["users"]["edges"]
+        connection = edge["node"]["purchase"]
+        names = [e["node"]["dishName"] for e in connection["edges"]]
+        return names, connection["edges"], connection["pageInfo"], len(loaded)
+
+    try:
+        names, edges, info, rows = purchases("first: 2")
+        assert names == ["0", "1"] and info["hasNextPage"]
+        assert rows == 3
+
+        names, _, info, rows = purchases(f'first: 2, after: "{edges[-1]["cursor"]}"')
+        assert names == ["2", "3"] and info["hasNextPage"]
+        assert rows == 3
+
+        names, edges, info, rows = purchases("last: 2")
+        assert names == ["48", "49"]
+        assert info["hasPreviousPage"] and not info["hasNextPage"]
+        assert rows == 3
+
+        names, _, _, rows = purchases(f'last: 2, before: "{edges[0]["cursor"]}"')
+        assert names == ["46", "47"]
+        assert rows == 3
+    finally:
+        event.remove(models.PurchaseOrder, "load", record)
+
+
+PAGE_QUERY = """
+    query {
+        %s(%s) {
+            edges { cursor node { name } }
+            pageInfo { hasPreviousPage hasNextPage startCursor endCursor }
+        }
+    }
+"""
+
+
+def page(execute, field, arguments):
+    data = execute(PAGE_QUERY % (field, arguments))
+    connection = data["data"][field]
+    names = [edge["node"]["name"] for edge in connection["edges"]]
+    return names, connection["pageInfo"]
+
+
+@pytest.mark.parametrize("field", ["users", "restaurants"])
+def test_keyset_pagination(db, execute, field):
+    model = models.User if field == "users" else models.Restaurant
+    db.session.add_all(model(name=f"{i}", cash_balance=0) for i in range(10))
+    db.session.commit()
+
+    names, info = page(execute, field, "first: 4")
+    assert names == ["0", "1", "2", "3"]
+    assert not info["hasPreviousPage"] and info["hasNextPage"]
+
+    names, info = page(execute, field, f'first: 4, after: "{info["endCursor"]}"')
+    assert names == ["4", "5", "6", "7"]
+    assert info["hasNextPage"]
+
+    names, info = page(execute, field, f'first: 4, after: "{info["endCursor"]}"')
+    assert names == ["8", "9"]
+    assert not info["hasNextPage"]
+
+    names, info = page(execute, field, "last: 3")
+    assert names == ["7", "8", "9"]
+    assert info["hasPreviousPage"] and not info["hasNextPage"]
+
+    names, info = page(execute, field, f'last: 3, before: "{info["startCursor"]}"')
+    assert names == ["4", "5", "6"]
+    assert info["hasPreviousPage"]
+
+    names, _ = page(execute, field, f'last: 10, before: "{info["startCursor"]}"')
+    assert names == ["0", "1", "2", "3"]
+
+
+@pytest.mark.parametrize("field", ["users", "restaurants"])
+def test_keyset_pagination_limits_rows_in_sql(db, execute, field):
+    model = models.User if field == "users" else models.Restaurant
+    db.session.add_all(model(name=f"{i}", cash_balance=0) for i in range(50))
+    db.session.commit()
+
+    with record_statements(db) as statements:
+        names, _ = page(execute, field, "first: 2")
+    assert names == ["0", "1"]
+    ((statement, parameters),) = statements
+    assert "LIMIT" in statement
+    assert 3 in parameters
+
+
+def test_connections_without_first_or_last_are_paginated(app, db, execute, monkeypatch):
+    monkeypatch.setitem(app.config, "QUERY_DEFAULT_LIST_SIZE", 3)
+    monkeypatch.setitem(app.config, "QUERY_MAX_PAGE_SIZE", 4)
+    seed_nested(db, 5)
+    for field in ("users", "restaurants"):
+        names, info = page(execute, field, "sort: ID_ASC")
+        assert names == [f"{field[:-1].title()} {i}" for i in range(3)]
+        assert info["hasNextPage"]
+
+    db.session.add_all(
+        models.Dish(name=f"Dish {i}", price=i, restaurant_id=1) for i in range(3, 5)
+    )
+    db.session.commit()
+    data = execute(
+        "{ restaurants(first: 1) { edges { node { dishes { edges { node { name } }"
+        " pageInfo { hasNextPage } } } } } }"
+    )
+    (edge,) = data["data"]["restaurants"]["edges"]
+    dishes = edge["node"]["dishes"]
+    assert [d["node"]["name"] for d in dishes["edges"]] == [
+        "Dish 0",
+        "Dish 1",
+        "Dish 2",
+    ]
+    assert dishes["pageInfo"]["hasNextPage"]
+
+    data = execute(PAGE_QUERY % ("users", "first: 5"))
+    assert data["errors"][0]["message"] == "'first' and 'last' cannot exceed 4."
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", base64.b64encode(b"x").decode()])
+def test_keyset_pagination_invalid_cursor(user, execute, cursor):
+    data = execute(PAGE_QUERY % ("users", f'first: 1, after: "{cursor}"'))
+    assert data["errors"][0]["message"] == f"Invalid cursor {cursor!r}."
+
+
+@pytest.mark.parametrize("indexes", [True, False])
+def test_keyset_pagination_of_filtered_restaurants(
+    app, db, execute, monkeypatch, indexes
+):
+    monkeypatch.setitem(app.config, "OPEN_AT_INDEX", indexes)
+    monkeypatch.setitem(app.config, "PRICE_INDEX", indexes)
+    for i in range(6):
+        restaurant = models.Restaurant(name=f"{i}", cash_balance=0)
+        commit(db, restaurant)
+        if i % 2:
+            db.session.add_all(
+                [
+                    models.Schedule(
+                        opens_at=t(9, 0),
+                        closes_at=t(17, 0),
+                        weekday=0,
+                        overnight=False,
+                        restaurant_id=restaurant.id,
+                    ),
+                    models.Dish(name="Dish", price=10, restaurant_id=restaurant.id),
+                ]
+            )
+            db.session.commit()
+
+    filters = [
+        'openAt: "2022-02-14T12:00:00"',
+        "minDishes: 1, minDishPrice: 5, maxDishPrice: 15",
+    ]
+    for arguments in filters:
+        names, info = page(execute, "restaurants", f"{arguments}, first: 2")
+        assert names == ["1", "3"]
+        assert info["hasNextPage"]
+        after = f'after: "{info["endCursor"]}"'
+        names, info = page(execute, "restaurants", f"{arguments}, first: 2, {after}")
+        assert names == ["5"]
+        assert not info["hasNextPage"]
+        names, info = page(execute, "restaurants", f"{arguments}, last: 1")
+        assert names == ["5"]
+        assert info["hasPreviousPage"]
+        names, info = page(execute, "restaurants", f"{arguments}, sort: ID_DESC")
+        assert names == ["5", "3", "1"]
+        after = f'after: "{info["startCursor"]}"'
+        names, _ = page(execute, "restaurants", f"{arguments}, sort: ID_DESC, {after}")
+        assert names == ["3", "1"]
+
+
+@pytest.mark.parametrize("indexes", [True, False])
+def test_restaurants_open_at_and_within_range(app, db, execute, monkeypatch, indexes):
+    monkeypatch.setitem(app.config, "OPEN_AT_INDEX", indexes)
+    monkeypatch.setitem(app.config, "PRICE_INDEX", indexes)
+    # Open on Monday morning if i is even, with i dishes at 10.
+    for i in range(8):
+        restaurant = models.Restaurant(name=f"{i}", cash_balance=0)
+        commit(db, restaurant)
+        opens_at = t(9, 0) if i % 2 == 0 else t(18, 0)
+        db.session.add(
+            models.Schedule(
+                opens_at=opens_at,
+                closes_at=t(23, 0),
+                weekday=0,
+                overnight=False,
+                restaurant_id=restaurant.id,
+            )
+        )
+        db.session.add_all(
+            models.Dish(name="Dish", price=10, restaurant_id=restaurant.id)
+            for _ in range(i)
+        )
+    db.session.commit()
+
+    filters = 'openAt: "2022-02-14T12:00:00", minDishPrice: 5, maxDishPrice: 15'
+    names, _ = page(execute, "restaurants", f"{filters}, minDishes: 3")
+    assert names == ["4", "6"]
+    names, _ = page(execute, "restaurants", f"{filters}, maxDishes: 3")
+    assert names == ["2"]
+
+    # Cached results are paginated in process.
+    monkeypatch.setitem(app.config, "RESULT_CACHE_SIZE", 0)
+    with record_statements(db) as statements:
+        names, info = page(execute, "restaurants", f"{filters}, minDishes: 1, first: 2")
+    assert names == ["2", "4"]
+    assert info["hasNextPage"]
+    if not indexes:
+        # The database intersects the filters and returns a single page.
+        ((statement, parameters),) = statements
+        assert "LIMIT" in statement and 3 in parameters
+
+    data = execute(PAGE_QUERY % ("restaurants", f"{filters}"))
+    assert data["errors"][0]["message"] == "Specify one of 'minDishes' or 'maxDishes'"
+
+
+@pytest.mark.parametrize("price_index", [True, False])
+def test_restaurants_sorted_pagination(app, db, execute, monkeypatch, price_index):
+    monkeypatch.setitem(app.config, "PRICE_INDEX", price_index)
+    for name in ["b", "a", "c", "b", "a"]:
+        restaurant = models.Restaurant(name=name, cash_balance=0)
+        commit(db, restaurant)
+        commit(db, models.Dish(name="Dish", price=1, restaurant_id=restaurant.id))
+    commit(db, models.Restaurant(name="z", cash_balance=0))
+
+    filters = (
+        "minDishes: 1, minDishPrice: 1, maxDishPrice: 2, sort: [NAME_DESC, ID_ASC]"
+    )
+    seen, after = [], ""
+    while True:
+        data = execute(PAGE_QUERY % ("restaurants", f"{filters}, first: 2{after}"))
+        connection = data["data"]["restaurants"]
+        seen += [edge["node"]["name"] for edge in connection["edges"]]
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        after = f', after: "{connection["pageInfo"]["endCursor"]}"'
+    assert seen == ["c", "b", "b", "a", "a"]
+
+    names, info = page(execute, "restaurants", f"{filters}, last: 3")
+    assert names == ["b", "a", "a"]
+    before = f'before: "{info["startCursor"]}"'
+    names, _ = page(execute, "restaurants", f"{filters}, last: 3, {before}")
+    assert names == ["c", "b"]
+
+    # Cursors only apply to the order they were created with.
+    data = execute(PAGE_QUERY % ("restaurants", f"first: 1, {before}"))
+    assert data["errors"][0]["message"].startswith("Invalid cursor")
+
+
+PURCHASE_MANY = """
+    mutation {
+        purchaseMany(input: [%s]) {
+            orders { dishName transactionAmount restaurantName userId restaurantId }
+        }
+    }
+"""
+
+
+def purchase_many_mutation(purchases):
+    items = ", ".join(
+        '{userId: "%s", dishId: "%s"}'
+        % (to_global_id("User", user.id), to_global_id("Dish", dish.id))
+        for user, dish in purchases
+    )
+    return PURCHASE_MANY % items
+
+
+@pytest.fixture
+def cart(db):
+    restaurants = [models.Restaurant(name=f"R{i}", cash_balance=0) for i in range(2)]
+    users = [models.User(name=f"U{i}", cash_balance=10) for i in range(2)]
+    db.session.add_all(restaurants + users)
+    db.session.flush()
+    dishes = [
+        models.Dish(name=f"D{i}", price=i + 1, restaurant_id=restaurants[i % 2].id)
+        for i in range(4)
+    ]
+    db.session.add_all(dishes)
+    db.session.commit()
+    return restaurants, users, dishes
+
+
+def test_purchase_many(db, execute, cart):
+    (r0, r1), (u0, u1), dishes = cart
+    purchases = [(u0, dishes[0]), (u0, dishes[1]), (u0, dishes[3]), (u1, dishes[2])]
+    mutation = purchase_many_mutation(purchases)
+    with record_statements(db) as statements:
+        data = execute(mutation)
+
+    orders = data["data"]["purchaseMany"]["orders"]
+    assert [(o["userId"], o["dishName"]) for o in orders] == [
+        (u0.id, "D0"),
+        (u0.id, "D1"),
+        (u0.id, "D3"),
+        (u1.id, "D2"),
+    ]
+    assert [o["restaurantName"] for o in orders] == ["R0", "R1", "R1", "R0"]
+    assert u0.cash_balance == 10 - 1 - 2 - 4
+    assert u1.cash_balance == 10 - 3
+    assert r0.cash_balance == 1 + 3
+    assert r1.cash_balance == 2 + 4
+    assert models.PurchaseOrder.query.count() == 4
+    # Loading users and dishes, debits, credits and reloading the orders.
+    assert len([s for s, _ in statements if not s.startswith("INSERT")]) == 5
+
+
+def test_purchase_many_is_all_or_nothing(db, execute, cart):
+    (r0, r1), (u0, u1), dishes = cart
+    # u1 can afford each dish, but not all of them.
+    purchases = [(u0, dishes[0]), (u1, dishes[2]), (u1, dishes[3]), (u1, dishes[3])]
+    data = execute(purchase_many_mutation(purchases))
+    assert data["errors"][0]["message"] == (
+        "Purchase not allowed: Not enough cash balance!"
+    )
+    assert [u0.cash_balance, u1.cash_balance] == [10, 10]
+    assert [r0.cash_balance, r1.cash_balance] == [0, 0]
+    assert models.PurchaseOrder.query.count() == 0
+
+    data = execute(purchase_many_mutation([(u0, dishes[0]), (u1, models.Dish(id=42))]))
+    assert data["errors"][0]["message"] == "invalid dish/user id."
+    assert models.PurchaseOrder.query.count() == 0
+
+    data = execute(PURCHASE_MANY % '{userId: "abcd", dishId: "efgh"}')
+    assert data["errors"][0]["message"] == "invalid dish/user id."
+
+
+def test_spending_and_revenue(db, execute, cart):
+    (r0, r1), (u0, u1), dishes = cart
+    execute(purchase_many_mutation([(u0, dishes[0]), (u0, dishes[3]), (u1, dishes[2])]))
+    today = datetime.utcnow().date().isoformat()
+    query = """{
+        users { edges { node { name orderCount totalSpent } } }
+        restaurants {
+            edges { node { name dailyRevenue(since: "%s") { day orderCount revenue } } }
+        }
+    }"""
+    with record_statements(db) as statements:
+        data = execute(query % today)
+
+    users = [edge["node"] for edge in data["data"]["users"]["edges"]]
+    assert users == [
+        {"name": "U0", "orderCount": 2, "totalSpent": 5.0},
+        {"name": "U1", "orderCount": 1, "totalSpent": 3.0},
+    ]
+    restaurants = [edge["node"] for edge in data["data"]["restaurants"]["edges"]]
+    assert restaurants == [
+        {
+            "name": "R0",
+            "dailyRevenue": [{"day": today, "orderCount": 2, "revenue": 4.0}],
+        },
+        {
+            "name": "R1",
+            "dailyRevenue": [{"day": today, "orderCount": 1, "revenue": 4.0}],
+        },
+    ]
+    # Users and their totals, restaurants and their daily totals.
+    assert len(statements) == 4
+
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).date().isoformat()
+    data = execute(query % tomorrow)
+    restaurants = [edge["node"] for edge in data["data"]["restaurants"]["edges"]]
+    assert [r["dailyRevenue"] for r in restaurants] == [[], []]
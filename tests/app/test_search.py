@@ -0,0 +1,253 @@
+import json
+
+import pytest
+from elasticsearch import Elasticsearch
+
+from app import reindex, search
+from app.load import add_restaurants
+from app.models import Dish, PurchaseOrder, Restaurant, User
+from tests.utils import InMemoryElasticsearchNode, commit, record_statements
+
+
+@pytest.fixture
+def index(db):
+    backend = search.backend()
+    backend.indexes.clear()
+    return backend
+
+
+@pytest.fixture
+def elasticsearch(app, db, monkeypatch):
+    InMemoryElasticsearchNode.reset()
+    client = Elasticsearch(
+        "http://localhost:9200", node_class=InMemoryElasticsearchNode
+    )
+    monkeypatch.setattr(app, "elasticsearch", client)
+    monkeypatch.setitem(app.config, "SEARCH_BACKEND", "elasticsearch")
+    monkeypatch.setitem(search.BACKENDS, "elasticsearch", search.ElasticsearchBackend())
+    return InMemoryElasticsearchNode
+
+
+def names(instances):
+    return [instance.name for instance in instances]
+
+
+def test_results_are_ranked(db, index, restaurant):
+    for name in ["Fried Rice", "Egg Curry", "Egg Fried Rice with Egg", "Curry"]:
+        db.session.add(Dish(name=name, price=1, restaurant_id=restaurant.id))
+    db.session.commit()
+
+    # Matches in shorter names weigh more.
+    assert names(Dish.search("name", "egg")) == [
+        "Egg Curry",
+        "Egg Fried Rice with Egg",
+    ]
+    assert names(Dish.search("name", "EGG curry")) == [
+        "Egg Curry",
+        "Curry",
+        "Egg Fried Rice with Egg",
+    ]
+    assert names(Dish.search("name", "EGG curry", limit=1, offset=1)) == ["Curry"]
+    assert Dish.search("name", "pizza") == []
+    with pytest.raises(ValueError, match="Dish.price is not searchable."):
+        Dish.search("price", "1")
+
+
+def test_index_is_synced_on_commit(db, index, restaurant):
+    assert Restaurant.search("name", "palace") == []
+
+    palace = Restaurant(name="Egg Palace", cash_balance=0)
+    commit(db, palace)
+    assert Restaurant.search("name", "palace") == [palace]
+
+    palace.name = "Egg House"
+    db.session.add(palace)
+    db.session.flush()
+    assert Restaurant.search("name", "house") == []
+    db.session.commit()
+    assert Restaurant.search("name", "house") == [palace]
+    assert Restaurant.search("name", "palace") == []
+
+    db.session.delete(palace)
+    db.session.rollback()
+    assert Restaurant.search("name", "house") == [palace]
+    db.session.delete(palace)
+    db.session.commit()
+    assert Restaurant.search("name", "house") == []
+
+
+def test_index_is_not_rebuilt_by_purchases(db, index, restaurant, user):
+    user.cash_balance = 10
+    dish = Dish(name="Egg Curry", price=1, restaurant_id=restaurant.id)
+    commit(db, dish)
+    assert Restaurant.search("name", "test") == [restaurant]
+
+    PurchaseOrder.create_for(user, dish)
+    with record_statements(db) as statements:
+        assert Restaurant.search("name", "test") == [restaurant]
+    # Only loading the results, without rebuilding the index.
+    assert len(statements) == 1
+
+
+def test_index_is_rebuilt_after_bulk_writes(db, index):
+    assert Restaurant.search("name", "palace") == []
+    add_restaurants(
+        [
+            {
+                "restaurantName": "Egg Palace",
+                "cashBalance": 0,
+                "menu": [{"dishName": "Egg Curry", "price": 1}],
+                "openingHours": "Mon 9 am - 5 pm",
+            }
+        ]
+    )
+    assert names(Restaurant.search("name", "palace")) == ["Egg Palace"]
+    assert names(Dish.search("name", "curry")) == ["Egg Curry"]
+
+
+def test_index_is_rebuilt_after_bulk_updates_of_names(db, index, restaurant):
+    assert Restaurant.search("name", "test") == [restaurant]
+    table = Restaurant.__table__
+    db.session.execute(
+        table.update().where(table.c.id == restaurant.id).values(name="Egg Palace")
+    )
+    db.session.commit()
+    assert names(Restaurant.search("name", "palace")) == ["Egg Palace"]
+
+    db.session.execute(
+        table.update().where(table.c.id == db.bindparam("restaurant_id")),
+        [{"restaurant_id": restaurant.id, "name": "Egg House"}],
+    )
+    db.session.commit()
+    assert names(Restaurant.search("name", "house")) == ["Egg House"]
+
+
+def test_search_arguments(db, index):
+    with pytest.raises(ValueError, match="'limit' must be between 0 and 100."):
+        Restaurant.search("name", "egg", limit=101)
+    with pytest.raises(ValueError, match="'offset' must be between 0 and 1000."):
+        Restaurant.search("name", "egg", offset=-1)
+
+
+def test_search_query(app, db, index, restaurant):
+    restaurant.name = "Egg Palace"
+    commit(db, restaurant)
+    commit(db, Dish(name="Egg Curry", price=1, restaurant_id=restaurant.id))
+    commit(db, Dish(name="Boiled Egg", price=1, restaurant_id=restaurant.id))
+
+    query = """
+        query {
+            search(q: "%s", limit: %d) {
+                __typename
+                ... on Restaurant { name }
+                ... on Dish { name }
+            }
+        }
+    """
+    client = app.test_client()
+    data = json.loads(client.post("/graphql", data={"query": query % ("egg", 2)}).data)
+    assert data["data"]["search"] == [
+        {"__typename": "Restaurant", "name": "Egg Palace"},
+        {"__typename": "Dish", "name": "Egg Curry"},
+    ]
+    data = json.loads(client.post("/graphql", data={"query": query % ("", 2)}).data)
+    assert data["data"]["search"] == []
+
+
+def test_reindex(app, db, elasticsearch):
+    add_restaurants(
+        [
+            {
+                "restaurantName": f"Palace {i}",
+                "cashBalance": 0,
+                "menu": [{"dishName": f"Egg Curry {i}", "price": 1}],
+                "openingHours": "Mon 9 am - 5 pm",
+            }
+            for i in range(5)
+        ]
+    )
+    # Bulk loads are reindexed in the background.
+    search.backend().flush()
+    assert elasticsearch.documents("dish")["1"] == {"name": "Egg Curry 0"}
+    indices = set(elasticsearch.indices)
+
+    elasticsearch.bulk_sizes.clear()
+    runner = app.test_cli_runner()
+    result = runner.invoke(reindex, ["--chunk-size", "2", "--threads", "2"])
+    assert "Indexed 5 restaurant documents." in result.output
+    assert "Indexed 5 dish documents." in result.output
+    assert elasticsearch.bulk_sizes == [2, 2, 1, 2, 2, 1]
+    # The aliases were switched to new indexes, and the previous ones deleted.
+    assert set(elasticsearch.aliases) == {"restaurant", "dish"}
+    assert not indices & set(elasticsearch.indices)
+    assert set(elasticsearch.aliases.values()) == set(elasticsearch.indices)
+    assert elasticsearch.documents("dish")["1"] == {"name": "Egg Curry 0"}
+    assert names(Restaurant.search("name", "palace 3")) == [
+        "Palace 3",
+        "Palace 0",
+        "Palace 1",
+        "Palace 2",
+        "Palace 4",
+    ]
+    assert names(Dish.search("name", "curry", limit=2, offset=1)) == [
+        "Egg Curry 1",
+        "Egg Curry 2",
+    ]
+
+
+def test_reindex_requires_elasticsearch(app, db):
+    result = app.test_cli_runner().invoke(reindex)
+    assert result.exit_code != 0
+    assert "ELASTICSEARCH_URL is not set." in result.output
+
+
+def test_elasticsearch_is_synced_in_bulk_on_commit(db, restaurant, user, elasticsearch):
+    db.session.add_all(
+        [Dish(name=f"Dish {i}", price=1, restaurant_id=restaurant.id) for i in range(3)]
+    )
+    db.session.commit()
+    search.backend().flush()
+    # A single request for all the documents of the commit.
+    assert elasticsearch.bulk_sizes == [3]
+    assert names(Dish.search("name", "dish", limit=5)) == ["Dish 0", "Dish 1", "Dish 2"]
+
+    dish = Dish.query.filter_by(name="Dish 1").one()
+    dish.name = "Egg Curry"
+    db.session.commit()
+    search.backend().flush()
+    assert names(Dish.search("name", "curry")) == ["Egg Curry"]
+    assert names(Dish.search("name", "dish")) == ["Dish 0", "Dish 2"]
+
+    user.cash_balance = 10
+    commit(db, user)
+    PurchaseOrder.create_for(user, dish)
+    db.session.delete(dish)
+    db.session.rollback()
+    search.backend().flush()
+    assert elasticsearch.bulk_sizes == [3, 1]
+
+    db.session.delete(Dish.query.filter_by(name="Dish 0").one())
+    db.session.commit()
+    search.backend().flush()
+    assert elasticsearch.bulk_sizes == [3, 1, 1]
+    assert names(Dish.search("name", "dish")) == ["Dish 2"]
+
+    # Indexes created by the sync are replaced by the first reindex.
+    assert set(elasticsearch.indices) == {"dish"}
+    search.backend().reindex([Dish], 10, 1)
+    assert elasticsearch.aliases["dish"] in elasticsearch.indices
+    assert "dish" not in elasticsearch.indices
+    assert names(Dish.search("name", "dish")) == ["Dish 2"]
+
+
+def test_elasticsearch_outages_do_not_fail_commits(db, restaurant, elasticsearch):
+    elasticsearch.unavailable = True
+    commit(db, Dish(name="Egg Curry", price=1, restaurant_id=restaurant.id))
+    search.backend().flush()
+    assert elasticsearch.bulk_sizes == []
+
+    # The documents were queued again.
+    elasticsearch.unavailable = False
+    search.backend().flush()
+    assert elasticsearch.bulk_sizes == [1]
+    assert names(Dish.search("name", "curry")) == ["Egg Curry"]
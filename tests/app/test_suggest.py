@@ -0,0 +1,165 @@
+import json
+
+import pytest
+
+from app import suggest
+from app.load import add_restaurants
+from app.models import Dish, Restaurant
+from app.suggest import Suggestions, prefix_distance
+from tests.utils import commit, record_statements
+
+NAMES = [
+    "Egg Curry",
+    "Egg Curry",
+    "Egg Fried Rice",
+    "Chicken Curry",
+    "Curried Eggs",
+    "Chicken Tikka",
+    "Chicken Tikka",
+    "Chicken Tikka",
+]
+
+
+@pytest.fixture
+def suggestions():
+    return Suggestions.build((Dish, i, name) for i, name in enumerate(NAMES, 1))
+
+
+@pytest.fixture
+def suggester(app, db):
+    suggest.suggester.data = None
+    suggest.suggester.built_at = None
+    return suggest.suggester
+
+
+def test_prefix_distance():
+    assert prefix_distance("chicken", "chicken tikka", 1) == 0
+    assert prefix_distance("chiken", "chicken", 1) == 1
+    assert prefix_distance("chikcen", "chicken", 2) == 2
+    assert prefix_distance("chikcen", "chicken", 1) == 2
+    assert prefix_distance("curry", "chicken", 2) == 3
+
+
+def test_suggestions_are_ranked(suggestions):
+    # The most common names first, then the shortest ones.
+    assert suggestions.suggest("c", 10) == [
+        "Chicken Tikka",
+        "Egg Curry",
+        "Curried Eggs",
+        "Chicken Curry",
+    ]
+    assert suggestions.suggest("egg", 2) == ["Egg Curry", "Curried Eggs"]
+    assert suggestions.suggest("EGG cu", 10) == ["Egg Curry", "Curried Eggs"]
+    assert suggestions.suggest("curry chick", 10) == ["Chicken Curry"]
+    assert suggestions.suggest("eggs fried", 10) == []
+    assert suggestions.suggest("  ", 10) == []
+    assert suggestions.suggest("c", 0) == []
+
+
+def test_suggestions_with_typos(suggestions):
+    assert suggestions.suggest("chiken", 10) == ["Chicken Tikka", "Chicken Curry"]
+    assert suggestions.suggest("chiken cur", 10) == ["Chicken Curry"]
+    assert suggestions.suggest("egg curyr", 10) == ["Egg Curry", "Curried Eggs"]
+    # Typos are not looked for in the first letter, nor in short words.
+    assert suggestions.suggest("xhicken", 10) == []
+    assert suggestions.suggest("egg cury", 10) == []
+
+
+def test_suggestions_update(suggestions):
+    suggestions.update(Dish, {1: {"name": "Egg Masala"}, 2: None})
+    # New names come last, until the index is rebuilt.
+    assert suggestions.suggest("egg", 10) == [
+        "Curried Eggs",
+        "Egg Fried Rice",
+        "Egg Masala",
+    ]
+    suggestions.update(Restaurant, {1: {"name": "Egg Curry House"}})
+    assert suggestions.suggest("egg cu", 10) == ["Curried Eggs", "Egg Curry House"]
+    assert suggestions.suggest("mas", 10) == ["Egg Masala"]
+
+
+def test_many_suggestions_for_short_prefixes():
+    names = [f"Dish {i}" for i in range(2 * suggest.HEAD_SIZE)]
+    suggestions = Suggestions.build((Dish, i, name) for i, name in enumerate(names))
+    assert len(suggestions.heads["d"]) == suggest.HEAD_SIZE
+    assert suggestions.suggest("d", 3) == ["Dish 0", "Dish 1", "Dish 2"]
+    # Names past the best ones of a prefix are merged from its words.
+    suggestions.update(Dish, {i: None for i in range(suggest.HEAD_SIZE - 1)})
+    assert suggestions.suggest("d", 3) == ["Dish 49", "Dish 50", "Dish 51"]
+
+
+def test_suggester_is_synced_on_commit(db, suggester, restaurant):
+    for name in ["Egg Curry", "Egg Fried Rice"]:
+        db.session.add(Dish(name=name, price=1, restaurant_id=restaurant.id))
+    db.session.commit()
+    assert suggester.suggest("egg", 10) == ["Egg Curry", "Egg Fried Rice"]
+
+    dish = Dish(name="Egg Masala", price=1, restaurant_id=restaurant.id)
+    commit(db, dish)
+    restaurant.name = "Egg House"
+    commit(db, restaurant)
+    assert suggester.suggest("egg m", 10) == ["Egg Masala"]
+    db.session.delete(dish)
+    db.session.commit()
+    # Without rebuilding the index.
+    with record_statements(db) as statements:
+        assert suggester.suggest("egg", 10) == [
+            "Egg Curry",
+            "Egg Fried Rice",
+            "Egg House",
+        ]
+        assert suggester.suggest("egg m", 10) == []
+    assert statements == []
+
+    with pytest.raises(ValueError, match="'limit' must be between 0 and 50."):
+        suggester.suggest("egg", 51)
+
+
+def test_suggester_is_rebuilt_after_bulk_writes(db, suggester):
+    assert suggester.suggest("palace", 10) == []
+    add_restaurants(
+        [
+            {
+                "restaurantName": "Egg Palace",
+                "cashBalance": 0,
+                "menu": [{"dishName": "Egg Curry", "price": 1}],
+                "openingHours": "Mon 9 am - 5 pm",
+            }
+        ]
+    )
+    assert suggester.suggest("egg", 10) == ["Egg Curry", "Egg Palace"]
+
+
+def test_suggester_replays_commits_made_while_building(db, suggester, restaurant):
+    def build(rows):
+        rows = list(rows)
+        # A commit made while the index is built from the database.
+        commit(db, Dish(name="Egg Curry", price=1, restaurant_id=restaurant.id))
+        return build_suggestions(rows)
+
+    build_suggestions = Suggestions.build
+    Suggestions.build = build
+    try:
+        suggester.refresh()
+    finally:
+        Suggestions.build = build_suggestions
+    assert suggester.suggest("egg", 10) == ["Egg Curry"]
+
+
+def test_suggest_query(app, db, suggester, restaurant):
+    commit(db, Dish(name="Egg Curry", price=1, restaurant_id=restaurant.id))
+    query = '{ suggest(prefix: "%s", limit: %d) }'
+    client = app.test_client()
+    data = json.loads(
+        client.post("/graphql", data={"query": query % ("egg c", 5)}).data
+    )
+    assert data["data"]["suggest"] == ["Egg Curry"]
+    data = json.loads(client.post("/graphql", data={"query": query % ("te", 5)}).data)
+    assert data["data"]["suggest"] == ["test"]
+    data = json.loads(client.post("/graphql", data={"query": query % ("te", 99)}).data)
+    assert data["errors"][0]["message"] == "'limit' must be between 0 and 50."
+
+
+def test_suggester_waits_for_warm_up(db, suggester, restaurant):
+    suggester.warm_up()
+    assert suggester.suggest("te", 10) == ["test"]
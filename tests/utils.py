@@ -1,3 +1,154 @@
+import json
+import threading
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+from elastic_transport import ApiResponseMeta, BaseNode
+from elastic_transport import ConnectionError as TransportConnectionError
+from elastic_transport import HttpHeaders
+from elastic_transport._node import NodeApiResponse
+from sqlalchemy import event
+
+from app.search import tokenize
+
+
 def commit(db, o):
     db.session.add(o)
     db.session.commit()
+
+
+@contextmanager
+def record_statements(db):
+    """Record the `(statement, parameters)` sent to the database."""
+    statements = []
+
+    def record(_conn, _cursor, statement, parameters, _context, _executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+
+class InMemoryElasticsearchNode(BaseNode):
+    """An in-process stand-in for an Elasticsearch node, answering the few
+    APIs used by `app.search`. Pass it as the `node_class` of a client.
+
+    Documents are kept in `indices`, `{index: {id: source}}`, the index of
+    each alias in `aliases`, and the number of documents of each bulk request
+    in `bulk_sizes`. Requests fail while `unavailable` is set.
+    """
+
+    lock = threading.Lock()
+    indices = {}
+    aliases = {}
+    bulk_sizes = []
+    unavailable = False
+
+    @classmethod
+    def reset(cls):
+        cls.indices.clear()
+        cls.aliases.clear()
+        cls.bulk_sizes.clear()
+        cls.unavailable = False
+
+    @classmethod
+    def documents(cls, name):
+        """Return the documents of the index or alias `name`."""
+        return cls.indices[cls.aliases.get(name, name)]
+
+    def perform_request(self, method, target, body=None, headers=None, **_kw):
+        if self.unavailable:
+            raise TransportConnectionError("Elasticsearch is unavailable.")
+        url = urlsplit(target)
+        path = url.path.strip("/").split("/")
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        with self.lock:
+            if path == ["_aliases"]:
+                status, response = self.update_aliases(json.loads(body)["actions"])
+            elif path[0] == "_alias":
+                indices = [i for alias, i in self.aliases.items() if alias == path[1]]
+                if indices:
+                    status = 200
+                    response = {i: {"aliases": {path[1]: {}}} for i in indices}
+                else:
+                    status, response = 404, {"error": "alias missing", "status": 404}
+            elif method == "HEAD":
+                status, response = (200 if path[0] in self.indices else 404), {}
+            elif path == ["_bulk"]:
+                status, response = self.bulk(body.decode().splitlines())
+            elif len(path) == 2 and path[1] == "_search":
+                status, response = self.search(path[0], json.loads(body), params)
+            elif len(path) == 2 and path[1] == "_refresh":
+                status, response = 200, {"_shards": {"failed": 0}}
+            elif method == "PUT":
+                self.indices[path[0]] = {}
+                status, response = 200, {"acknowledged": True, "index": path[0]}
+            elif method == "DELETE":
+                for index in path[0].split(","):
+                    self.indices.pop(index, None)
+                status, response = 200, {"acknowledged": True}
+            else:
+                raise NotImplementedError(f"{method} {target}")
+        meta = ApiResponseMeta(
+            status=status,
+            http_version="1.1",
+            headers=HttpHeaders(
+                {
+                    "content-type": "application/json",
+                    "x-elastic-product": "Elasticsearch",
+                }
+            ),
+            duration=0.0,
+            node=self.config,
+        )
+        return NodeApiResponse(meta, json.dumps(response).encode())
+
+    def bulk(self, lines):
+        items = []
+        lines = iter(lines)
+        for line in lines:
+            ((operation, action),) = json.loads(line).items()
+            index = self.aliases.get(action["_index"], action["_index"])
+            documents = self.indices.setdefault(index, {})
+            action["_id"] = str(action["_id"])
+            if operation == "delete":
+                found = documents.pop(action["_id"], None) is not None
+                action["status"] = 200 if found else 404
+            else:
+                documents[action["_id"]] = json.loads(next(lines))
+                action["status"] = 201
+            items.append({operation: action})
+        self.bulk_sizes.append(len(items))
+        errors = any(item[op]["status"] >= 300 for item in items for op in item)
+        return 200, {"errors": errors, "items": items}
+
+    def update_aliases(self, actions):
+        for action in actions:
+            ((operation, arguments),) = action.items()
+            if operation == "add":
+                self.aliases[arguments["alias"]] = arguments["index"]
+            elif operation == "remove":
+                if self.aliases.get(arguments["alias"]) == arguments["index"]:
+                    del self.aliases[arguments["alias"]]
+            else:
+                del self.indices[arguments["index"]]
+        return 200, {"acknowledged": True}
+
+    def search(self, index, body, params):
+        index = self.aliases.get(index, index)
+        if index not in self.indices:
+            if params.get("ignore_unavailable") == "true":
+                return 200, {"hits": {"hits": []}}
+            return 404, {"error": {"type": "index_not_found_exception"}, "status": 404}
+        ((field, q),) = body["query"]["match"].items()
+        terms = set(tokenize(q))
+        hits = []
+        for id_, source in self.indices[index].items():
+            score = sum(1 for token in tokenize(source.get(field)) if token in terms)
+            if score:
+                hits.append({"_index": index, "_id": id_, "_score": float(score)})
+        hits.sort(key=lambda hit: (-hit["_score"], int(hit["_id"])))
+        return 200, {"hits": {"hits": hits[: body.get("size", 10)]}}